@@ -1,13 +1,15 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from django.db.models import Q, Avg
+from django.db.models import F, Q, Avg
 from django.utils import timezone
+from django.utils.html import format_html, format_html_join
 from datetime import timedelta
 from .models import (
-    Cinema, Hall, Genre, Person, Movie, MovieGenre,
-    MoviePerson, Screening, Ticket, Review, UserFavorite
+    Cinema, Hall, HallHeatmap, Genre, Person, Movie, MovieGenre,
+    MoviePerson, Screening, ScreeningForecast, Ticket, Review, UserFavorite
 )
+from .heatmaps import load_matrices
 from import_export.admin import ImportExportModelAdmin, ImportExportMixin
 from import_export import resources, fields
 from simple_history.admin import SimpleHistoryAdmin
@@ -139,7 +141,7 @@ class HallAdmin(SimpleHistoryAdmin, ImportExportModelAdmin):
     list_filter = ('hall_type', 'cinema__city', 'created_at')
     search_fields = ('name', 'cinema__name')
     raw_id_fields = ('cinema',)
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'seat_heatmap')
     list_display_links = ('name',)
     inlines = [ScreeningInline]
     date_hierarchy = 'created_at'
@@ -148,6 +150,26 @@ class HallAdmin(SimpleHistoryAdmin, ImportExportModelAdmin):
     def capacity(self, obj):
         return obj.total_rows * obj.total_seats_per_row
 
+    @admin.display(description='Популярность мест')
+    def seat_heatmap(self, obj):
+        """Покупки по местам (команда refresh_heatmaps): чем темнее ячейка, тем чаще место покупают"""
+        heatmap = HallHeatmap.objects.filter(hall=obj).first() if obj.pk else None
+        if heatmap is None:
+            return 'Карта еще не построена (python manage.py refresh_heatmaps)'
+        purchases = load_matrices(heatmap)['purchases']
+        peak = max(int(purchases.max()), 1)
+        rows = format_html_join(
+            '', '<tr><th>{}</th>{}</tr>',
+            (
+                (number, format_html_join(
+                    '', '<td title="{}" style="background: rgba(200, 30, 30, {}); padding: 2px 6px;">{}</td>',
+                    ((f'Ряд {number}, место {seat}', f'{count / peak:.2f}', count) for seat, count in enumerate(row, 1))
+                ))
+                for number, row in enumerate(purchases.tolist(), 1)
+            )
+        )
+        return format_html('<table>{}</table>', rows)
+
 
 @admin.register(Genre)
 class GenreAdmin(ImportExportModelAdmin):
@@ -221,6 +243,41 @@ class ScreeningAdmin(SimpleHistoryAdmin, ImportExportModelAdmin):
         return f'{hours}ч {minutes}мин'
 
 
+@admin.register(ScreeningForecast)
+class ScreeningForecastAdmin(admin.ModelAdmin):
+    """Отчет о распродаже сеансов: сначала те, что распродадутся раньше (команда forecast_sellouts)"""
+    list_display = (
+        'screening', 'cinema', 'start_time', 'current_percent', 'forecast_percent',
+        'sell_out_at', 'samples', 'basis'
+    )
+    list_filter = (('sell_out_at', admin.EmptyFieldListFilter), 'screening__hall__cinema__city', 'screening__hall__hall_type')
+    search_fields = ('screening__movie__title', 'screening__hall__cinema__name')
+    list_select_related = ('screening__movie', 'screening__hall__cinema')
+    ordering = (F('sell_out_at').asc(nulls_last=True), '-forecast_occupancy')
+
+    @admin.display(description='Кинотеатр', ordering='screening__hall__cinema__name')
+    def cinema(self, obj):
+        return f'{obj.screening.hall.cinema.name}, {obj.screening.hall.name}'
+
+    @admin.display(description='Начало', ordering='screening__start_time')
+    def start_time(self, obj):
+        return obj.screening.start_time
+
+    @admin.display(description='Заполнено сейчас', ordering='current_occupancy')
+    def current_percent(self, obj):
+        return f'{obj.current_occupancy:.0%}'
+
+    @admin.display(description='Прогноз', ordering='forecast_occupancy')
+    def forecast_percent(self, obj):
+        return f'{obj.forecast_occupancy:.0%}'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Ticket)
 class TicketAdmin(SimpleHistoryAdmin, ImportExportMixin, admin.ModelAdmin):
     resource_class = TicketResource
@@ -0,0 +1,168 @@
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DailySchedule, Screening
+
+
+# Одна пересборка афиши (город, дата) за раз; остальные запросы отдают прежний документ
+REBUILD_LOCK = 'cinema:afisha:rebuild:{}:{}'
+REBUILD_LOCK_TIMEOUT = 60
+
+
+def day_bounds(date):
+    """Начало и конец дня в текущем часовом поясе"""
+    start = timezone.make_aware(datetime.combine(date, time.min))
+    return start, start + timedelta(days=1)
+
+
+def schedule_keys(screenings):
+    """Множество (город, дата) афиш, в которые попадают сеансы queryset"""
+    return {
+        (city, timezone.localdate(start_time))
+        for city, start_time in screenings.values_list('hall__cinema__city', 'start_time')
+    }
+
+
+def mark_changed(keys):
+    """Отметить афиши устаревшими: пересоберутся при следующем чтении"""
+    keys = set(keys)
+    if not keys:
+        return 0
+    condition = Q()
+    for city, date in keys:
+        condition |= Q(city=city, date=date)
+    return DailySchedule.objects.filter(condition).update(changed_at=timezone.now())
+
+
+def build_document(city, date):
+    """Собрать афишу одним запросом: фильмы, в них кинотеатры, залы и сеансы"""
+    start, end = day_bounds(date)
+    screenings = (
+        Screening.objects
+        .filter(
+            is_active=True,
+            movie__is_active=True,
+            hall__cinema__is_active=True,
+            hall__cinema__city=city,
+            start_time__gte=start,
+            start_time__lt=end,
+        )
+        .select_related('movie', 'hall__cinema')
+        .order_by('movie__title', 'hall__cinema__name', 'hall__name', 'start_time')
+    )
+
+    movies = {}
+    for screening in screenings:
+        movie, hall = screening.movie, screening.hall
+        cinema = hall.cinema
+        movie_entry = movies.setdefault(movie.pk, {
+            'id': movie.pk,
+            'title': movie.title,
+            'original_title': movie.original_title,
+            'age_rating': movie.age_rating,
+            'duration_minutes': movie.duration_minutes,
+            'poster_url': movie.poster_url,
+            'min_price': None,
+            'cinemas': {},
+        })
+        cinema_entry = movie_entry['cinemas'].setdefault(cinema.pk, {
+            'id': cinema.pk,
+            'name': cinema.name,
+            'address': cinema.address,
+            'halls': {},
+        })
+        hall_entry = cinema_entry['halls'].setdefault(hall.pk, {
+            'id': hall.pk,
+            'name': hall.name,
+            'hall_type': hall.hall_type,
+            'screenings': [],
+        })
+        hall_entry['screenings'].append({
+            'id': screening.pk,
+            'start_time': screening.start_time.isoformat(),
+            'end_time': screening.end_time.isoformat(),
+            'format': screening.format,
+            'language': screening.language,
+            'has_subtitles': screening.has_subtitles,
+            'base_price': str(screening.base_price),
+            'seats_free': screening.seats_free,
+            'seats_sold': screening.seats_sold,
+        })
+        if movie_entry['min_price'] is None or screening.base_price < movie_entry['min_price']:
+            movie_entry['min_price'] = screening.base_price
+
+    for movie_entry in movies.values():
+        movie_entry['min_price'] = str(movie_entry['min_price'])
+        movie_entry['cinemas'] = list(movie_entry['cinemas'].values())
+        for cinema_entry in movie_entry['cinemas']:
+            cinema_entry['halls'] = list(cinema_entry['halls'].values())
+
+    return {'city': city, 'date': date.isoformat(), 'movies': list(movies.values())}
+
+
+def rebuild_schedule(city, date):
+    """Пересобрать афишу (город, дата) и сохранить ее"""
+    # Время фиксируется до чтения: изменение во время сборки оставит афишу устаревшей
+    built_at = timezone.now()
+    document = build_document(city, date)
+    schedule, created = DailySchedule.objects.get_or_create(
+        city=city,
+        date=date,
+        defaults={'document': document, 'built_at': built_at, 'changed_at': built_at}
+    )
+    if not created:
+        schedule.document = document
+        schedule.built_at = built_at
+        schedule.save(update_fields=['document', 'built_at'])
+    return schedule
+
+
+def get_schedule(city, date):
+    """
+    Афиша из хранилища одним чтением; отсутствующая или устаревшая собирается
+    заново. Пересборку (город, дата) выполняет один запрос: пока она идет,
+    остальные отдают прежний документ, а если его еще нет - собирают документ
+    без сохранения.
+    """
+    schedule = DailySchedule.objects.filter(city=city, date=date).first()
+    if schedule is not None and not schedule.is_stale:
+        return schedule
+
+    lock = REBUILD_LOCK.format(city, date.isoformat())
+    if cache.add(lock, True, REBUILD_LOCK_TIMEOUT):
+        try:
+            return rebuild_schedule(city, date)
+        finally:
+            cache.delete(lock)
+    if schedule is None:
+        schedule = DailySchedule(city=city, date=date, document=build_document(city, date))
+    return schedule
+
+
+def live_seats(city, date):
+    """Текущие счетчики мест сеансов дня одним запросом по индексу времени начала: {id: (свободно, продано)}"""
+    start, end = day_bounds(date)
+    rows = Screening.objects.filter(
+        is_active=True, hall__cinema__city=city, start_time__gte=start, start_time__lt=end
+    ).values_list('pk', 'seats_free', 'seats_sold')
+    return {pk: (seats_free, seats_sold) for pk, seats_free, seats_sold in rows}
+
+
+def schedule_document(city, date):
+    """
+    Афиша для ответа. Продажа мест не делает документ устаревшим: свободные
+    и проданные места берутся из счетчиков сеансов вторым запросом при чтении.
+    """
+    document = get_schedule(city, date).document
+    seats = live_seats(city, date)
+    for movie in document['movies']:
+        for cinema in movie['cinemas']:
+            for hall in cinema['halls']:
+                for screening in hall['screenings']:
+                    screening['seats_free'], screening['seats_sold'] = seats.get(
+                        screening['id'], (screening['seats_free'], screening['seats_sold'])
+                    )
+    return document
@@ -0,0 +1,177 @@
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from simple_history.utils import bulk_create_with_history
+
+from .events import notify_seat_changes
+from .models import SeatHold, Ticket
+from .pricing import price_table
+from .seatmap import ACTIVE_TICKET_STATUSES, apply_seat_changes
+
+
+class SeatUnavailable(Exception):
+    """Одно или несколько мест уже заняты или удерживаются другим пользователем"""
+
+    def __init__(self, seats):
+        self.seats = sorted(seats)
+        super().__init__(f'Места недоступны: {self.seats}')
+
+
+def hold_ttl():
+    """Время удержания места (настройка CINEMA_SEAT_HOLD_TTL, в секундах)"""
+    return timedelta(seconds=getattr(settings, 'CINEMA_SEAT_HOLD_TTL', 600))
+
+
+def seats_q(seats):
+    """Q-условие на набор мест [(ряд, место), ...]"""
+    return reduce(or_, (Q(seat_row=row, seat_number=seat) for row, seat in seats))
+
+
+def occupied_seats(screening, seats):
+    """Места из набора, занятые билетами (один запрос)"""
+    return set(Ticket.objects.filter(
+        seats_q(seats),
+        screening=screening,
+        status__in=ACTIVE_TICKET_STATUSES
+    ).values_list('seat_row', 'seat_number'))
+
+
+def held_by_others(screening, user, seats, now=None):
+    """Места из набора, удерживаемые другими пользователями"""
+    now = now or timezone.now()
+    return set(SeatHold.objects.filter(
+        seats_q(seats),
+        screening=screening,
+        expires_at__gt=now
+    ).exclude(user=user).values_list('seat_row', 'seat_number'))
+
+
+def place_holds(screening, user, seats):
+    """
+    Атомарно удержать места за пользователем на hold_ttl().
+    Истекшие удержания не блокируют места: они удаляются в той же транзакции.
+    Повторное удержание своих мест продлевает его.
+    """
+    seats = sorted(set(seats))
+    now = timezone.now()
+    expires_at = now + hold_ttl()
+
+    try:
+        with transaction.atomic():
+            # Первым выполняется запись, чтобы SQLite сразу взял блокировку на запись
+            SeatHold.objects.filter(seats_q(seats), screening=screening).filter(
+                Q(expires_at__lte=now) | Q(user=user)
+            ).delete()
+
+            taken = occupied_seats(screening, seats)
+            if taken:
+                raise SeatUnavailable(taken)
+
+            SeatHold.objects.bulk_create([
+                SeatHold(
+                    screening=screening, user=user,
+                    seat_row=row, seat_number=seat,
+                    expires_at=expires_at
+                )
+                for row, seat in seats
+            ])
+    except IntegrityError:
+        # Место успели удержать параллельно
+        raise SeatUnavailable(held_by_others(screening, user, seats) or seats)
+
+    notify_seat_changes(screening.pk)
+    return expires_at
+
+
+def release_holds(screening, user, seats=None):
+    """Снять удержания пользователя (все или указанные места)"""
+    holds = SeatHold.objects.filter(screening=screening, user=user)
+    if seats:
+        holds = holds.filter(seats_q(seats))
+    released = list(holds.values_list('seat_row', 'seat_number'))
+    holds.delete()
+    if released:
+        notify_seat_changes(screening.pk)
+    return len(released)
+
+
+def confirm_holds(screening, user, seats=None, ticket_type='adult'):
+    """
+    Превратить действующие удержания пользователя в оплаченные билеты.
+    Если указаны места, удерживаться должны все они.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            SeatHold.objects.filter(screening=screening, user=user, expires_at__lte=now).delete()
+
+            holds = SeatHold.objects.filter(screening=screening, user=user)
+            if seats:
+                holds = holds.filter(seats_q(seats))
+            held = set(holds.values_list('seat_row', 'seat_number'))
+
+            missing = set(seats or ()) - held
+            if missing or not held:
+                raise SeatUnavailable(missing)
+
+            tickets = create_tickets(screening, user, sorted(held), ticket_type=ticket_type)
+            holds.delete()
+    except IntegrityError:
+        raise SeatUnavailable(occupied_seats(screening, seats or held))
+
+    return tickets
+
+
+def create_tickets(screening, user, seats, ticket_type='adult', status='paid'):
+    """
+    Создать билеты на набор мест одной пачкой вместе с записями истории
+    и обновить карту мест. Занятое место приводит к IntegrityError,
+    поэтому вызывать нужно внутри transaction.atomic().
+    """
+    now = timezone.now()
+    prices = price_table(screening)[ticket_type]
+    tickets = [
+        Ticket(
+            screening=screening, user=user,
+            seat_row=row, seat_number=seat,
+            final_price=prices[row - 1],
+            ticket_type=ticket_type,
+            status=status,
+            purchased_at=now if status == 'paid' else None
+        )
+        for row, seat in seats
+    ]
+    tickets = bulk_create_with_history(tickets, Ticket, default_user=user, default_date=now)
+    apply_seat_changes((screening.pk, row, seat, True) for row, seat in seats)
+    return tickets
+
+
+def purchase_seats(screening, user, seats, ticket_type='adult', status='paid'):
+    """
+    Купить несколько мест сразу: либо создаются все билеты, либо ни одного.
+    Чужие удержания проверяются внутри транзакции после первой записи, как
+    в place_holds, занятость ловит уникальное ограничение при вставке.
+    Свои удержания купленных мест снимаются в той же транзакции.
+    """
+    seats = sorted(set(seats))
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            # Первым выполняется запись, чтобы SQLite сразу взял блокировку на запись
+            SeatHold.objects.filter(seats_q(seats), screening=screening).filter(
+                Q(expires_at__lte=now) | Q(user=user)
+            ).delete()
+
+            unavailable = occupied_seats(screening, seats) | held_by_others(screening, user, seats, now)
+            if unavailable:
+                raise SeatUnavailable(unavailable)
+
+            return create_tickets(screening, user, seats, ticket_type=ticket_type, status=status)
+    except IntegrityError:
+        raise SeatUnavailable(occupied_seats(screening, seats) or seats)
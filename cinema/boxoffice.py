@@ -0,0 +1,128 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .afisha import day_bounds
+from .models import BoxOfficeDaily, RollupWatermark, Screening, Ticket
+
+WATERMARK = 'box_office'
+
+# Билеты, которые учитываются в выручке
+SOLD_STATUSES = ('paid', 'used')
+
+# Разрезы отчета: имя -> {поле ответа: поле сводки}
+GROUPS = {
+    'day': {'date': 'date'},
+    'movie': {'movie_id': 'movie_id', 'movie_title': 'movie__title'},
+    'cinema': {'cinema_id': 'cinema_id', 'cinema_name': 'cinema__name'},
+    'hall': {'hall_id': 'hall_id', 'hall_name': 'hall__name'},
+}
+
+
+def changed_dates(since):
+    """
+    Дни показа, чьи продажи могли измениться после since. Одним запросом
+    по истории: сеансы измененных билетов (прежние и текущие), измененные
+    сеансы и все их прежние даты - перенос сеанса меняет оба дня.
+    Все записи билетов пишут историю, включая update() при снятии просроченных
+    броней (bulk_history_create), поэтому таблица билетов не сканируется.
+    """
+    changed_tickets = Ticket.history.filter(history_date__gte=since).values('id')
+    screening_ids = Ticket.history.filter(id__in=changed_tickets).values('screening_id')
+    starts = Screening.history.filter(
+        Q(id__in=screening_ids) | Q(history_date__gte=since)
+    ).values_list('start_time', flat=True).distinct()
+    return {timezone.localdate(start_time) for start_time in starts}
+
+
+def _date_ranges(dates):
+    """Отсортированные даты -> непрерывные диапазоны [(первая, последняя), ...]"""
+    ranges = []
+    for date in sorted(dates):
+        if ranges and ranges[-1][1] + timedelta(days=1) == date:
+            ranges[-1][1] = date
+        else:
+            ranges.append([date, date])
+    return ranges
+
+
+def aggregate_days(dates=None):
+    """Строки сводки для дней показа (None - за все время) одним группирующим запросом"""
+    tickets = Ticket.objects.filter(status__in=SOLD_STATUSES)
+    if dates is not None:
+        condition = Q()
+        for first, last in _date_ranges(dates):
+            condition |= Q(
+                screening__start_time__gte=day_bounds(first)[0],
+                screening__start_time__lt=day_bounds(last)[1],
+            )
+        tickets = tickets.filter(condition)
+    rows = (
+        tickets
+        .annotate(date=TruncDate('screening__start_time'))
+        .values('date', 'screening__movie_id', 'screening__hall_id', 'screening__hall__cinema_id')
+        .annotate(tickets_sold=Count('id'), revenue=Sum('final_price'))
+        .order_by()
+    )
+    return [
+        BoxOfficeDaily(
+            date=row['date'],
+            movie_id=row['screening__movie_id'],
+            hall_id=row['screening__hall_id'],
+            cinema_id=row['screening__hall__cinema_id'],
+            tickets_sold=row['tickets_sold'],
+            revenue=row['revenue'],
+        )
+        for row in rows
+    ]
+
+
+def refresh_box_office(full=False, batch_size=1000):
+    """
+    Обновить сводку по продажам. Пересчитываются только дни показа, затронутые
+    изменениями после отметки (или все дни при full и при первом запуске).
+    Новая отметка - время начала прогона: изменение во время пересчета
+    попадет в следующий прогон. Возвращает число пересчитанных дней (None - все).
+    """
+    started_at = timezone.now()
+    watermark = RollupWatermark.objects.filter(name=WATERMARK).first()
+    dates = None if full or watermark is None else changed_dates(watermark.value)
+
+    with transaction.atomic():
+        if dates is None:
+            BoxOfficeDaily.objects.all().delete()
+            BoxOfficeDaily.objects.bulk_create(aggregate_days(), batch_size=batch_size)
+        elif dates:
+            BoxOfficeDaily.objects.filter(date__in=dates).delete()
+            BoxOfficeDaily.objects.bulk_create(aggregate_days(dates), batch_size=batch_size)
+        RollupWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': started_at})
+    return None if dates is None else len(dates)
+
+
+def box_office_report(date_from, date_to, group_by):
+    """Выручка, число билетов и средняя цена за период в разрезах group_by"""
+    fields = {}
+    for group in group_by:
+        fields.update(GROUPS[group])
+    rows = (
+        BoxOfficeDaily.objects
+        .filter(date__gte=date_from, date__lte=date_to)
+        .values(
+            *[name for name, source in fields.items() if name == source],
+            **{name: F(source) for name, source in fields.items() if name != source}
+        )
+        .annotate(tickets_sold=Sum('tickets_sold'), revenue=Sum('revenue'))
+        .order_by(*fields)
+    )
+    report = []
+    for row in rows:
+        cents = Decimal('0.01')
+        average = row['revenue'] / row['tickets_sold'] if row['tickets_sold'] else None
+        row['average_price'] = str(average.quantize(cents)) if average is not None else None
+        row['revenue'] = str(Decimal(row['revenue']).quantize(cents))
+        report.append(row)
+    return report
@@ -0,0 +1,182 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+VERSION_KEY = 'cinema:version:{}'
+CHANGED_KEY = 'cinema:changed:{}'
+RESPONSE_KEY = 'cinema:response:{}:{}:{}'
+
+
+def _version_key(model):
+    return VERSION_KEY.format(model._meta.label_lower)
+
+
+def _changed_key(model):
+    return CHANGED_KEY.format(model._meta.label_lower)
+
+
+def _new_version():
+    # Версия после вытеснения ключа из кэша не должна совпасть с прежней
+    return time.time_ns()
+
+
+def bump_model_version(model):
+    """
+    Сменить версию модели: все закэшированные ответы, зависящие от нее, перестают
+    находиться. Версия меняется сразу и еще раз после коммита, чтобы ответ,
+    собранный параллельным запросом до коммита, не остался под новой версией.
+    """
+    def bump():
+        key = _version_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+        cache.set(_changed_key(model), int(time.time()), None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def model_versions(models):
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def models_last_changed(models):
+    """Время последнего изменения любой из моделей (unix-время, для Last-Modified)"""
+    keys = [_changed_key(model) for model in models]
+    changed = cache.get_many(keys)
+    missing = {key: int(time.time()) for key in keys if key not in changed}
+    if missing:
+        # Время изменения неизвестно (перезапуск, вытеснение): считаем, что изменилось сейчас
+        cache.set_many(missing, None)
+        changed.update(missing)
+    return max(changed.values())
+
+
+def response_cache_key(view, request, kwargs):
+    """Ключ ответа: адрес, нормализованные GET-параметры, формат и версии моделей"""
+    params = sorted((key, value) for key in request.query_params for value in request.query_params.getlist(key))
+    parts = [
+        request.get_host(),
+        request.path,
+        repr(params),
+        repr(sorted(kwargs.items())),
+        request.accepted_renderer.format,
+        repr(model_versions(view.cache_models)),
+    ]
+    digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+    return RESPONSE_KEY.format(view.basename, view.action, digest)
+
+
+class CachedResponseMixin:
+    """
+    Кэш ответов list и retrieve для справочных эндпоинтов. Ответ не зависит от
+    пользователя, поэтому ключ строится только по запросу и версиям моделей из
+    cache_models, которые меняются сигналами при любом сохранении и удалении.
+    """
+    cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        timeout = getattr(settings, 'CINEMA_RESPONSE_CACHE_TIMEOUT', 300)
+        if not timeout or not self.cache_models:
+            return handler(request, *args, **kwargs)
+
+        key = response_cache_key(self, request, kwargs)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout)
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    ETag и Last-Modified для list и retrieve, ответ 304 без выборки и сериализации.
+    Для кэшируемых представлений (cache_models) валидаторы берутся из версий
+    моделей без запросов к базе. Для остальных - один агрегирующий запрос по
+    отфильтрованному queryset (число строк и максимальный updated_at) плюс версии
+    моделей из conditional_models, чьи данные тоже попадают в ответ.
+    """
+    conditional_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        # get_validators уже отфильтровал queryset этого запроса: list и get_object
+        # берут его копию, фильтры (и поиск FTS) не выполняются повторно
+        filtered = getattr(self, 'filtered_queryset', None)
+        if filtered is not None and filtered.model is queryset.model:
+            return filtered.all()
+        return super().filter_queryset(queryset)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, kwargs)
+        not_modified = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_validators(self, request, kwargs):
+        """(ETag, Last-Modified в unix-времени) для текущего запроса"""
+        models = list(getattr(self, 'cache_models', ()))
+        if models:
+            digest = response_cache_key(self, request, kwargs).rsplit(':', 1)[-1]
+            return quote_etag(digest), models_last_changed(models)
+
+        queryset = self.filtered_queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+        fingerprint = queryset.order_by().aggregate(count=Count('pk'), last_updated=Max('updated_at'))
+        if self.action == 'list':
+            # Пагинация возьмет это число вместо повторного COUNT
+            self.filtered_count = fingerprint['count']
+
+        models = [queryset.model, *self.conditional_models]
+        last_modified = models_last_changed(models)
+        if fingerprint['last_updated']:
+            last_modified = max(last_modified, int(fingerprint['last_updated'].timestamp()))
+
+        params = sorted((key, value) for key in request.query_params for value in request.query_params.getlist(key))
+        parts = [
+            str(request.user.pk),
+            request.path,
+            repr(params),
+            request.accepted_renderer.format,
+            str(fingerprint['count']),
+            str(fingerprint['last_updated']),
+            repr(model_versions(models)),
+        ]
+        return quote_etag(hashlib.md5('|'.join(parts).encode()).hexdigest()), last_modified
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .models import SeatHold, SeatMap
+
+logger = logging.getLogger(__name__)
+
+
+def poll_interval():
+    return getattr(settings, 'CINEMA_SEAT_EVENTS_POLL', 1)
+
+
+async def read_seat_state(screening_id):
+    """Состояние мест сеанса из базы: (занятые места, {удерживаемое место: действует до})"""
+    # seatmap импортирует этот модуль
+    from .seatmap import SeatBitmap
+
+    seatmap = await SeatMap.objects.filter(screening_id=screening_id).afirst()
+    taken = set()
+    if seatmap is not None:
+        taken = set(SeatBitmap(seatmap.total_rows, seatmap.total_seats_per_row, seatmap.occupancy).taken_seats())
+    holds = SeatHold.objects.filter(screening_id=screening_id, expires_at__gt=timezone.now())
+    held = {
+        (row, seat): expires_at
+        async for row, seat, expires_at in holds.values_list('seat_row', 'seat_number', 'expires_at')
+    }
+    return taken, held
+
+
+def seat_state_events(previous, current):
+    """События hold, purchase и release, переводящие клиента из состояния previous в current"""
+    taken_before, held_before = previous
+    taken, held = current
+    events = []
+    purchased = taken - taken_before
+    if purchased:
+        events.append({'type': 'purchase', 'seats': sorted(purchased)})
+
+    # Новое или продленное удержание; места с одним сроком - одним событием
+    by_expiry = defaultdict(list)
+    for seat, expires_at in held.items():
+        if seat not in taken and held_before.get(seat) != expires_at:
+            by_expiry[expires_at].append(seat)
+    for expires_at, seats in sorted(by_expiry.items()):
+        events.append({'type': 'hold', 'seats': sorted(seats), 'expires_at': expires_at.isoformat()})
+
+    # Место было занято или удержано, а теперь свободно: отмена, снятое или истекшее удержание
+    released = (taken_before | held_before.keys()) - (taken | held.keys())
+    if released:
+        events.append({'type': 'release', 'seats': sorted(released)})
+    return events
+
+
+class SeatEventHub:
+    """
+    Шина изменений карты мест: канал на каждый сеанс. Пока у сеанса есть
+    подписчики, задача процесса опрашивает базу (карта мест и действующие
+    удержания) раз в CINEMA_SEAT_EVENTS_POLL секунд и рассылает разницу.
+    Поэтому клиенты видят изменения любых процессов (других воркеров, команды
+    снятия броней) и истечение удержаний; изменения своего процесса будят
+    опрос сразу. Подписчики - asyncio-очереди потоков SSE, публикация возможна
+    из любого потока (синхронные представления под ASGI выполняются в пуле потоков).
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        # id сеанса -> (цикл событий, задача опроса, событие пробуждения)
+        self._pollers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, screening_id):
+        queue = asyncio.Queue(self.queue_size)
+        loop = asyncio.get_running_loop()
+        subscriber = (loop, queue)
+        with self._lock:
+            self._subscribers[screening_id].add(subscriber)
+            if screening_id not in self._pollers:
+                wake = asyncio.Event()
+                self._pollers[screening_id] = (loop, loop.create_task(self._poll(screening_id, wake)), wake)
+        return subscriber
+
+    def unsubscribe(self, screening_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(screening_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[screening_id]
+                    poller = self._pollers.pop(screening_id, None)
+                    if poller:
+                        loop, task, _ = poller
+                        self._call_soon(loop, task.cancel)
+
+    def wake(self, screening_id):
+        """Опросить базу сеанса сейчас, не дожидаясь интервала"""
+        with self._lock:
+            poller = self._pollers.get(screening_id)
+        if poller:
+            loop, _, wake = poller
+            self._call_soon(loop, wake.set)
+
+    @staticmethod
+    def _call_soon(loop, callback):
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # Цикл событий уже закрыт
+            pass
+
+    async def _poll(self, screening_id, wake):
+        state = await read_seat_state(screening_id)
+        while True:
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=poll_interval())
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            try:
+                current = await read_seat_state(screening_id)
+            except DatabaseError:
+                logger.exception('Не удалось прочитать карту мест сеанса %s', screening_id)
+                continue
+            for event in seat_state_events(state, current):
+                self.publish(screening_id, event)
+            state = current
+
+    def subscribers_count(self, screening_id):
+        with self._lock:
+            return len(self._subscribers.get(screening_id, ()))
+
+    def publish(self, screening_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(screening_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                self.unsubscribe(screening_id, (loop, queue))
+
+    @staticmethod
+    def _deliver(queue, event):
+        if queue.full():
+            # Медленный клиент: сбрасываем накопленное и просим перечитать карту мест
+            while not queue.empty():
+                queue.get_nowait()
+            event = {'type': 'resync'}
+        queue.put_nowait(event)
+
+
+hub = SeatEventHub()
+
+
+def notify_seat_changes(screening_id):
+    """Места сеанса изменились в этом процессе: события уйдут подписчикам без ожидания опроса"""
+    hub.wake(screening_id)
+
+
+def _format_event(event):
+    data = json.dumps(event, separators=(',', ':'), default=str)
+    return f'event: {event["type"]}\ndata: {data}\n\n'
+
+
+async def seat_event_stream(screening_id):
+    """
+    Поток Server-Sent Events для сеанса. Текущее состояние клиент берет из
+    /seatmap/, здесь передаются только изменения. Поток закрывается через
+    CINEMA_SEAT_EVENTS_MAX_AGE секунд, браузер переподключается сам.
+    """
+    heartbeat = getattr(settings, 'CINEMA_SEAT_EVENTS_HEARTBEAT', 15)
+    max_age = getattr(settings, 'CINEMA_SEAT_EVENTS_MAX_AGE', 300)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_age
+
+    subscriber = hub.subscribe(screening_id)
+    _, queue = subscriber
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield _format_event(event)
+    finally:
+        hub.unsubscribe(screening_id, subscriber)
@@ -6,20 +6,34 @@ from .models import Movie, Screening, Ticket, Review
 class MovieFilter(django_filters.FilterSet):
     """Фильтр для фильмов"""
 
+    # Цены берутся из таблицы статистики: есть предстоящий сеанс не дешевле / не дороже.
+    # Фильтры по статистике и сортировка каталога по дате выхода - в разных таблицах,
+    # составной индекс их не покрывает: подходящие фильмы сортируются во временном B-дереве
     min_price = django_filters.NumberFilter(
-        field_name='screening__base_price',
+        field_name='stats__max_price',
         lookup_expr='gte',
-        distinct=True,
         label='Минимальная цена сеанса'
     )
 
     max_price = django_filters.NumberFilter(
-        field_name='screening__base_price',
+        field_name='stats__min_price',
         lookup_expr='lte',
-        distinct=True,
         label='Максимальная цена сеанса'
     )
 
+    min_user_rating = django_filters.NumberFilter(
+        field_name='stats__avg_rating',
+        lookup_expr='gte',
+        label='Средняя оценка зрителей (от)'
+    )
+
+    has_screenings = django_filters.BooleanFilter(
+        field_name='stats__next_start_time',
+        lookup_expr='isnull',
+        exclude=True,
+        label='Есть предстоящие сеансы'
+    )
+
     genre = django_filters.CharFilter(
         field_name='genres__name',
         lookup_expr='icontains',
@@ -100,6 +114,10 @@ class ScreeningFilter(django_filters.FilterSet):
     start_date = django_filters.DateFilter(field_name='start_time', lookup_expr='date__gte')
     end_date = django_filters.DateFilter(field_name='start_time', lookup_expr='date__lte')
     has_subtitles = django_filters.BooleanFilter(field_name='has_subtitles')
+    min_seats_free = django_filters.NumberFilter(field_name='seats_free', lookup_expr='gte')
+    max_seats_free = django_filters.NumberFilter(field_name='seats_free', lookup_expr='lte')
+    min_seats_sold = django_filters.NumberFilter(field_name='seats_sold', lookup_expr='gte')
+    max_seats_sold = django_filters.NumberFilter(field_name='seats_sold', lookup_expr='lte')
 
     class Meta:
         model = Screening
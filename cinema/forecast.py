@@ -0,0 +1,254 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Hall, Screening, ScreeningForecast, Ticket
+from .seatmap import ACTIVE_TICKET_STATUSES
+
+# Точки кривой продаж: часов до начала сеанса (по убыванию). Последний столбец
+# матрицы кривых - итог, включая продажи после начала
+LEAD_HOURS = np.array([720, 336, 168, 120, 72, 48, 24, 12, 6, 3, 1, 0], dtype=np.float64)
+
+# Уровни похожести от точного к общему; прогноз берет первый, где хватает истории
+LEVELS = [
+    ('фильм, день недели, время, тип зала', ('movie', 'weekday', 'hour_band', 'hall_type')),
+    ('фильм, время, тип зала', ('movie', 'hour_band', 'hall_type')),
+    ('фильм, тип зала', ('movie', 'hall_type')),
+    ('день недели, время, тип зала', ('weekday', 'hour_band', 'hall_type')),
+    ('тип зала', ('hall_type',)),
+    ('все сеансы', ()),
+]
+
+# Ожидаемая заполненность, пока истории продаж нет
+DEFAULT_OCCUPANCY = 0.3
+
+HALL_TYPE_CODES = {hall_type: code for code, (hall_type, _) in enumerate(Hall.HALL_TYPES)}
+
+SCREENING_DTYPE = np.dtype([
+    ('id', np.int64), ('movie', np.int64), ('hall_type', np.int64), ('weekday', np.int64),
+    ('hour', np.int64), ('hour_band', np.int64), ('start', np.float64), ('capacity', np.float64),
+])
+
+
+def history_days():
+    """Глубина истории для кривых продаж (настройка CINEMA_FORECAST_HISTORY_DAYS)"""
+    return getattr(settings, 'CINEMA_FORECAST_HISTORY_DAYS', 90)
+
+
+def min_samples():
+    """Сколько похожих прошедших сеансов нужно уровню похожести"""
+    return getattr(settings, 'CINEMA_FORECAST_MIN_SAMPLES', 3)
+
+
+def hour_band(hour):
+    """Утро, день, вечер, ночь"""
+    return 0 if hour < 12 else 1 if hour < 18 else 2 if hour < 22 else 3
+
+
+def load_screenings(since):
+    """Сеансы с начала истории одним запросом, сразу в структурный массив (по id)"""
+    rows = (
+        Screening.objects
+        .filter(is_active=True, start_time__gte=since)
+        .values_list('pk', 'movie_id', 'hall__hall_type', 'start_time', 'hall__total_rows', 'hall__total_seats_per_row')
+        .order_by('pk')
+    )
+
+    def convert(row):
+        pk, movie_id, hall_type, start_time, total_rows, seats_per_row = row
+        local = timezone.localtime(start_time)
+        return (
+            pk, movie_id, HALL_TYPE_CODES.get(hall_type, len(HALL_TYPE_CODES)), local.weekday(),
+            local.hour, hour_band(local.hour), start_time.timestamp(), total_rows * seats_per_row,
+        )
+
+    return np.fromiter((convert(row) for row in rows.iterator()), dtype=SCREENING_DTYPE)
+
+
+def load_sales(since):
+    """Продажи этих сеансов одним запросом: (id сеанса, время продажи в unix-секундах)"""
+    rows = (
+        Ticket.objects
+        .filter(status__in=ACTIVE_TICKET_STATUSES, screening__is_active=True, screening__start_time__gte=since)
+        .values_list('screening_id', 'created_at')
+        .order_by()
+    )
+    return np.fromiter(
+        ((screening_id, created_at.timestamp()) for screening_id, created_at in rows.iterator()),
+        dtype=np.dtype([('screening', np.int64), ('sold_at', np.float64)])
+    )
+
+
+def sales_curves(screenings, sales):
+    """
+    Накопленная заполненность каждого сеанса в точках LEAD_HOURS и итоговая:
+    матрица (сеансы × точки + 1). Продажи раскладываются по точкам одним
+    bincount по (сеанс, точка), затем cumsum по строкам.
+    """
+    points = len(LEAD_HOURS) + 1
+    index = np.searchsorted(screenings['id'], sales['screening'])
+    known = (index < len(screenings)) & (screenings['id'][np.minimum(index, len(screenings) - 1)] == sales['screening'])
+    index, sold_at = index[known], sales['sold_at'][known]
+
+    lead = (screenings['start'][index] - sold_at) / 3600
+    # Первая точка, к которой продажа уже состоялась; после начала - только итоговый столбец
+    point = len(LEAD_HOURS) - np.searchsorted(LEAD_HOURS[::-1], lead, side='right')
+    counts = np.bincount(index * points + point, minlength=len(screenings) * points).reshape(len(screenings), points)
+    return np.cumsum(counts, axis=1) / np.maximum(screenings['capacity'], 1)[:, None]
+
+
+def level_codes(screenings, fields):
+    """Один int64-ключ группы похожих сеансов на сеанс"""
+    codes = np.zeros(len(screenings), dtype=np.int64)
+    for field in fields:
+        column = screenings[field]
+        codes = codes * (int(column.max()) + 1 if len(column) else 1) + column
+    return codes
+
+
+def demand_table(now=None):
+    """
+    Спрос по итоговой заполненности прошедших сеансов истории: матрица
+    день недели × час × тип зала и множители фильмов. Ячейка, где меньше
+    min_samples() сеансов, берет среднее своей части дня, затем типа зала,
+    затем общее. Множитель фильма - отношение его заполненности к ожидаемой
+    по ячейкам, сглаженное к 1 для фильмов с короткой историей.
+
+    Возвращает (матрица 7 × 24 × типы залов, {id фильма: множитель}).
+    """
+    now = now or timezone.now()
+    since = now - timedelta(days=history_days())
+    screenings = load_screenings(since)
+    screenings = screenings[screenings['start'] <= now.timestamp()]
+    types = len(HALL_TYPE_CODES) + 1
+    if not len(screenings):
+        return np.full((7, 24, types), DEFAULT_OCCUPANCY), {}
+    final = sales_curves(screenings, load_sales(since))[:, -1]
+
+    def means(codes, size):
+        counts = np.bincount(codes, minlength=size)
+        return np.bincount(codes, weights=final, minlength=size) / np.maximum(counts, 1), counts
+
+    overall = final.mean()
+    type_mean, type_count = means(screenings['hall_type'], types)
+    band_mean, band_count = means(
+        (screenings['weekday'] * 4 + screenings['hour_band']) * types + screenings['hall_type'], 7 * 4 * types
+    )
+    cell_mean, cell_count = means(
+        (screenings['weekday'] * 24 + screenings['hour']) * types + screenings['hall_type'], 7 * 24 * types
+    )
+
+    enough = min_samples()
+    table = np.where(type_count >= enough, type_mean, overall)[None, None, :].repeat(24, axis=1).repeat(7, axis=0)
+    bands = np.array([hour_band(hour) for hour in range(24)])
+    band_mean, band_count = band_mean.reshape(7, 4, types)[:, bands], band_count.reshape(7, 4, types)[:, bands]
+    table = np.where(band_count >= enough, band_mean, table)
+    table = np.where(cell_count.reshape(7, 24, types) >= enough, cell_mean.reshape(7, 24, types), table)
+
+    expected = table[screenings['weekday'], screenings['hour'], screenings['hall_type']]
+    movies, inverse = np.unique(screenings['movie'], return_inverse=True)
+    prior = enough * overall
+    factors = (np.bincount(inverse, weights=final) + prior) / (np.bincount(inverse, weights=expected) + prior)
+    return table, dict(zip(movies.tolist(), factors.tolist()))
+
+
+def forecast(now=None):
+    """
+    Прогноз для всех предстоящих сеансов за один проход. Прошедшие сеансы дают
+    кривые продаж; для каждого предстоящего берется средняя кривая самого точного
+    уровня похожести, где не меньше min_samples() сеансов. Прогноз итога:
+    текущая заполненность + средний прирост истории от текущей точки до начала,
+    умноженный на темп (насколько сеанс опережает историю сейчас). Распродажа -
+    первая точка, где проекция достигает 100%.
+
+    Возвращает список несохраненных ScreeningForecast.
+    """
+    now = now or timezone.now()
+    screenings = load_screenings(now - timedelta(days=history_days()))
+    if not len(screenings):
+        return []
+    curves = sales_curves(screenings, load_sales(now - timedelta(days=history_days())))
+    upcoming = screenings['start'] > now.timestamp()
+    past = ~upcoming
+    if not upcoming.any():
+        return []
+
+    ahead = (screenings['start'][upcoming] - now.timestamp()) / 3600
+    # Текущая точка кривой: последняя, которую сеанс уже прошел
+    passed = len(LEAD_HOURS) - np.searchsorted(LEAD_HOURS[::-1], ahead, side='left')
+    point = np.clip(passed - 1, 0, len(LEAD_HOURS) - 1)
+    current = curves[upcoming, -1]
+
+    mean_curves = np.zeros((upcoming.sum(), curves.shape[1]))
+    samples = np.zeros(upcoming.sum(), dtype=np.int64)
+    basis = np.full(upcoming.sum(), '', dtype=object)
+    pending = np.ones(upcoming.sum(), dtype=bool)
+    for name, fields in LEVELS:
+        codes = level_codes(screenings, fields)
+        groups, inverse = np.unique(codes[past], return_inverse=True)
+        if not len(groups):
+            break
+        sums = np.zeros((len(groups), curves.shape[1]))
+        np.add.at(sums, inverse, curves[past])
+        counts = np.bincount(inverse, minlength=len(groups))
+
+        position = np.clip(np.searchsorted(groups, codes[upcoming]), 0, len(groups) - 1)
+        found = pending & (groups[position] == codes[upcoming]) & (counts[position] >= min_samples())
+        mean_curves[found] = sums[position[found]] / counts[position[found], None]
+        samples[found] = counts[position[found]]
+        basis[found] = name
+        pending &= ~found
+
+    rows = np.arange(len(point))
+    history_now = mean_curves[rows, point]
+    pace = np.clip((current + 0.01) / (history_now + 0.01), 0.25, 4)
+    projection = current[:, None] + (mean_curves - history_now[:, None]) * pace[:, None]
+    # Проекция действует только после текущей точки
+    projection = np.where(np.arange(curves.shape[1]) > point[:, None], projection, current[:, None])
+    projection = np.clip(projection, current[:, None], 1)
+    final = projection[:, -1]
+
+    sold_out = projection[:, :len(LEAD_HOURS)] >= 0.999
+    first = np.argmax(sold_out, axis=1)
+    sell_out_ts = np.where(
+        sold_out.any(axis=1),
+        screenings['start'][upcoming] - LEAD_HOURS[first] * 3600,
+        np.nan
+    )
+    # Уже распроданный сеанс распродан сейчас
+    sell_out_ts = np.where(current >= 0.999, now.timestamp(), sell_out_ts)
+
+    return [
+        ScreeningForecast(
+            screening_id=int(screening_id),
+            current_occupancy=round(float(current_value), 4),
+            forecast_occupancy=round(float(final_value), 4),
+            sell_out_at=None if np.isnan(sell_out_value) else datetime.fromtimestamp(sell_out_value, tz=dt_timezone.utc),
+            samples=int(sample_count),
+            basis=basis_name,
+            computed_at=now,
+        )
+        for screening_id, current_value, final_value, sell_out_value, sample_count, basis_name
+        in zip(screenings['id'][upcoming], current, final, sell_out_ts, samples, basis)
+    ]
+
+
+def refresh_forecasts(batch_size=1000):
+    """
+    Пересчитать прогнозы и удалить прогнозы прошедших сеансов. Возвращает число прогнозов.
+    Все прогнозы прогона получают одно computed_at, поэтому лишние удаляются
+    условием по нему, а не списком id (в SQLite он упирается в лимит параметров).
+    """
+    now = timezone.now()
+    forecasts = forecast(now)
+    ScreeningForecast.objects.bulk_create(
+        forecasts,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['screening'],
+        update_fields=['current_occupancy', 'forecast_occupancy', 'sell_out_at', 'samples', 'basis', 'computed_at']
+    )
+    ScreeningForecast.objects.filter(computed_at__lt=now).delete()
+    return len(forecasts)
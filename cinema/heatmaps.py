@@ -0,0 +1,148 @@
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import DurationField, ExpressionWrapper, F
+from django.utils import timezone
+
+from .boxoffice import SOLD_STATUSES
+from .models import Hall, HallHeatmap, Ticket
+
+# Матрицы тепловой карты и их тип в хранилище
+MATRICES = {
+    'purchases': np.uint32,
+    'lead_seconds': np.float64,
+    # Копейки: сумма без ошибок округления
+    'revenue': np.int64,
+}
+
+TICKET_DTYPE = np.dtype([
+    ('id', np.int64), ('row', np.int64), ('seat', np.int64), ('kopecks', np.int64), ('lead', np.float64),
+])
+
+
+def settle_delay():
+    """
+    После начала сеанса бронь еще может быть оплачена или снята в течение
+    срока брони, затем статусы билетов сеанса больше не меняются.
+    """
+    return timedelta(minutes=getattr(settings, 'CINEMA_BOOKING_HOLD_MINUTES', 30))
+
+
+def empty_heatmap(hall):
+    return HallHeatmap(hall=hall, total_rows=hall.total_rows, total_seats_per_row=hall.total_seats_per_row)
+
+
+def load_matrices(heatmap):
+    """Матрицы ряд × место из байтов модели (пустая карта - нули)"""
+    shape = (heatmap.total_rows, heatmap.total_seats_per_row)
+    matrices = {}
+    for name, dtype in MATRICES.items():
+        data = bytes(getattr(heatmap, name))
+        if data:
+            matrices[name] = np.frombuffer(data, dtype=dtype).reshape(shape).copy()
+        else:
+            matrices[name] = np.zeros(shape, dtype=dtype)
+    return matrices
+
+
+def ticket_array(hall, after, cutoff):
+    """
+    Проданные билеты сеансов зала, начавшихся в (after, cutoff], одним запросом
+    values_list, сразу в структурный массив: (id, ряд, место, цена в копейках,
+    секунды до сеанса). after=None - все сеансы до cutoff.
+    """
+    tickets = Ticket.objects.filter(
+        screening__hall=hall, screening__start_time__lte=cutoff, status__in=SOLD_STATUSES
+    )
+    if after is not None:
+        tickets = tickets.filter(screening__start_time__gt=after)
+    rows = (
+        tickets
+        .annotate(lead=ExpressionWrapper(F('screening__start_time') - F('created_at'), output_field=DurationField()))
+        .values_list('pk', 'seat_row', 'seat_number', 'final_price', 'lead')
+        .order_by()
+    )
+    return np.fromiter(
+        ((pk, row, seat, int(price * 100), lead.total_seconds()) for pk, row, seat, price, lead in rows.iterator()),
+        dtype=TICKET_DTYPE
+    )
+
+
+def accumulate(matrices, tickets):
+    """Добавить билеты к матрицам: bincount по номеру места вместо цикла по билетам"""
+    shape = matrices['purchases'].shape
+    total_rows, total_seats = shape
+    inside = (
+        (tickets['row'] >= 1) & (tickets['row'] <= total_rows)
+        & (tickets['seat'] >= 1) & (tickets['seat'] <= total_seats)
+    )
+    tickets = tickets[inside]
+    cells = (tickets['row'] - 1) * total_seats + (tickets['seat'] - 1)
+    size = total_rows * total_seats
+
+    matrices['purchases'] += np.bincount(cells, minlength=size).reshape(shape).astype(np.uint32)
+    lead = np.bincount(cells, weights=np.maximum(tickets['lead'], 0), minlength=size)
+    matrices['lead_seconds'] += lead.reshape(shape)
+    revenue = np.bincount(cells, weights=tickets['kopecks'], minlength=size)
+    matrices['revenue'] += revenue.round().astype(np.int64).reshape(shape)
+
+
+def refresh_hall_heatmap(hall, full=False):
+    """
+    Дополнить тепловую карту зала билетами сеансов, начавшихся после
+    counted_until более срока брони назад: к этому времени их статусы уже
+    не меняются, поэтому поздняя оплата, отмена и поздний коммит билета
+    с меньшим id учитываются верно. При full или изменении размеров зала
+    карта считается заново. Возвращает число добавленных билетов.
+    """
+    cutoff = timezone.now() - settle_delay()
+    heatmap = HallHeatmap.objects.filter(hall=hall).first()
+    shape = (hall.total_rows, hall.total_seats_per_row)
+    if (
+        heatmap is None or full or heatmap.counted_until is None
+        or (heatmap.total_rows, heatmap.total_seats_per_row) != shape
+    ):
+        heatmap = empty_heatmap(hall)
+
+    tickets = ticket_array(hall, heatmap.counted_until, cutoff)
+    if not len(tickets) and heatmap.updated_at is not None:
+        HallHeatmap.objects.filter(pk=heatmap.pk).update(counted_until=cutoff)
+        return 0
+
+    matrices = load_matrices(heatmap)
+    if len(tickets):
+        accumulate(matrices, tickets)
+    heatmap.counted_until = cutoff
+    for name, matrix in matrices.items():
+        setattr(heatmap, name, matrix.tobytes())
+    heatmap.save()
+    return len(tickets)
+
+
+def refresh_heatmaps(hall_ids=None, full=False):
+    """Обновить карты всех (или указанных) залов: {id зала: добавлено билетов}"""
+    halls = Hall.objects.order_by('pk')
+    if hall_ids:
+        halls = halls.filter(pk__in=hall_ids)
+    return {hall.pk: refresh_hall_heatmap(hall, full=full) for hall in halls}
+
+
+def heatmap_payload(heatmap):
+    """Матрицы для API: покупки, среднее время от покупки до сеанса (часы) и выручка по местам"""
+    matrices = load_matrices(heatmap)
+    purchases = matrices['purchases']
+    sold = purchases > 0
+    lead_hours = np.divide(matrices['lead_seconds'], purchases, out=np.zeros(purchases.shape), where=sold) / 3600
+    return {
+        'hall': heatmap.hall_id,
+        'total_rows': heatmap.total_rows,
+        'total_seats_per_row': heatmap.total_seats_per_row,
+        'tickets': int(purchases.sum()),
+        'row_purchases': purchases.sum(axis=1).tolist(),
+        'purchases': purchases.tolist(),
+        # None - место еще не покупали
+        'avg_hours_before_start': np.where(sold, lead_hours.round(1), None).tolist(),
+        'revenue': (matrices['revenue'] / 100).round(2).tolist(),
+        'updated_at': heatmap.updated_at,
+    }
@@ -0,0 +1,161 @@
+import django_filters
+from django.contrib.auth.models import User
+from django.core.exceptions import EmptyResultSet, FieldError, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework.pagination import CursorPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from cinema.views import MovieViewSet, ReviewViewSet, ScreeningViewSet, TicketViewSet
+
+# Параметры, которые get_queryset читает вручную (не через filterset_class)
+EXTRA_PARAMS = {
+    'movies': [
+        {'genre_id': 1}, {'person_id': 1}, {'title_contains': 'а'}, {'country': 'а'},
+        {'premium': 'true'}, {'family_friendly': 'true'},
+    ],
+    'screenings': [
+        {'cinema_id': 1}, {'hall_id': 1}, {'today': 'true'}, {'tomorrow': 'true'},
+        {'weekend': 'true'}, {'available': 'true'}, {'evening': 'true'},
+    ],
+    'tickets': [
+        {'screening_id': 1}, {'status_filter': 'paid'}, {'date_from': '2024-01-01'},
+        {'date_to': '2030-01-01'}, {'active': 'true'}, {'expensive': 'true'},
+    ],
+    'reviews': [
+        {'movie_id': 1}, {'approved_only': 'true'},
+    ],
+}
+
+VIEWSETS = {
+    'movies': MovieViewSet,
+    'screenings': ScreeningViewSet,
+    'tickets': TicketViewSet,
+    'reviews': ReviewViewSet,
+}
+
+
+def sample_value(filter_):
+    """Подходящее значение GET-параметра для фильтра django-filter"""
+    if isinstance(filter_, django_filters.BooleanFilter):
+        return 'true'
+    if isinstance(filter_, django_filters.NumberFilter):
+        return 1
+    if isinstance(filter_, (django_filters.DateFilter, django_filters.DateTimeFilter)):
+        return timezone.now().date().isoformat()
+    return 'а'
+
+
+def parameter_cases(prefix, viewset):
+    """Набор GET-параметров: без фильтров, каждый фильтр, каждая сортировка"""
+    cases = [{}]
+    if viewset.filterset_class:
+        for name, filter_ in viewset.filterset_class.base_filters.items():
+            cases.append({name: sample_value(filter_)})
+    cases.extend(EXTRA_PARAMS.get(prefix, []))
+    cases.append({'search': 'а'})
+    for field in viewset.ordering_fields:
+        cases.append({'ordering': field})
+        cases.append({'ordering': f'-{field}'})
+    return cases
+
+
+def problems(plan):
+    """Полные сканирования таблиц и временные B-деревья в плане SQLite"""
+    found = []
+    for line in plan.splitlines():
+        # Django выводит строки плана SQLite как "id parent notused detail"
+        parts = line.split(maxsplit=3)
+        step = parts[3] if len(parts) == 4 and all(part.isdigit() for part in parts[:3]) else line.strip()
+        if step.startswith('SCAN ') and ' USING ' not in step:
+            found.append(step)
+        elif 'TEMP B-TREE' in step:
+            found.append(step)
+    return found
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN QUERY PLAN для списков фильмов, сеансов, билетов и отзывов по каждому параметру запроса'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--viewset',
+            choices=sorted(VIEWSETS),
+            action='append',
+            help='Проверить только указанные эндпоинты (можно несколько раз)'
+        )
+
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя, от которого строятся запросы (по умолчанию первый суперпользователь)'
+        )
+
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Печатать планы всех запросов, а не только проблемных'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда разбирает вывод EXPLAIN QUERY PLAN и работает только с SQLite')
+
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('Нет пользователя для построения запросов, укажите --user')
+
+        factory = APIRequestFactory()
+        checked = 0
+        flagged = 0
+        for prefix in options['viewset'] or VIEWSETS:
+            viewset = VIEWSETS[prefix]
+            self.stdout.write(self.style.MIGRATE_HEADING(f'/api/{prefix}/'))
+            for params in parameter_cases(prefix, viewset):
+                query = '&'.join(f'{key}={value}' for key, value in params.items()) or '(без параметров)'
+                try:
+                    plan = self._explain(factory, viewset, prefix, params, user)
+                except (APIException, ValidationError, FieldError, DatabaseError) as error:
+                    self.stdout.write(self.style.WARNING(f'  {query}: ошибка построения запроса - {error}'))
+                    continue
+                checked += 1
+
+                found = problems(plan)
+                if found:
+                    flagged += 1
+                    self.stdout.write(self.style.ERROR(f'  {query}'))
+                    for step in found:
+                        self.stdout.write(f'      {step}')
+                elif options['all']:
+                    self.stdout.write(self.style.SUCCESS(f'  {query}'))
+                if options['all']:
+                    for line in plan.splitlines():
+                        self.stdout.write(f'        {line}')
+
+        message = f'Проверено запросов: {checked}, с полным сканированием или сортировкой во временном B-дереве: {flagged}'
+        self.stdout.write(self.style.WARNING(message) if flagged else self.style.SUCCESS(message))
+
+    def _explain(self, factory, viewset, prefix, params, user):
+        """Собрать queryset так же, как список эндпоинта (фильтры, сортировка, первая страница)"""
+        request = Request(factory.get(f'/api/{prefix}/', params))
+        request.user = user
+        view = viewset(request=request, format_kwarg=None, action='list', kwargs={}, args=())
+        queryset = view.filter_queryset(view.get_queryset())
+        if isinstance(view.paginator, CursorPagination):
+            # Курсорная пагинация задает свою сортировку поверх фильтров
+            queryset = queryset.order_by(*view.paginator.get_ordering(request, queryset, view))
+        page_size = view.paginator.get_page_size(request) if view.paginator else None
+        if page_size:
+            queryset = queryset[:page_size]
+        try:
+            queryset.query.get_compiler(queryset.db).as_sql()
+        except EmptyResultSet:
+            # Фильтр заранее знает, что строк нет (например, поиск без совпадений: pk__in=[]),
+            # запроса не будет - explain() на таком queryset падает с IndexError
+            return ''
+        return queryset.explain()
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cinema.forecast import refresh_forecasts
+from cinema.models import ScreeningForecast
+
+
+class Command(BaseCommand):
+    help = 'Прогноз итоговой заполненности и времени распродажи всех предстоящих сеансов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=10,
+            help='Сколько ближайших распродаж вывести (по умолчанию 10)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = refresh_forecasts()
+        self.stdout.write(self.style.SUCCESS(
+            f'Прогнозы рассчитаны для {count} сеансов за {time.perf_counter() - started:.2f} с'
+        ))
+
+        selling_out = (
+            ScreeningForecast.objects
+            .filter(sell_out_at__isnull=False)
+            .select_related('screening__movie', 'screening__hall__cinema')
+            .order_by('sell_out_at')[:options['show']]
+        )
+        for forecast in selling_out:
+            screening = forecast.screening
+            self.stdout.write(
+                f'{forecast.sell_out_at:%d.%m %H:%M}  {screening.movie.title}, {screening.hall.cinema.name}, '
+                f'{screening.hall.name}, {screening.start_time:%d.%m %H:%M} '
+                f'(сейчас {forecast.current_occupancy:.0%}, прогноз {forecast.forecast_occupancy:.0%})'
+            )
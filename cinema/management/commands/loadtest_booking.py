@@ -0,0 +1,269 @@
+import logging
+import multiprocessing
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.utils import timezone
+
+from cinema.models import Cinema, Hall, Movie, Screening, SeatMap, Ticket
+
+LOADTEST_PREFIX = 'loadtest'
+
+# Параметры воркера передаются в дочерние процессы, поэтому это модульные переменные
+_worker_options = {}
+
+
+def _pick_seats(rows, seats_per_row, count, hot_share):
+    """Случайные места; доля hot_share попадает в центр зала, чтобы создать конкуренцию"""
+    if random.random() < hot_share:
+        row_range = (max(1, rows // 2 - 2), min(rows, rows // 2 + 2))
+        seat_range = (max(1, seats_per_row // 2 - 4), min(seats_per_row, seats_per_row // 2 + 4))
+    else:
+        row_range = (1, rows)
+        seat_range = (1, seats_per_row)
+    row = random.randint(*row_range)
+    first = random.randint(seat_range[0], max(seat_range[0], seat_range[1] - count + 1))
+    return [(row, seat) for seat in range(first, min(first + count, seats_per_row + 1))]
+
+
+def _attempt(client, user_id, options, seats):
+    """Одна попытка покупки через API. Возвращает HTTP-статус"""
+    screening_id = options['screening_id']
+    if options['scenario'] == 'bulk':
+        response = client.post('/api/tickets/bulk_purchase/', {
+            'screening': screening_id,
+            'seats': [{'seat_row': row, 'seat_number': seat} for row, seat in seats],
+        }, content_type='application/json')
+    elif options['scenario'] == 'hold':
+        payload = {'seats': [{'seat_row': row, 'seat_number': seat} for row, seat in seats]}
+        response = client.post(f'/api/screenings/{screening_id}/hold/', payload, content_type='application/json')
+        if response.status_code == 201:
+            response = client.post(f'/api/screenings/{screening_id}/confirm/', payload, content_type='application/json')
+    else:
+        row, seat = seats[0]
+        response = client.post('/api/tickets/', {
+            'screening': screening_id,
+            'seat_row': row,
+            'seat_number': seat,
+            'status': 'paid',
+            'user': user_id,
+        })
+    return response.status_code
+
+
+def run_worker(worker_index):
+    """
+    Воркер нагрузочного теста. Возвращает список (задержка_сек, статус, повторы);
+    статус 0 - исключение.
+    """
+    options = _worker_options
+    random.seed(options['seed'] + worker_index)
+    user_id = options['user_ids'][worker_index % len(options['user_ids'])]
+    client = Client(HTTP_HOST='localhost')
+    client.force_login(User.objects.get(pk=user_id))
+
+    results = []
+    try:
+        for _ in range(options['attempts']):
+            seats = _pick_seats(options['rows'], options['seats_per_row'], options['party_size'], options['hot_share'])
+            started = time.perf_counter()
+            retries = 0
+            while True:
+                try:
+                    status_code = _attempt(client, user_id, options, seats)
+                except Exception:
+                    status_code = 0
+                if (0 < status_code < 500) or retries >= options['retries']:
+                    break
+                retries += 1
+            results.append((time.perf_counter() - started, status_code, retries))
+    finally:
+        connections.close_all()
+    return results
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест покупки билетов с проверкой двойных продаж мест'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Количество параллельных воркеров (по умолчанию 8)')
+        parser.add_argument('--attempts', type=int, default=50, help='Попыток покупки на воркер (по умолчанию 50)')
+        parser.add_argument(
+            '--mode', choices=['threads', 'processes', 'both'], default='both',
+            help='Потоки, процессы или оба прогона подряд (по умолчанию both)'
+        )
+        parser.add_argument(
+            '--scenario', choices=['tickets', 'bulk', 'hold'], default='tickets',
+            help='Путь покупки: POST /tickets/, /tickets/bulk_purchase/ или hold + confirm'
+        )
+        parser.add_argument('--rows', type=int, default=20, help='Рядов в тестовом зале (по умолчанию 20)')
+        parser.add_argument('--seats-per-row', type=int, default=30, help='Мест в ряду (по умолчанию 30)')
+        parser.add_argument('--party-size', type=int, default=1, help='Мест в одной покупке для bulk/hold (по умолчанию 1)')
+        parser.add_argument('--hot-share', type=float, default=0.5, help='Доля попыток в центр зала (по умолчанию 0.5)')
+        parser.add_argument('--retries', type=int, default=2, help='Повторов при ошибке 5xx (по умолчанию 2)')
+        parser.add_argument('--seed', type=int, default=42, help='Seed генератора случайных мест')
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовые данные после прогона')
+
+    def handle(self, *args, **options):
+        if options['scenario'] == 'tickets':
+            options['party_size'] = 1
+
+        # Ожидаемые отказы (400/409) не должны засорять вывод
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+        modes = ['threads', 'processes'] if options['mode'] == 'both' else [options['mode']]
+        double_booked = 0
+        for mode in modes:
+            screening, users = self._create_fixture(options)
+            try:
+                double_booked += self._run(mode, screening, users, options)
+            finally:
+                if not options['keep']:
+                    self._cleanup(screening, users)
+
+        if double_booked:
+            raise CommandError(f'Обнаружены двойные продажи мест: {double_booked}')
+
+    def _create_fixture(self, options):
+        stamp = timezone.now().strftime('%Y%m%d%H%M%S%f')
+        cinema = Cinema.objects.create(
+            name=f'{LOADTEST_PREFIX} {stamp}',
+            city='Нагрузочный тест',
+            address='Тестовый адрес для нагрузки'
+        )
+        hall = Hall.objects.create(
+            cinema=cinema,
+            name='IMAX',
+            hall_type='imax',
+            total_rows=options['rows'],
+            total_seats_per_row=options['seats_per_row']
+        )
+        movie = Movie.objects.create(
+            title=f'{LOADTEST_PREFIX} премьера {stamp}',
+            duration_minutes=150,
+            release_date=timezone.now().date(),
+            age_rating='12+',
+            poster_url='/static/loadtest.jpg'
+        )
+        start_time = timezone.now() + timedelta(days=1)
+        screening = Screening.objects.create(
+            movie=movie,
+            hall=hall,
+            start_time=start_time,
+            end_time=start_time + timedelta(minutes=150),
+            base_price=500
+        )
+        users = [
+            User.objects.create_user(username=f'{LOADTEST_PREFIX}_{stamp}_{i}', password=None)
+            for i in range(options['workers'])
+        ]
+        return screening, users
+
+    def _cleanup(self, screening, users):
+        cinema = screening.hall.cinema
+        movie = screening.movie
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        cinema.delete()
+        movie.delete()
+
+    def _run(self, mode, screening, users, options):
+        _worker_options.clear()
+        _worker_options.update({
+            'screening_id': screening.pk,
+            'user_ids': [user.pk for user in users],
+            'rows': options['rows'],
+            'seats_per_row': options['seats_per_row'],
+            'party_size': options['party_size'],
+            'hot_share': options['hot_share'],
+            'attempts': options['attempts'],
+            'retries': options['retries'],
+            'scenario': options['scenario'],
+            'seed': options['seed'],
+        })
+        workers = options['workers']
+
+        started = time.perf_counter()
+        if mode == 'threads':
+            results = [None] * workers
+
+            def target(index):
+                results[index] = run_worker(index)
+
+            threads = [threading.Thread(target=target, args=(i,)) for i in range(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            # Дочерние процессы не должны наследовать открытые соединения с БД
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                results = pool.map(run_worker, range(workers))
+        elapsed = time.perf_counter() - started
+
+        attempts = [item for worker_results in results for item in worker_results]
+        return self._report(mode, screening, attempts, elapsed, options)
+
+    def _report(self, mode, screening, attempts, elapsed, options):
+        latencies = sorted(latency for latency, _, _ in attempts)
+        sold = sum(1 for _, status_code, _ in attempts if status_code == 201)
+        rejected = sum(1 for _, status_code, _ in attempts if status_code in (400, 409))
+        failed = sum(1 for _, status_code, _ in attempts if status_code == 0 or status_code >= 500)
+        retried = sum(1 for _, _, retries in attempts if retries)
+
+        duplicates = list(
+            Ticket.objects.filter(screening=screening)
+            .exclude(status='cancelled')
+            .values('seat_row', 'seat_number')
+            .annotate(count=Count('id'))
+            .filter(count__gt=1)
+        )
+        active_tickets = Ticket.objects.filter(screening=screening).exclude(status='cancelled').count()
+        screening.refresh_from_db()
+        seatmap = SeatMap.objects.get(screening=screening)
+        bitmap_taken = int.from_bytes(bytes(seatmap.occupancy), 'little').bit_count()
+
+        self.stdout.write(f'=== {mode}: {options["workers"]} воркеров, сценарий {options["scenario"]} ===')
+        self.stdout.write(f'Попыток: {len(attempts)} за {elapsed:.2f} с ({len(attempts) / elapsed:.1f} попыток/с)')
+        self.stdout.write(f'Успешных покупок: {sold} ({sold / elapsed:.1f}/с), отказов "место занято": {rejected}')
+        self.stdout.write(f'Ошибок: {failed}, попыток с повторами: {retried}')
+        self.stdout.write(
+            'Задержка, мс: p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f}'.format(
+                _percentile(latencies, 50) * 1000,
+                _percentile(latencies, 95) * 1000,
+                _percentile(latencies, 99) * 1000,
+                (latencies[-1] if latencies else 0) * 1000,
+            )
+        )
+        self.stdout.write(
+            f'Билетов: {active_tickets}, карта мест: {bitmap_taken}, '
+            f'счетчик seats_sold: {screening.seats_sold}'
+        )
+
+        if active_tickets != bitmap_taken or active_tickets != screening.seats_sold:
+            self.stdout.write(self.style.WARNING('Карта мест или счетчики расходятся с таблицей билетов'))
+
+        if duplicates:
+            for duplicate in duplicates:
+                self.stdout.write(self.style.ERROR(
+                    f'  Место продано дважды: ряд {duplicate["seat_row"]}, '
+                    f'место {duplicate["seat_number"]} ({duplicate["count"]} билета)'
+                ))
+        else:
+            self.stdout.write(self.style.SUCCESS('Двойных продаж мест нет'))
+
+        return len(duplicates)
@@ -0,0 +1,105 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from cinema.models import Hall, Movie
+from cinema.planner import plan_week, save_plan
+
+
+class Command(BaseCommand):
+    help = 'Автоматическое расписание недели: показы фильмов по залам с максимумом ожидаемой заполненности'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--movie',
+            action='append',
+            required=True,
+            metavar='ID:ПОКАЗОВ',
+            help='Фильм и число показов за неделю (можно несколько раз)'
+        )
+
+        parser.add_argument(
+            '--week-start',
+            help='Первый день недели YYYY-MM-DD (по умолчанию ближайший понедельник)'
+        )
+
+        parser.add_argument(
+            '--cinema',
+            type=int,
+            action='append',
+            help='Только залы указанных кинотеатров (id, можно несколько раз)'
+        )
+
+        parser.add_argument(
+            '--base-price',
+            default='400',
+            help='Базовая цена создаваемых сеансов (по умолчанию 400)'
+        )
+
+        parser.add_argument(
+            '--step',
+            type=int,
+            default=15,
+            help='Шаг времени начала сеансов в минутах (по умолчанию 15)'
+        )
+
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только вывести план, ничего не сохраняя'
+        )
+
+    def handle(self, *args, **options):
+        targets = {}
+        for value in options['movie']:
+            movie_id, _, count = value.partition(':')
+            if not movie_id.isdigit() or not count.isdigit():
+                raise CommandError(f'Ожидается ID:ПОКАЗОВ, получено "{value}"')
+            targets[int(movie_id)] = int(count)
+        movies = Movie.objects.in_bulk(targets)
+        missing = sorted(set(targets) - set(movies))
+        if missing:
+            raise CommandError(f'Фильмы не найдены: {", ".join(map(str, missing))}')
+
+        if options['week_start']:
+            try:
+                week_start = date.fromisoformat(options['week_start'])
+            except ValueError:
+                raise CommandError('Дата начала недели должна быть в формате YYYY-MM-DD')
+        else:
+            today = timezone.localdate()
+            week_start = today + timedelta(days=7 - today.weekday())
+
+        halls = Hall.objects.filter(cinema__is_active=True).select_related('cinema').order_by('pk')
+        if options['cinema']:
+            halls = halls.filter(cinema_id__in=options['cinema'])
+
+        started = time.perf_counter()
+        plan = plan_week(
+            {movies[movie_id]: count for movie_id, count in targets.items()}, halls, week_start, options['step']
+        )
+        planned = time.perf_counter() - started
+        tickets = sum(item['expected_occupancy'] * item['hall'].total_rows * item['hall'].total_seats_per_row for item in plan)
+        self.stdout.write(
+            f'Запланировано показов: {len(plan)} из {sum(targets.values())}, '
+            f'ожидается зрителей: {tickets:.0f}, расчет {planned:.2f} с'
+        )
+        for movie_id, count in targets.items():
+            placed = sum(1 for item in plan if item['movie'].pk == movie_id)
+            if placed < count:
+                self.stdout.write(self.style.WARNING(f'{movies[movie_id].title}: поместилось {placed} из {count}'))
+
+        if options['dry_run']:
+            for item in sorted(plan, key=lambda item: (item['hall'].pk, item['start_time'])):
+                self.stdout.write(
+                    f'{timezone.localtime(item["start_time"]):%a %d.%m %H:%M}  {item["hall"].cinema.name}, '
+                    f'{item["hall"].name}: {item["movie"].title} ({item["expected_occupancy"]:.0%})'
+                )
+            return
+
+        screenings, report = save_plan(plan, options['base_price'])
+        if report:
+            raise CommandError(f'План не прошел проверку расписания: {report[:5]}')
+        self.stdout.write(self.style.SUCCESS(f'Создано сеансов: {len(screenings)}'))
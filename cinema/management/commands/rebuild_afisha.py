@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cinema.afisha import rebuild_schedule
+from cinema.models import Cinema, DailySchedule
+
+
+class Command(BaseCommand):
+    help = 'Пересборка афиш городов на ближайшие дни и удаление прошедших'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='На сколько дней вперед собрать афиши, начиная с сегодняшнего (по умолчанию 7)'
+        )
+
+        parser.add_argument(
+            '--city',
+            action='append',
+            help='Только указанные города (можно несколько раз)'
+        )
+
+        parser.add_argument(
+            '--stale-only',
+            action='store_true',
+            help='Пересобрать только отсутствующие и устаревшие афиши'
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        deleted, _ = DailySchedule.objects.filter(date__lt=today).delete()
+
+        cities = options['city'] or sorted(set(
+            Cinema.objects.filter(is_active=True).values_list('city', flat=True)
+        ))
+        dates = [today + timedelta(days=offset) for offset in range(options['days'])]
+        existing = {
+            (schedule.city, schedule.date): schedule
+            for schedule in DailySchedule.objects.filter(city__in=cities, date__in=dates)
+        }
+
+        rebuilt = 0
+        for city in cities:
+            for date in dates:
+                schedule = existing.get((city, date))
+                if options['stale_only'] and schedule is not None and not schedule.is_stale:
+                    continue
+                rebuild_schedule(city, date)
+                rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Собрано афиш: {rebuilt} ({len(cities)} городов, {len(dates)} дней), удалено прошедших: {deleted}'
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cinema.stats import rebuild_movie_stats
+
+
+class Command(BaseCommand):
+    help = 'Полная пересборка статистики фильмов (оценки, рецензии, избранное, цены и ближайший сеанс)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одном INSERT (по умолчанию 1000)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_movie_stats(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Статистика пересобрана для {count} фильмов за {time.perf_counter() - started:.2f} с')
+        )
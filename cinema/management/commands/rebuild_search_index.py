@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cinema.search import fts_enabled, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестроение полнотекстового индекса фильмов (SQLite FTS5)'
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError('Полнотекстовый индекс FTS5 доступен только для SQLite')
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'В индекс добавлено фильмов: {count}'))
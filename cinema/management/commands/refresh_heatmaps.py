@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cinema.heatmaps import refresh_heatmaps
+
+
+class Command(BaseCommand):
+    help = 'Обновление тепловых карт залов: покупки, время до сеанса и выручка по каждому месту'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hall',
+            type=int,
+            action='append',
+            help='Только указанные залы (id, можно несколько раз)'
+        )
+
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать карты заново по всем билетам'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        added = refresh_heatmaps(options['hall'], full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено залов: {len(added)}, учтено новых билетов: {sum(added.values())} '
+            f'за {time.perf_counter() - started:.2f} с'
+        ))
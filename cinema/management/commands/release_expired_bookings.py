@@ -0,0 +1,108 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from cinema.models import Ticket
+from cinema.seatmap import apply_seat_changes
+
+
+class Command(BaseCommand):
+    help = 'Освобождение мест по неоплаченным броням (status=booked) старше окна удержания'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hold-minutes',
+            type=int,
+            default=getattr(settings, 'CINEMA_BOOKING_HOLD_MINUTES', 30),
+            help='Сколько минут бронь держит место без оплаты (по умолчанию CINEMA_BOOKING_HOLD_MINUTES)'
+        )
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество билетов в одной транзакции (по умолчанию 500)'
+        )
+
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.05,
+            help='Пауза между пачками в секундах, чтобы не мешать живому трафику (по умолчанию 0.05)'
+        )
+
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Показать, что будет освобождено, без изменения данных'
+        )
+
+    def handle(self, *args, **options):
+        hold_minutes = options['hold_minutes']
+        batch_size = options['batch_size']
+        cutoff = timezone.now() - timedelta(minutes=hold_minutes)
+
+        expired = Ticket.objects.filter(status='booked', created_at__lt=cutoff)
+
+        if options['dry_run']:
+            count = expired.count()
+            self.stdout.write(f'Будет освобождено {count} броней старше {hold_minutes} минут (сухой запуск)')
+            for ticket in expired.order_by('created_at', 'id').select_related('user')[:10]:
+                self.stdout.write(
+                    f'  - ID {ticket.id}: {ticket.user.username}, сеанс #{ticket.screening_id}, '
+                    f'ряд {ticket.seat_row}, место {ticket.seat_number} ({ticket.created_at.strftime("%d.%m.%Y %H:%M")})'
+                )
+            if count > 10:
+                self.stdout.write(f'  ... и еще {count - 10} броней')
+            return
+
+        released_total = 0
+        batches = 0
+        last_key = None
+        while True:
+            # Keyset-итерация по индексу (status, created_at): без OFFSET и без длинных блокировок
+            batch = expired
+            if last_key:
+                last_created, last_id = last_key
+                batch = batch.filter(Q(created_at__gt=last_created) | Q(created_at=last_created, id__gt=last_id))
+            keys = list(batch.order_by('created_at', 'id').values_list('created_at', 'id')[:batch_size])
+            if not keys:
+                break
+            last_key = keys[-1]
+
+            released_total += self._release_batch([pk for _, pk in keys])
+            batches += 1
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Освобождено {released_total} мест по броням старше {hold_minutes} минут ({batches} пачек)'
+            )
+        )
+
+    def _release_batch(self, ids):
+        """Отменить пачку броней одной короткой транзакцией, включая историю и карты мест"""
+        now = timezone.now()
+        with transaction.atomic():
+            # Статус перепроверяется в UPDATE: бронь могли оплатить после выборки
+            updated = Ticket.objects.filter(pk__in=ids, status='booked').update(status='cancelled', updated_at=now)
+            if not updated:
+                return 0
+
+            tickets = list(Ticket.objects.filter(pk__in=ids, status='cancelled', updated_at=now))
+            Ticket.history.bulk_history_create(
+                tickets,
+                update=True,
+                default_change_reason='Бронь не оплачена вовремя',
+                default_date=now
+            )
+            apply_seat_changes(
+                (ticket.screening_id, ticket.seat_row, ticket.seat_number, False) for ticket in tickets
+            )
+        return len(tickets)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from cinema.boxoffice import refresh_box_office
+
+
+class Command(BaseCommand):
+    help = 'Обновление дневной сводки по кассе: пересчет дней, затронутых изменениями билетов и сеансов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересобрать сводку за все время, не глядя на отметку прошлого прогона'
+        )
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки при вставке строк сводки (по умолчанию 1000)'
+        )
+
+    def handle(self, *args, **options):
+        days = refresh_box_office(full=options['full'], batch_size=options['batch_size'])
+        if days is None:
+            self.stdout.write(self.style.SUCCESS('Сводка по кассе пересобрана полностью'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Пересчитано дней показа: {days}'))
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.27 on 2026-10-17 05:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_seatmaps(apps, schema_editor):
+    """Заполнить карты мест для существующих сеансов"""
+    Screening = apps.get_model('cinema', 'Screening')
+    SeatMap = apps.get_model('cinema', 'SeatMap')
+    Ticket = apps.get_model('cinema', 'Ticket')
+
+    for screening in Screening.objects.select_related('hall').iterator():
+        rows = screening.hall.total_rows
+        seats_per_row = screening.hall.total_seats_per_row
+        occupancy = bytearray((rows * seats_per_row + 7) // 8)
+        tickets = Ticket.objects.filter(
+            screening_id=screening.pk,
+            status__in=['booked', 'paid', 'used']
+        ).values_list('seat_row', 'seat_number')
+        for row, seat in tickets:
+            if 1 <= row <= rows and 1 <= seat <= seats_per_row:
+                index = (row - 1) * seats_per_row + seat - 1
+                occupancy[index >> 3] |= 1 << (index & 7)
+        SeatMap.objects.create(
+            screening_id=screening.pk,
+            total_rows=rows,
+            total_seats_per_row=seats_per_row,
+            occupancy=bytes(occupancy)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0004_userprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatMap',
+            fields=[
+                ('screening', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='seatmap', serialize=False, to='cinema.screening', verbose_name='Сеанс')),
+                ('total_rows', models.PositiveIntegerField(verbose_name='Количество рядов')),
+                ('total_seats_per_row', models.PositiveIntegerField(verbose_name='Мест в ряду')),
+                ('occupancy', models.BinaryField(default=bytes, verbose_name='Занятость мест')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Карта мест',
+                'verbose_name_plural': 'Карты мест',
+            },
+        ),
+        migrations.RunPython(build_seatmaps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.27 on 2026-10-17 05:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cinema', '0005_seatmap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seat_row', models.PositiveIntegerField(verbose_name='Ряд')),
+                ('seat_number', models.PositiveIntegerField(verbose_name='Место')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Действует до')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Удержание места',
+                'verbose_name_plural': 'Удержания мест',
+                'ordering': ['expires_at'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='ticket',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='ticket',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'cancelled'), _negated=True), fields=('screening', 'seat_row', 'seat_number'), name='unique_active_ticket_seat'),
+        ),
+        migrations.AddField(
+            model_name='seathold',
+            name='screening',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cinema.screening', verbose_name='Сеанс'),
+        ),
+        migrations.AddField(
+            model_name='seathold',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='seathold',
+            unique_together={('screening', 'seat_row', 'seat_number')},
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:00
+
+from django.db import migrations, models
+
+
+def fill_seat_counters(apps, schema_editor):
+    """Заполнить счетчики мест по картам мест"""
+    Screening = apps.get_model('cinema', 'Screening')
+    SeatMap = apps.get_model('cinema', 'SeatMap')
+
+    for seatmap in SeatMap.objects.iterator():
+        taken = int.from_bytes(bytes(seatmap.occupancy), 'little').bit_count()
+        Screening.objects.filter(pk=seatmap.screening_id).update(
+            seats_sold=taken,
+            seats_free=seatmap.total_rows * seatmap.total_seats_per_row - taken
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0006_seathold'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalscreening',
+            name='seats_free',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Свободно мест'),
+        ),
+        migrations.AddField(
+            model_name='historicalscreening',
+            name='seats_sold',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Занято мест'),
+        ),
+        migrations.AddField(
+            model_name='screening',
+            name='seats_free',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Свободно мест'),
+        ),
+        migrations.AddField(
+            model_name='screening',
+            name='seats_sold',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Занято мест'),
+        ),
+        migrations.RunPython(fill_seat_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Avg, Count, Max, Min
+from django.utils import timezone
+
+
+def fill_movie_stats(apps, schema_editor):
+    """Заполнить статистику фильмов по рецензиям, избранному и предстоящим сеансам"""
+    Movie = apps.get_model('cinema', 'Movie')
+    MovieStats = apps.get_model('cinema', 'MovieStats')
+    Review = apps.get_model('cinema', 'Review')
+    UserFavorite = apps.get_model('cinema', 'UserFavorite')
+    Screening = apps.get_model('cinema', 'Screening')
+
+    stats = {movie_id: MovieStats(movie_id=movie_id) for movie_id in Movie.objects.values_list('pk', flat=True)}
+    reviews = Review.objects.filter(is_approved=True).values('movie_id').annotate(
+        avg_rating=Avg('rating'), reviews_count=Count('id')
+    )
+    for row in reviews:
+        stats[row['movie_id']].avg_rating = round(row['avg_rating'], 2)
+        stats[row['movie_id']].reviews_count = row['reviews_count']
+    for row in UserFavorite.objects.values('movie_id').annotate(favorites_count=Count('id')):
+        stats[row['movie_id']].favorites_count = row['favorites_count']
+    screenings = Screening.objects.filter(is_active=True, start_time__gte=timezone.now()).values('movie_id').annotate(
+        min_price=Min('base_price'), max_price=Max('base_price'), next_start_time=Min('start_time')
+    )
+    for row in screenings:
+        stats[row['movie_id']].min_price = row['min_price']
+        stats[row['movie_id']].max_price = row['max_price']
+        stats[row['movie_id']].next_start_time = row['next_start_time']
+    MovieStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0008_ticket_status_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieStats',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='cinema.movie', verbose_name='Фильм')),
+                ('avg_rating', models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=4, null=True, verbose_name='Средняя оценка зрителей')),
+                ('reviews_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Одобренных рецензий')),
+                ('favorites_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='В избранном')),
+                ('min_price', models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=10, null=True, verbose_name='Минимальная цена сеанса')),
+                ('max_price', models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=10, null=True, verbose_name='Максимальная цена сеанса')),
+                ('next_start_time', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Ближайший сеанс')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Статистика фильма',
+                'verbose_name_plural': 'Статистика фильмов',
+            },
+        ),
+        migrations.RunPython(fill_movie_stats, migrations.RunPython.noop),
+    ]
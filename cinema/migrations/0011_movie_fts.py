@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def create_fts_index(apps, schema_editor):
+    """Полнотекстовый индекс фильмов (только SQLite, rowid = id фильма)"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS cinema_movie_fts USING fts5("
+        "title, original_title, description, country, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO cinema_movie_fts (rowid, title, original_title, description, country) "
+        "SELECT id, replace(replace(title, 'ё', 'е'), 'Ё', 'Е'), "
+        "replace(replace(coalesce(original_title, ''), 'ё', 'е'), 'Ё', 'Е'), "
+        "replace(replace(coalesce(description, ''), 'ё', 'е'), 'Ё', 'Е'), "
+        "replace(replace(coalesce(country, ''), 'ё', 'е'), 'Ё', 'Е') FROM cinema_movie"
+    )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS cinema_movie_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
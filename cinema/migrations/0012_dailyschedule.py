@@ -0,0 +1,30 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0011_movie_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=100, verbose_name='Город')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('document', models.JSONField(default=dict, verbose_name='Афиша')),
+                ('built_at', models.DateTimeField(verbose_name='Собрана')),
+                ('changed_at', models.DateTimeField(verbose_name='Данные изменены')),
+            ],
+            options={
+                'verbose_name': 'Афиша на день',
+                'verbose_name_plural': 'Афиши на день',
+                'ordering': ['city', 'date'],
+                'unique_together': {('city', 'date')},
+            },
+        ),
+    ]
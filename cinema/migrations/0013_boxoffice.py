@@ -0,0 +1,43 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0012_dailyschedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Сводка')),
+                ('value', models.DateTimeField(verbose_name='Учтено до')),
+            ],
+            options={
+                'verbose_name': 'Отметка сводки',
+                'verbose_name_plural': 'Отметки сводок',
+            },
+        ),
+        migrations.CreateModel(
+            name='BoxOfficeDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата показа')),
+                ('tickets_sold', models.PositiveIntegerField(default=0, verbose_name='Продано билетов')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('cinema', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cinema.cinema', verbose_name='Кинотеатр')),
+                ('hall', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cinema.hall', verbose_name='Зал')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cinema.movie', verbose_name='Фильм')),
+            ],
+            options={
+                'verbose_name': 'Касса за день',
+                'verbose_name_plural': 'Касса по дням',
+                'ordering': ['date'],
+                'unique_together': {('date', 'hall', 'movie')},
+            },
+        ),
+    ]
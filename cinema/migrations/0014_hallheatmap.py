@@ -0,0 +1,31 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0013_boxoffice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HallHeatmap',
+            fields=[
+                ('hall', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='heatmap', serialize=False, to='cinema.hall', verbose_name='Зал')),
+                ('total_rows', models.PositiveIntegerField(verbose_name='Количество рядов')),
+                ('total_seats_per_row', models.PositiveIntegerField(verbose_name='Мест в ряду')),
+                ('purchases', models.BinaryField(default=bytes, verbose_name='Покупки места')),
+                ('lead_seconds', models.BinaryField(default=bytes, verbose_name='Сумма времени от покупки до сеанса')),
+                ('revenue', models.BinaryField(default=bytes, verbose_name='Выручка места (копейки)')),
+                ('last_ticket_id', models.BigIntegerField(default=0, verbose_name='Последний учтенный билет')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Тепловая карта зала',
+                'verbose_name_plural': 'Тепловые карты залов',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0014_hallheatmap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScreeningForecast',
+            fields=[
+                ('screening', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='forecast', serialize=False, to='cinema.screening', verbose_name='Сеанс')),
+                ('current_occupancy', models.FloatField(verbose_name='Заполненность сейчас')),
+                ('forecast_occupancy', models.FloatField(db_index=True, verbose_name='Прогноз заполненности')),
+                ('sell_out_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Прогноз распродажи')),
+                ('samples', models.PositiveIntegerField(default=0, verbose_name='Похожих сеансов в истории')),
+                ('basis', models.CharField(blank=True, max_length=50, verbose_name='Основа прогноза')),
+                ('computed_at', models.DateTimeField(verbose_name='Рассчитан')),
+            ],
+            options={
+                'verbose_name': 'Прогноз продаж сеанса',
+                'verbose_name_plural': 'Прогнозы продаж сеансов',
+                'ordering': ['sell_out_at'],
+            },
+        ),
+    ]
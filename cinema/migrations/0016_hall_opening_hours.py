@@ -0,0 +1,34 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:36
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0015_screeningforecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hall',
+            name='closes_at',
+            field=models.TimeField(default=datetime.time(0, 0), verbose_name='Закрытие'),
+        ),
+        migrations.AddField(
+            model_name='hall',
+            name='opens_at',
+            field=models.TimeField(default=datetime.time(10, 0), verbose_name='Открытие'),
+        ),
+        migrations.AddField(
+            model_name='historicalhall',
+            name='closes_at',
+            field=models.TimeField(default=datetime.time(0, 0), verbose_name='Закрытие'),
+        ),
+        migrations.AddField(
+            model_name='historicalhall',
+            name='opens_at',
+            field=models.TimeField(default=datetime.time(10, 0), verbose_name='Открытие'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0016_hall_opening_hours'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='hallheatmap',
+            name='last_ticket_id',
+        ),
+        migrations.AddField(
+            model_name='hallheatmap',
+            name='counted_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Учтены сеансы до'),
+        ),
+    ]
@@ -1,4 +1,7 @@
+from datetime import time
+
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User, AbstractUser
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -46,6 +49,9 @@ class Hall(models.Model):
     total_rows = models.PositiveIntegerField(verbose_name="Количество рядов")
     total_seats_per_row = models.PositiveIntegerField(verbose_name="Мест в ряду")
     schema_image_path = models.CharField(max_length=500, blank=True, verbose_name="Схема зала")
+    # Часы работы для планировщика расписания; закрытие не позже открытия - после полуночи
+    opens_at = models.TimeField(default=time(10, 0), verbose_name="Открытие")
+    closes_at = models.TimeField(default=time(0, 0), verbose_name="Закрытие")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
@@ -117,11 +123,43 @@ class Movie(models.Model):
         verbose_name = "Фильм"
         verbose_name_plural = "Фильмы"
         ordering = ['-release_date', 'title']
+        indexes = [
+            # Каталог: активные фильмы в порядке выхода
+            models.Index(
+                fields=['-release_date', 'title'],
+                condition=Q(is_active=True),
+                name='movie_active_release_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class MovieStats(models.Model):
+    movie = models.OneToOneField(
+        Movie,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name="Фильм"
+    )
+    avg_rating = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True, db_index=True, verbose_name="Средняя оценка зрителей")
+    reviews_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name="Одобренных рецензий")
+    favorites_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name="В избранном")
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, db_index=True, verbose_name="Минимальная цена сеанса")
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, db_index=True, verbose_name="Максимальная цена сеанса")
+    next_start_time = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="Ближайший сеанс")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Статистика фильма"
+        verbose_name_plural = "Статистика фильмов"
+
+    def __str__(self):
+        return f'Статистика фильма #{self.movie_id}'
+
+
 class MovieGenre(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, verbose_name="Фильм")
     genre = models.ForeignKey(Genre, on_delete=models.CASCADE, verbose_name="Жанр")
@@ -169,15 +207,37 @@ class Screening(models.Model):
     language = models.CharField(max_length=50, default='RU', verbose_name="Язык")
     has_subtitles = models.BooleanField(default=False, verbose_name="Субтитры")
     base_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)], verbose_name="Базовая цена")
+    seats_sold = models.PositiveIntegerField(default=0, editable=False, verbose_name="Занято мест")
+    seats_free = models.PositiveIntegerField(default=0, editable=False, db_index=True, verbose_name="Свободно мест")
     is_active = models.BooleanField(default=True, verbose_name="Активен")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
     history = HistoricalRecords()
 
+    # Счетчики мест ведет карта мест (cinema/seatmap.py) в транзакции изменения билета,
+    # обычное сохранение сеанса их не перезаписывает
+    SEAT_COUNTER_FIELDS = ('seats_sold', 'seats_free')
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.seats_free = self.hall.total_rows * self.hall.total_seats_per_row - self.seats_sold
+        elif kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.SEAT_COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def clean(self):
         if self.end_time <= self.start_time:
             raise ValidationError('Время окончания сеанса должно быть позже времени начала')
+        if self.is_active:
+            from .scheduling import conflict_message, find_hall_conflicts
+
+            conflicts = find_hall_conflicts([self], exclude_ids=[self.pk])
+            if conflicts:
+                raise ValidationError({'start_time': conflict_message(conflicts[0])})
 
     class Meta:
         verbose_name = "Сеанс"
@@ -186,6 +246,10 @@ class Screening(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['hall', 'start_time'], name='unique_screening_time'),
         ]
+        indexes = [
+            # Расписание: активные сеансы по времени начала
+            models.Index(fields=['start_time'], condition=Q(is_active=True), name='screening_active_start_idx'),
+        ]
 
     def __str__(self):
         return f'{self.movie.title} - {self.start_time.strftime("%d.%m.%Y %H:%M")}'
@@ -223,12 +287,173 @@ class Ticket(models.Model):
         verbose_name = "Билет"
         verbose_name_plural = "Билеты"
         ordering = ['-created_at']
-        unique_together = ['screening', 'seat_row', 'seat_number']
+        constraints = [
+            # Отмененный билет не занимает место
+            models.UniqueConstraint(
+                fields=['screening', 'seat_row', 'seat_number'],
+                condition=~Q(status='cancelled'),
+                name='unique_active_ticket_seat'
+            ),
+        ]
+        indexes = [
+            # Поиск просроченных броней (release_expired_bookings)
+            models.Index(fields=['status', 'created_at'], name='ticket_status_created_idx'),
+            # Билеты пользователя, новые первыми
+            models.Index(fields=['user', '-created_at'], name='ticket_user_created_idx'),
+        ]
 
     def __str__(self):
         return f'Билет #{self.id}'
 
 
+class SeatHold(models.Model):
+    screening = models.ForeignKey(Screening, on_delete=models.CASCADE, verbose_name="Сеанс")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    seat_row = models.PositiveIntegerField(verbose_name="Ряд")
+    seat_number = models.PositiveIntegerField(verbose_name="Место")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Действует до")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+    class Meta:
+        verbose_name = "Удержание места"
+        verbose_name_plural = "Удержания мест"
+        ordering = ['expires_at']
+        unique_together = ['screening', 'seat_row', 'seat_number']
+
+    def __str__(self):
+        return f'Ряд {self.seat_row}, место {self.seat_number} до {self.expires_at.strftime("%H:%M:%S")}'
+
+
+class SeatMap(models.Model):
+    screening = models.OneToOneField(
+        Screening,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='seatmap',
+        verbose_name="Сеанс"
+    )
+    total_rows = models.PositiveIntegerField(verbose_name="Количество рядов")
+    total_seats_per_row = models.PositiveIntegerField(verbose_name="Мест в ряду")
+    occupancy = models.BinaryField(default=bytes, verbose_name="Занятость мест")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Карта мест"
+        verbose_name_plural = "Карты мест"
+
+    def __str__(self):
+        return f'Карта мест сеанса #{self.screening_id}'
+
+
+class DailySchedule(models.Model):
+    """Готовая афиша города на день: фильм -> кинотеатр -> зал -> сеансы (cinema/afisha.py)"""
+    city = models.CharField(max_length=100, verbose_name="Город")
+    date = models.DateField(verbose_name="Дата")
+    document = models.JSONField(default=dict, verbose_name="Афиша")
+    built_at = models.DateTimeField(verbose_name="Собрана")
+    # Время последнего изменения данных афиши; позже built_at - документ устарел
+    changed_at = models.DateTimeField(verbose_name="Данные изменены")
+
+    class Meta:
+        verbose_name = "Афиша на день"
+        verbose_name_plural = "Афиши на день"
+        ordering = ['city', 'date']
+        unique_together = ['city', 'date']
+
+    def __str__(self):
+        return f'Афиша: {self.city}, {self.date.strftime("%d.%m.%Y")}'
+
+    @property
+    def is_stale(self):
+        return self.changed_at > self.built_at
+
+
+class BoxOfficeDaily(models.Model):
+    """Продажи за день показа по фильму и залу (cinema/boxoffice.py)"""
+    date = models.DateField(verbose_name="Дата показа")
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, verbose_name="Фильм")
+    cinema = models.ForeignKey(Cinema, on_delete=models.CASCADE, verbose_name="Кинотеатр")
+    hall = models.ForeignKey(Hall, on_delete=models.CASCADE, verbose_name="Зал")
+    tickets_sold = models.PositiveIntegerField(default=0, verbose_name="Продано билетов")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Выручка")
+
+    class Meta:
+        verbose_name = "Касса за день"
+        verbose_name_plural = "Касса по дням"
+        ordering = ['date']
+        unique_together = ['date', 'hall', 'movie']
+
+    def __str__(self):
+        return f'Касса {self.date.strftime("%d.%m.%Y")}: фильм #{self.movie_id}, зал #{self.hall_id}'
+
+
+class HallHeatmap(models.Model):
+    """
+    Популярность мест зала по всем проданным билетам (cinema/heatmaps.py):
+    матрицы ряд × место, хранятся байтами массивов NumPy.
+    """
+    hall = models.OneToOneField(
+        Hall,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='heatmap',
+        verbose_name="Зал"
+    )
+    total_rows = models.PositiveIntegerField(verbose_name="Количество рядов")
+    total_seats_per_row = models.PositiveIntegerField(verbose_name="Мест в ряду")
+    purchases = models.BinaryField(default=bytes, verbose_name="Покупки места")
+    lead_seconds = models.BinaryField(default=bytes, verbose_name="Сумма времени от покупки до сеанса")
+    revenue = models.BinaryField(default=bytes, verbose_name="Выручка места (копейки)")
+    # Учтены билеты сеансов, начавшихся не позже этого времени
+    counted_until = models.DateTimeField(null=True, blank=True, verbose_name="Учтены сеансы до")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Тепловая карта зала"
+        verbose_name_plural = "Тепловые карты залов"
+
+    def __str__(self):
+        return f'Тепловая карта зала #{self.hall_id}'
+
+
+class ScreeningForecast(models.Model):
+    """Прогноз итоговой заполненности и времени распродажи предстоящего сеанса (cinema/forecast.py)"""
+    screening = models.OneToOneField(
+        Screening,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='forecast',
+        verbose_name="Сеанс"
+    )
+    current_occupancy = models.FloatField(verbose_name="Заполненность сейчас")
+    forecast_occupancy = models.FloatField(db_index=True, verbose_name="Прогноз заполненности")
+    sell_out_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="Прогноз распродажи")
+    samples = models.PositiveIntegerField(default=0, verbose_name="Похожих сеансов в истории")
+    basis = models.CharField(max_length=50, blank=True, verbose_name="Основа прогноза")
+    computed_at = models.DateTimeField(verbose_name="Рассчитан")
+
+    class Meta:
+        verbose_name = "Прогноз продаж сеанса"
+        verbose_name_plural = "Прогнозы продаж сеансов"
+        ordering = ['sell_out_at']
+
+    def __str__(self):
+        return f'Прогноз сеанса #{self.screening_id}'
+
+
+class RollupWatermark(models.Model):
+    """Момент, до которого изменения уже учтены в сводной таблице"""
+    name = models.CharField(max_length=50, primary_key=True, verbose_name="Сводка")
+    value = models.DateTimeField(verbose_name="Учтено до")
+
+    class Meta:
+        verbose_name = "Отметка сводки"
+        verbose_name_plural = "Отметки сводок"
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
+
+
 class Review(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, verbose_name="Фильм")
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
@@ -247,6 +472,11 @@ class Review(models.Model):
         verbose_name_plural = "Рецензии"
         ordering = ['-created_at']
         unique_together = ['movie', 'user']
+        indexes = [
+            # Рецензии фильма и общая лента, новые первыми
+            models.Index(fields=['movie', 'is_approved', '-created_at'], name='review_movie_approved_idx'),
+            models.Index(fields=['-created_at'], name='review_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.title} - {self.user.username}'
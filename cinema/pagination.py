@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class CountableCursorPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация: страница выбирается условием по первому
+    полю сортировки, поэтому глубокие страницы не дороже первой.
+    id в сортировке делает порядок однозначным при равных значениях; его
+    направление совпадает с порядком rowid в индексах, чтобы SQLite не досортировывал.
+    В курсор DRF попадает только первое поле и смещение среди строк с тем же
+    значением: если граница страницы приходится на серию равных значений
+    (билеты одной покупки, сеансы с одним временем начала), внутри серии
+    строки пропускаются OFFSET. Серии короткие, поэтому это дешево.
+    Общее число строк (COUNT) отдается по умолчанию, клиенты бесконечной
+    ленты отключают его параметром ?count=false.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.with_count = request.query_params.get(self.count_query_param, 'true').lower() not in ('false', '0', 'no')
+        self.total = None
+        if self.with_count:
+            # ConditionalGetMixin уже посчитал строки того же queryset для ETag
+            self.total = getattr(view, 'filtered_count', None)
+            if self.total is None:
+                self.total = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        fields = [('next', self.get_next_link()), ('previous', self.get_previous_link()), ('results', data)]
+        if self.with_count:
+            fields.insert(0, ('count', self.total))
+        return Response(OrderedDict(fields))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return response_schema
+
+
+class TicketCursorPagination(CountableCursorPagination):
+    ordering = ('-created_at', 'id')
+
+
+class ReviewCursorPagination(CountableCursorPagination):
+    ordering = ('-created_at', 'id')
+
+
+class ScreeningCursorPagination(CountableCursorPagination):
+    ordering = ('start_time', 'id')
@@ -0,0 +1,186 @@
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .forecast import HALL_TYPE_CODES, demand_table, hour_band
+from .models import Screening
+from .schedule_import import create_screenings, validate_schedule
+from .scheduling import cleaning_buffer
+
+# Каждый следующий показ фильма в том же кинотеатре, в тот же день и ту же
+# часть дня делит тех же зрителей: ожидаемая заполненность умножается на это
+REPEAT_DECAY = 0.7
+
+BANDS = np.array([hour_band(hour) for hour in range(24)])
+
+
+def hall_days(halls, week_start):
+    """(зал, номер дня, открытие, закрытие) на каждый день недели; закрытие не позже открытия - после полуночи"""
+    days = []
+    for hall in halls:
+        for offset in range(7):
+            day = week_start + timedelta(days=offset)
+            opens = timezone.make_aware(datetime.combine(day, hall.opens_at))
+            closes_day = day if hall.closes_at > hall.opens_at else day + timedelta(days=1)
+            days.append((hall, offset, opens, timezone.make_aware(datetime.combine(closes_day, hall.closes_at))))
+    return days
+
+
+class WeekPlanner:
+    """
+    Жадный планировщик недели на сетке слотов: строка - зал в один день,
+    столбец - шаг step от открытия. Для каждой пары (фильм, зал-день)
+    хранится лучший свободный старт, все пары пересчитываются векторно
+    (cumsum по маске свободных слотов), на каждом шаге ставится глобально
+    лучший показ, после чего пересчитываются только затронутые строки.
+    """
+
+    def __init__(self, targets, halls, week_start, step_minutes=15, now=None):
+        self.step = timedelta(minutes=step_minutes)
+        self.movies = list(targets)
+        self.quotas = np.array([targets[movie] for movie in self.movies], dtype=np.int64)
+        self.days = hall_days(halls, week_start)
+        table, factors = demand_table(now)
+        self.factors = np.array([factors.get(movie.pk, 1.0) for movie in self.movies])
+
+        buffer_slots = math.ceil(cleaning_buffer() / self.step)
+        # Слот вмещает сеанс вместе с уборкой; старт - так, чтобы фильм закончился до закрытия
+        self.lengths = np.array([
+            math.ceil((timedelta(minutes=movie.duration_minutes) + cleaning_buffer()) / self.step)
+            for movie in self.movies
+        ])
+        self.runs = np.array([math.ceil(timedelta(minutes=movie.duration_minutes) / self.step) for movie in self.movies])
+        self.open_slots = np.array([(closes - opens) // self.step for _, _, opens, closes in self.days], dtype=np.int64)
+        self.width = int(self.open_slots.max()) + buffer_slots if self.days else 0
+        slots = np.arange(self.width)
+        self.free = slots[None, :] < (self.open_slots + buffer_slots)[:, None]
+        self._mark_existing(halls)
+
+        minutes = np.array([
+            opens.hour * 60 + opens.minute for _, _, opens, _ in self.days
+        ])[:, None] + slots[None, :] * step_minutes
+        weekdays = (np.array([opens.weekday() for _, _, opens, _ in self.days])[:, None] + minutes // 1440) % 7
+        hours = (minutes // 60) % 24
+        types = np.array([HALL_TYPE_CODES.get(hall.hall_type, len(HALL_TYPE_CODES)) for hall, _, _, _ in self.days])
+        self.demand = table[weekdays, hours, types[:, None]]
+        self.capacity = np.array([hall.total_rows * hall.total_seats_per_row for hall, _, _, _ in self.days])
+        self.bands = BANDS[hours]
+
+        cinemas = {cinema_id: index for index, cinema_id in enumerate(sorted({hall.cinema_id for hall in halls}))}
+        self.groups = np.array([cinemas[hall.cinema_id] * 7 + offset for hall, offset, _, _ in self.days])
+        self.decay = np.ones((len(self.movies), len(cinemas) * 7, len(BANDS)))
+
+    def _mark_existing(self, halls):
+        """Активные сеансы залов за неделю одним запросом - слоты от начала до конца уборки заняты"""
+        if not self.days:
+            return
+        rows = {}
+        for index, (hall, _, _, _) in enumerate(self.days):
+            rows.setdefault(hall.pk, []).append(index)
+        buffer = cleaning_buffer()
+        existing = Screening.objects.filter(
+            hall__in=halls,
+            is_active=True,
+            start_time__lt=max(closes for _, _, _, closes in self.days) + buffer,
+            end_time__gt=min(opens for _, _, opens, _ in self.days) - buffer,
+        ).values_list('hall_id', 'start_time', 'end_time')
+        for hall_id, start_time, end_time in existing:
+            for index in rows[hall_id]:
+                opens = self.days[index][2]
+                first = max(math.floor((start_time - opens) / self.step), 0)
+                last = min(math.ceil((end_time + buffer - opens) / self.step), self.width)
+                if first < last:
+                    self.free[index, first:last] = False
+
+    def best_starts(self, movie, rows):
+        """Лучший свободный старт фильма в строках rows: (ожидаемые зрители, слот); -1 - не помещается"""
+        length = self.lengths[movie]
+        starts = self.width - length + 1
+        if starts <= 0:
+            return np.full(len(rows), -1.0), np.zeros(len(rows), dtype=np.int64)
+        filled = np.zeros((len(rows), self.width + 1), dtype=np.int64)
+        np.cumsum(self.free[rows], axis=1, out=filled[:, 1:])
+        fits = filled[:, length:] - filled[:, :starts] == length
+        fits &= np.arange(starts)[None, :] + self.runs[movie] <= self.open_slots[rows][:, None]
+
+        occupancy = self.demand[rows, :starts] * self.factors[movie]
+        occupancy = occupancy * self.decay[movie, self.groups[rows][:, None], self.bands[rows, :starts]]
+        score = np.where(fits, np.minimum(occupancy, 1) * self.capacity[rows][:, None], -1.0)
+        best = score.argmax(axis=1)
+        return score[np.arange(len(rows)), best], best
+
+    def solve(self):
+        """
+        План: список словарей movie, hall, start_time, end_time, expected_occupancy
+        в порядке выбора. Фильм, которому не хватило места, получает меньше показов.
+        """
+        everything = np.arange(len(self.days))
+        best = np.full((len(self.movies), len(self.days)), -1.0)
+        slot = np.zeros(best.shape, dtype=np.int64)
+        for movie in range(len(self.movies)):
+            if self.quotas[movie] > 0:
+                best[movie], slot[movie] = self.best_starts(movie, everything)
+
+        plan = []
+        while best.size:
+            movie, row = np.unravel_index(best.argmax(), best.shape)
+            if best[movie, row] < 0:
+                break
+            start = int(slot[movie, row])
+            hall, _, opens, _ = self.days[row]
+            start_time = opens + start * self.step
+            plan.append({
+                'movie': self.movies[movie],
+                'hall': hall,
+                'start_time': start_time,
+                'end_time': start_time + timedelta(minutes=self.movies[movie].duration_minutes),
+                'expected_occupancy': float(best[movie, row] / max(self.capacity[row], 1)),
+            })
+
+            self.free[row, start:start + self.lengths[movie]] = False
+            self.quotas[movie] -= 1
+            self.decay[movie, self.groups[row], self.bands[row, start]] *= REPEAT_DECAY
+            if self.quotas[movie] > 0:
+                best[movie], slot[movie] = self.best_starts(movie, everything)
+            else:
+                best[movie] = -1
+            for other in np.flatnonzero(self.quotas > 0):
+                if other != movie:
+                    best[other, row:row + 1], slot[other, row:row + 1] = self.best_starts(other, [row])
+        return plan
+
+
+def plan_week(targets, halls, week_start, step_minutes=15, now=None):
+    """
+    Расписание недели с week_start: targets - {фильм: число показов}, halls - залы
+    с часами работы. Спрос берется из demand_table (день недели, час, тип зала,
+    множитель фильма), уже запланированные сеансы залов не сдвигаются.
+    """
+    return WeekPlanner(targets, list(halls), week_start, step_minutes, now).solve()
+
+
+def save_plan(plan, base_price, user=None):
+    """
+    Сохранить план тем же путем, что и импорт расписания: validate_schedule
+    перепроверяет пересечения, create_screenings пишет пакетом.
+    Возвращает (сеансы, отчет об ошибках); при ошибках ничего не сохраняется.
+    """
+    rows = [
+        {
+            'movie': item['movie'].pk,
+            'hall': item['hall'].pk,
+            'start_time': item['start_time'],
+            'end_time': item['end_time'],
+            'base_price': base_price,
+        }
+        for item in plan
+    ]
+    valid, report = validate_schedule(rows)
+    if report:
+        return [], report
+    screenings = create_screenings(
+        [screening for _, screening in valid], user=user, change_reason='Автоматическое расписание'
+    )
+    return screenings, []
@@ -0,0 +1,113 @@
+import hashlib
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+PRICES_KEY = 'cinema:prices:{}'
+PRICES_TIMEOUT = 24 * 60 * 60
+
+# Правила по умолчанию, настройка CINEMA_PRICING переопределяет отдельные ключи;
+# словари (типы билетов и залов) дополняются, а не заменяются целиком
+DEFAULT_RULES = {
+    'ticket_types': {'adult': '1.00', 'child': '0.70', 'student': '0.80'},
+    'hall_types': {'standard': '1.00', 'imax': '1.30', 'vip': '1.60'},
+    # (доля рядов от экрана, множитель): первые ряды дешевле, середина дороже
+    'row_zones': [(0.25, '0.85'), (0.75, '1.10'), (1.0, '1.00')],
+    # (час начала, множитель) - действует до следующего правила
+    'hours': [(0, '0.80'), (12, '1.00'), (18, '1.15')],
+    'weekend': '1.10',
+    # (доля проданных мест, множитель) - наценка при высокой заполненности
+    'occupancy': [(0.0, '1.00'), (0.6, '1.10'), (0.85, '1.20')],
+    # Шаг округления итоговой цены (рубли)
+    'rounding': '1',
+}
+
+
+def pricing_rules():
+    rules = {**DEFAULT_RULES}
+    for name, value in getattr(settings, 'CINEMA_PRICING', {}).items():
+        default = DEFAULT_RULES.get(name)
+        # Иначе тип билета, пропущенный в настройке, давал бы KeyError при продаже
+        rules[name] = {**default, **value} if isinstance(default, dict) else value
+    return rules
+
+
+def _step(steps, value):
+    """Множитель последнего правила, порог которого не больше value"""
+    factor = '1'
+    for threshold, step_factor in steps:
+        if value >= threshold:
+            factor = step_factor
+    return Decimal(factor)
+
+
+def occupancy_factor(screening, rules):
+    capacity = screening.hall.total_rows * screening.hall.total_seats_per_row
+    return _step(rules['occupancy'], screening.seats_sold / capacity if capacity else 0)
+
+
+def time_factor(screening, rules):
+    start = timezone.localtime(screening.start_time)
+    factor = _step(rules['hours'], start.hour)
+    if start.weekday() >= 5:
+        factor *= Decimal(rules['weekend'])
+    return factor
+
+
+def row_factors(total_rows, rules):
+    """Множитель зоны для каждого ряда (ряд 1 - у экрана)"""
+    factors = []
+    for row in range(1, total_rows + 1):
+        for share, factor in rules['row_zones']:
+            if row <= total_rows * share:
+                break
+        factors.append(Decimal(factor))
+    return factors
+
+
+def build_price_table(base_price, hall_type, total_rows, factor, rules):
+    """{тип билета: [цена ряда 1, цена ряда 2, ...]}"""
+    step = Decimal(rules['rounding'])
+    hall_price = Decimal(base_price) * Decimal(rules['hall_types'].get(hall_type, '1')) * factor
+    rows = row_factors(total_rows, rules)
+    return {
+        ticket_type: [
+            ((hall_price * Decimal(type_factor) * row_factor / step).quantize(Decimal('1'), ROUND_HALF_UP) * step)
+            .quantize(Decimal('0.01'))
+            for row_factor in rows
+        ]
+        for ticket_type, type_factor in rules['ticket_types'].items()
+    }
+
+
+def price_table(screening):
+    """
+    Таблица цен сеанса: тип билета -> цены по рядам. Ключ кэша строится из всего,
+    от чего зависит цена (базовая цена, тип и размер зала, время начала, ступень
+    заполненности, правила), поэтому изменение сеанса или переход заполненности
+    на другую ступень сразу дает новую таблицу, а продажа внутри ступени - нет.
+    Сеанс нужен с загруженным залом; запросов к базе нет.
+    """
+    rules = pricing_rules()
+    hall = screening.hall
+    factor = time_factor(screening, rules) * occupancy_factor(screening, rules)
+    parts = [repr(sorted(rules.items())), str(screening.base_price), hall.hall_type, str(hall.total_rows), str(factor)]
+    key = PRICES_KEY.format(hashlib.md5('|'.join(parts).encode()).hexdigest())
+    table = cache.get(key)
+    if table is None:
+        table = build_price_table(screening.base_price, hall.hall_type, hall.total_rows, factor, rules)
+        cache.set(key, table, PRICES_TIMEOUT)
+    return table
+
+
+def seat_price(screening, seat_row, ticket_type='adult'):
+    """Цена одного места (ряды, которых нет в зале, считаются по последнему ряду)"""
+    prices = price_table(screening)[ticket_type]
+    return prices[min(seat_row, len(prices)) - 1]
+
+
+def prices_payload(screening):
+    """Таблица цен для API: строки вместо Decimal"""
+    return {ticket_type: [str(price) for price in prices] for ticket_type, prices in price_table(screening).items()}
@@ -0,0 +1,153 @@
+import csv
+import io
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from simple_history.utils import bulk_create_with_history
+
+from .afisha import mark_changed
+from .caching import bump_model_version
+from .models import Hall, Movie, Screening, SeatMap
+from .scheduling import conflict_message, find_hall_conflicts
+from .seatmap import SeatBitmap
+from .serializers import ScheduleRowSerializer
+from .stats import refresh_movie_stats
+
+
+def max_rows():
+    """Максимум строк в одном импорте (настройка CINEMA_SCHEDULE_IMPORT_MAX_ROWS)"""
+    return getattr(settings, 'CINEMA_SCHEDULE_IMPORT_MAX_ROWS', 5000)
+
+
+def read_csv(data, encoding='utf-8'):
+    """Строки CSV с заголовком как словари; пустые ячейки считаются не заданными"""
+    try:
+        reader = csv.DictReader(io.StringIO(data.decode(encoding).lstrip('\ufeff')))
+        return [
+            {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+            for row in reader
+        ]
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise ParseError(f'Не удалось прочитать CSV: {exc}')
+
+
+class CSVParser(BaseParser):
+    """Тело запроса text/csv"""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        return read_csv(stream.read(), encoding)
+
+
+def _add_error(errors, number, field, message):
+    errors.setdefault(number, {}).setdefault(field, []).append(message)
+
+
+def validate_schedule(rows):
+    """
+    Проверить строки импорта. Каждая строка проходит ScheduleRowSerializer,
+    остальное проверяется для всех строк сразу: фильмы и залы читаются двумя
+    запросами in_bulk, занятые время и зал - одним запросом на уникальность
+    и одним проходом find_hall_conflicts по всем залам.
+
+    Возвращает ([(номер строки, несохраненный Screening), ...],
+    [{'row': номер, 'errors': {поле: [сообщения]}}, ...]); строки нумеруются с 1.
+    """
+    row_serializer = ScheduleRowSerializer()
+    errors = {}
+    parsed = []
+    for number, row in enumerate(rows, 1):
+        try:
+            parsed.append((number, row_serializer.run_validation(row)))
+        except serializers.ValidationError as exc:
+            detail = exc.detail if isinstance(exc.detail, dict) else {'non_field_errors': exc.detail}
+            errors[number] = {field: [str(message) for message in messages] for field, messages in detail.items()}
+
+    movies = Movie.objects.only('id', 'duration_minutes').in_bulk({data['movie'] for _, data in parsed})
+    halls = Hall.objects.select_related('cinema').in_bulk({data['hall'] for _, data in parsed})
+
+    candidates = []
+    for number, data in parsed:
+        movie, hall = movies.get(data['movie']), halls.get(data['hall'])
+        if movie is None:
+            _add_error(errors, number, 'movie', f'Фильм #{data["movie"]} не найден.')
+        if hall is None:
+            _add_error(errors, number, 'hall', f'Зал #{data["hall"]} не найден.')
+        if movie is None or hall is None:
+            continue
+        if not data.get('end_time'):
+            data['end_time'] = data['start_time'] + timedelta(minutes=movie.duration_minutes)
+        candidates.append((number, Screening(
+            movie=movie,
+            hall=hall,
+            seats_free=hall.total_rows * hall.total_seats_per_row,
+            **{field: value for field, value in data.items() if field not in ('movie', 'hall')}
+        )))
+
+    # Ограничение unique_screening_time действует и для неактивных сеансов
+    taken = set()
+    if candidates:
+        existing = Screening.objects.filter(
+            hall_id__in={screening.hall_id for _, screening in candidates},
+            start_time__gte=min(screening.start_time for _, screening in candidates),
+            start_time__lte=max(screening.start_time for _, screening in candidates),
+        )
+        taken = set(existing.values_list('hall_id', 'start_time'))
+    unique = []
+    for number, screening in candidates:
+        key = (screening.hall_id, screening.start_time)
+        if key in taken:
+            _add_error(errors, number, 'start_time', 'Сеанс в этом зале в это время уже есть.')
+        else:
+            taken.add(key)
+            unique.append((number, screening))
+
+    active = [(number, screening) for number, screening in unique if screening.is_active]
+    conflicts = find_hall_conflicts([screening for _, screening in active])
+    for index, other in conflicts.items():
+        _add_error(errors, active[index][0], 'start_time', conflict_message(other))
+
+    valid = [(number, screening) for number, screening in unique if number not in errors]
+    report = [{'row': number, 'errors': errors[number]} for number in sorted(errors)]
+    return valid, report
+
+
+def create_screenings(screenings, user=None, batch_size=500, change_reason='Импорт расписания'):
+    """
+    Сохранить проверенные сеансы пакетными INSERT в одной транзакции.
+    bulk_create не вызывает сигналов, поэтому их работа сделана здесь же
+    для всего пакета: история, пустые карты мест, статистика фильмов,
+    устаревание афиш и версия кэша сеансов.
+    """
+    with transaction.atomic():
+        screenings = bulk_create_with_history(
+            screenings,
+            Screening,
+            batch_size=batch_size,
+            default_user=user,
+            default_change_reason=change_reason,
+        )
+        SeatMap.objects.bulk_create([
+            SeatMap(
+                screening_id=screening.pk,
+                total_rows=screening.hall.total_rows,
+                total_seats_per_row=screening.hall.total_seats_per_row,
+                occupancy=bytes(SeatBitmap(screening.hall.total_rows, screening.hall.total_seats_per_row).data),
+            )
+            for screening in screenings
+        ], batch_size=batch_size)
+
+        for movie_id in sorted({screening.movie_id for screening in screenings}):
+            refresh_movie_stats(movie_id, 'screenings')
+        mark_changed({
+            (screening.hall.cinema.city, timezone.localdate(screening.start_time))
+            for screening in screenings
+        })
+        bump_model_version(Screening)
+    return screenings
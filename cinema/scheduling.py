@@ -0,0 +1,73 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Screening
+
+
+def cleaning_buffer():
+    """Минимальный перерыв между сеансами в одном зале (уборка)"""
+    return timedelta(minutes=getattr(settings, 'CINEMA_CLEANING_MINUTES', 15))
+
+
+def find_hall_conflicts(candidates, exclude_ids=()):
+    """
+    Пересечения новых сеансов с уже запланированными и друг с другом с учетом уборки.
+
+    candidates - сеансы (в том числе несохраненные) с hall_id, start_time и end_time.
+    Существующие активные сеансы всех затронутых залов читаются одним запросом
+    в пределах окна кандидатов зала, затем в каждом зале интервалы сортируются
+    и проверяются одним проходом: O(n log n) вместо запроса на каждый сеанс.
+    exclude_ids - сохраненные сеансы, которые проверяются заново (редактирование).
+
+    Возвращает {индекс кандидата: сеанс, с которым он пересекается}; сеанс -
+    существующий Screening или другой кандидат.
+    """
+    buffer = cleaning_buffer()
+    by_hall = defaultdict(list)
+    for index, candidate in enumerate(candidates):
+        if candidate.hall_id and candidate.start_time and candidate.end_time:
+            by_hall[candidate.hall_id].append((index, candidate))
+    if not by_hall:
+        return {}
+
+    window = Q()
+    for hall_id, items in by_hall.items():
+        window |= Q(
+            hall_id=hall_id,
+            start_time__lt=max(candidate.end_time for _, candidate in items) + buffer,
+            end_time__gt=min(candidate.start_time for _, candidate in items) - buffer,
+        )
+    existing = defaultdict(list)
+    queryset = Screening.objects.filter(window, is_active=True).exclude(pk__in=[pk for pk in exclude_ids if pk])
+    for screening in queryset.only('id', 'hall_id', 'start_time', 'end_time'):
+        existing[screening.hall_id].append((None, screening))
+
+    conflicts = {}
+    for hall_id, items in by_hall.items():
+        intervals = sorted(existing[hall_id] + items, key=lambda item: (item[1].start_time, item[1].end_time))
+        # Сеанс с самым поздним окончанием среди уже просмотренных
+        latest = None
+        for index, screening in intervals:
+            if latest is not None and screening.start_time < latest[1].end_time + buffer:
+                if index is not None:
+                    conflicts[index] = latest[1]
+                elif latest[0] is not None:
+                    conflicts.setdefault(latest[0], screening)
+            if latest is None or screening.end_time > latest[1].end_time:
+                latest = (index, screening)
+    return conflicts
+
+
+def conflict_message(screening):
+    """Текст ошибки о занятом зале"""
+    buffer_minutes = int(cleaning_buffer().total_seconds() // 60)
+    start = screening.start_time.strftime('%d.%m.%Y %H:%M')
+    end = screening.end_time.strftime('%H:%M')
+    if screening.pk:
+        occupied = f'сеанс #{screening.pk} {start}-{end}'
+    else:
+        occupied = f'другой новый сеанс {start}-{end}'
+    return f'Зал занят: {occupied} (между сеансами нужно {buffer_minutes} мин на уборку)'
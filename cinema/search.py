@@ -0,0 +1,136 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+from rest_framework.pagination import CursorPagination
+
+FTS_TABLE = 'cinema_movie_fts'
+FTS_COLUMNS = ['title', 'original_title', 'description', 'country']
+# Веса колонок для bm25: совпадение в названии важнее, чем в описании
+FTS_WEIGHTS = (10.0, 8.0, 1.0, 2.0)
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def normalize(text):
+    """unicode61 складывает регистр кириллицы, но не считает Ё и Е одной буквой"""
+    return (text or '').replace('ё', 'е').replace('Ё', 'Е')
+
+
+def match_query(terms):
+    """Выражение MATCH: все слова обязательны, каждое ищется по префиксу"""
+    tokens = TOKEN_RE.findall(normalize(' '.join(terms)))
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def index_movie(movie):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [movie.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s)',
+            [movie.pk] + [normalize(getattr(movie, column)) for column in FTS_COLUMNS]
+        )
+
+
+def unindex_movie(movie_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [movie_id])
+
+
+def rebuild_index():
+    """Перестроить полнотекстовый индекс по таблице фильмов"""
+    from .models import Movie
+
+    if not fts_enabled():
+        return 0
+    rows = Movie.objects.values_list('pk', *FTS_COLUMNS).iterator()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s)',
+            [[row[0]] + [normalize(value) for value in row[1:]] for row in rows]
+        )
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def search_movie_ids(terms, limit=None):
+    """id фильмов, подходящих под запрос, от самого релевантного (не больше CINEMA_SEARCH_MAX_RESULTS)"""
+    query = match_query(terms)
+    if not query:
+        return []
+    limit = limit or getattr(settings, 'CINEMA_SEARCH_MAX_RESULTS', 200)
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+            [query, limit]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def matching_movies(terms):
+    """Все подходящие фильмы подзапросом, без ранжирования и ограничения числа"""
+    return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match_query(terms)])
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Поиск по индексу FTS5 вместо LIKE по search_fields: префиксы слов,
+    регистр кириллицы не важен. На других СУБД - обычный SearchFilter.
+    Поле фильма в queryset задается атрибутом представления search_movie_field,
+    поля вне индекса (залы, кинотеатры) - search_like_fields: они ищутся
+    через icontains, и каждое слово должно совпасть с фильмом или любым из них.
+
+    Списки со страничной пагинацией упорядочены по релевантности (явный
+    ?ordering= ее перекрывает) и содержат не больше CINEMA_SEARCH_MAX_RESULTS
+    лучших фильмов. Курсорная пагинация задает свой порядок, поэтому там
+    поиск только фильтрует: фильмы берутся подзапросом, без ограничения.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not fts_enabled():
+            return super().filter_queryset(request, queryset, view)
+
+        movie_field = getattr(view, 'search_movie_field', 'pk')
+        like_fields = getattr(view, 'search_like_fields', ())
+        ranked = not issubclass(getattr(view, 'pagination_class', None) or object, CursorPagination)
+        movie_ids = search_movie_ids(terms) if ranked else []
+
+        if like_fields:
+            # Как в SearchFilter: каждое слово должно совпасть с фильмом или любым из полей
+            for term in terms:
+                condition = Q()
+                if match_query([term]):
+                    condition |= Q(**{f'{movie_field}__in': matching_movies([term])})
+                for field in like_fields:
+                    condition |= Q(**{f'{field}__icontains': term})
+                queryset = queryset.filter(condition)
+        elif not match_query(terms):
+            return queryset.none()
+        elif ranked:
+            queryset = queryset.filter(**{f'{movie_field}__in': movie_ids})
+        else:
+            queryset = queryset.filter(**{f'{movie_field}__in': matching_movies(terms)})
+
+        if not movie_ids:
+            return queryset
+        relevance = Case(
+            *[When(**{movie_field: movie_id}, then=position) for position, movie_id in enumerate(movie_ids)],
+            default=len(movie_ids),
+            output_field=IntegerField()
+        )
+        return queryset.order_by(relevance, *queryset.query.order_by or queryset.model._meta.ordering)
@@ -0,0 +1,237 @@
+import base64
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .events import notify_seat_changes
+from .models import Screening, SeatHold, SeatMap, Ticket
+
+# Статусы билетов, при которых место считается занятым
+ACTIVE_TICKET_STATUSES = ('booked', 'paid', 'used')
+
+
+class SeatBitmap:
+    """
+    Упакованная карта занятости мест: один бит на место, ряды идут подряд.
+    Ряды и места нумеруются с единицы, как в Ticket.
+    """
+
+    def __init__(self, total_rows, total_seats_per_row, data=None):
+        self.total_rows = total_rows
+        self.total_seats_per_row = total_seats_per_row
+        size = (total_rows * total_seats_per_row + 7) // 8
+        if data is not None and len(data) == size:
+            self.data = bytearray(data)
+        else:
+            self.data = bytearray(size)
+
+    @property
+    def capacity(self):
+        return self.total_rows * self.total_seats_per_row
+
+    def contains(self, row, seat):
+        return 1 <= row <= self.total_rows and 1 <= seat <= self.total_seats_per_row
+
+    def _position(self, row, seat):
+        index = (row - 1) * self.total_seats_per_row + (seat - 1)
+        return index >> 3, 1 << (index & 7)
+
+    def is_taken(self, row, seat):
+        if not self.contains(row, seat):
+            return False
+        byte, mask = self._position(row, seat)
+        return bool(self.data[byte] & mask)
+
+    def set(self, row, seat, taken=True):
+        """Отметить место занятым/свободным. Возвращает True, если бит изменился"""
+        if not self.contains(row, seat):
+            return False
+        byte, mask = self._position(row, seat)
+        was_taken = bool(self.data[byte] & mask)
+        if was_taken == taken:
+            return False
+        if taken:
+            self.data[byte] |= mask
+        else:
+            self.data[byte] &= ~mask
+        return True
+
+    def count(self):
+        return int.from_bytes(self.data, 'little').bit_count()
+
+    def taken_seats(self):
+        """Перечислить занятые места как пары (ряд, место)"""
+        for byte_index, value in enumerate(self.data):
+            while value:
+                low = value & -value
+                index = (byte_index << 3) + low.bit_length() - 1
+                yield index // self.total_seats_per_row + 1, index % self.total_seats_per_row + 1
+                value ^= low
+
+    def to_base64(self):
+        return base64.b64encode(bytes(self.data)).decode('ascii')
+
+    def as_int(self):
+        """Вся карта одним целым числом: бит i соответствует месту с индексом i"""
+        return int.from_bytes(self.data, 'little')
+
+    def union(self, other):
+        """Объединение двух карт одного зала (занятые + удерживаемые места)"""
+        merged = SeatBitmap(self.total_rows, self.total_seats_per_row)
+        merged.data = bytearray((self.as_int() | other.as_int()).to_bytes(len(self.data), 'little'))
+        return merged
+
+
+def load_bitmap(seatmap):
+    return SeatBitmap(seatmap.total_rows, seatmap.total_seats_per_row, seatmap.occupancy)
+
+
+def held_bitmap(seatmap):
+    """Карта мест, удерживаемых покупателями (истекшие удержания не учитываются)"""
+    bitmap = SeatBitmap(seatmap.total_rows, seatmap.total_seats_per_row)
+    seats = SeatHold.objects.filter(
+        screening_id=seatmap.screening_id,
+        expires_at__gt=timezone.now()
+    ).values_list('seat_row', 'seat_number')
+    for row, seat in seats:
+        bitmap.set(row, seat)
+    return bitmap
+
+
+def seatmap_payload(seatmap):
+    """Компактное представление карты мест для API"""
+    bitmap = load_bitmap(seatmap)
+    held = held_bitmap(seatmap)
+    taken = bitmap.count()
+    return {
+        'screening': seatmap.screening_id,
+        'total_rows': bitmap.total_rows,
+        'total_seats_per_row': bitmap.total_seats_per_row,
+        'occupancy': bitmap.to_base64(),
+        'held': held.to_base64(),
+        'taken': taken,
+        'free': bitmap.capacity - taken,
+    }
+
+
+def best_contiguous_block(bitmap, size):
+    """
+    Лучший непрерывный блок из size свободных мест в одном ряду.
+    Блок оценивается по удаленности его середины от центра зала,
+    отклонение по рядам весит вдвое больше отклонения по местам.
+    Возвращает список мест [(ряд, место), ...] или пустой список.
+    """
+    rows, per_row = bitmap.total_rows, bitmap.total_seats_per_row
+    if size < 1 or size > per_row:
+        return []
+
+    taken = bitmap.as_int()
+    row_mask = (1 << per_row) - 1
+    block = (1 << size) - 1
+    centre_row = (rows + 1) / 2
+    centre_seat = (per_row + 1) / 2
+
+    best, best_score = None, None
+    for row in range(1, rows + 1):
+        row_bits = (taken >> ((row - 1) * per_row)) & row_mask
+        if row_bits == row_mask:
+            continue
+        row_score = 2 * abs(row - centre_row) / rows
+        for offset in range(per_row - size + 1):
+            if row_bits & (block << offset):
+                continue
+            middle = offset + 1 + (size - 1) / 2
+            score = row_score + abs(middle - centre_seat) / per_row
+            if best_score is None or score < best_score:
+                best, best_score = (row, offset + 1), score
+
+    if best is None:
+        return []
+    row, first = best
+    return [(row, seat) for seat in range(first, first + size)]
+
+
+def build_bitmap(screening_id, total_rows, total_seats_per_row):
+    """Построить карту мест по таблице билетов (только номера мест, без объектов)"""
+    bitmap = SeatBitmap(total_rows, total_seats_per_row)
+    seats = Ticket.objects.filter(
+        screening_id=screening_id,
+        status__in=ACTIVE_TICKET_STATUSES
+    ).values_list('seat_row', 'seat_number')
+    for row, seat in seats:
+        bitmap.set(row, seat)
+    return bitmap
+
+
+def sync_seat_counters(screening_id, bitmap):
+    """Записать счетчики занятых/свободных мест сеанса по карте мест"""
+    taken = bitmap.count()
+    # updated_at меняется вместе со счетчиками: по нему строятся ETag и Last-Modified списка сеансов
+    Screening.objects.filter(pk=screening_id).update(
+        seats_sold=taken,
+        seats_free=bitmap.capacity - taken,
+        updated_at=timezone.now()
+    )
+
+
+def rebuild_seatmap(screening):
+    """Полностью пересобрать карту мест сеанса и счетчики мест"""
+    hall = screening.hall
+    with transaction.atomic():
+        bitmap = build_bitmap(screening.pk, hall.total_rows, hall.total_seats_per_row)
+        seatmap, _ = SeatMap.objects.update_or_create(
+            screening=screening,
+            defaults={
+                'total_rows': hall.total_rows,
+                'total_seats_per_row': hall.total_seats_per_row,
+                'occupancy': bytes(bitmap.data),
+            }
+        )
+        sync_seat_counters(screening.pk, bitmap)
+    return seatmap
+
+
+def get_seatmap(screening):
+    """Карта мест сеанса; если её ещё нет, строится по билетам"""
+    seatmap = SeatMap.objects.filter(screening=screening).first()
+    if seatmap is None:
+        seatmap = rebuild_seatmap(screening)
+    return seatmap
+
+
+def apply_seat_changes(changes):
+    """
+    Инкрементально обновить карты мест и счетчики мест сеансов.
+    changes - итерируемое из кортежей (screening_id, seat_row, seat_number, taken).
+    Для каждого сеанса выполняется одно чтение и две записи в текущей транзакции.
+    Афиши не трогаются: свободные места в них подставляются при чтении.
+    """
+    by_screening = defaultdict(list)
+    for screening_id, row, seat, taken in changes:
+        by_screening[screening_id].append((row, seat, taken))
+
+    with transaction.atomic():
+        for screening_id, seats in by_screening.items():
+            seatmap = SeatMap.objects.select_for_update().filter(screening_id=screening_id).first()
+            if seatmap is None:
+                # Карты еще нет: строим по билетам, изменение в них уже учтено
+                rebuild_seatmap(Screening.objects.select_related('hall').get(pk=screening_id))
+                continue
+            bitmap = load_bitmap(seatmap)
+            changed = [bitmap.set(row, seat, taken) for row, seat, taken in seats]
+            if any(changed):
+                seatmap.occupancy = bytes(bitmap.data)
+                seatmap.save(update_fields=['occupancy', 'updated_at'])
+                sync_seat_counters(screening_id, bitmap)
+                transaction.on_commit(lambda sid=screening_id: notify_seat_changes(sid))
+
+
+def resize_hall_seatmaps(hall):
+    """Пересобрать карты мест сеансов зала, если изменились его размеры"""
+    outdated = SeatMap.objects.filter(screening__hall=hall).exclude(
+        total_rows=hall.total_rows,
+        total_seats_per_row=hall.total_seats_per_row
+    ).select_related('screening__hall')
+    for seatmap in outdated:
+        rebuild_seatmap(seatmap.screening)
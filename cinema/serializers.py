@@ -1,10 +1,14 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 import re
 from .models import (
-    Cinema, Hall, Genre, Person, Movie, Screening,
-    Ticket, Review, UserFavorite, UserProfile
+    Cinema, Hall, Genre, Person, Movie, MovieStats, Screening,
+    Ticket, Review, UserFavorite, UserProfile, SeatHold
 )
+from .pricing import seat_price
+from .scheduling import conflict_message, find_hall_conflicts
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -33,8 +37,15 @@ class PersonSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class MovieStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MovieStats
+        exclude = ['movie']
+
+
 class MovieSerializer(serializers.ModelSerializer):
     genres = GenreSerializer(many=True, read_only=True)
+    stats = MovieStatsSerializer(read_only=True)
 
     class Meta:
         model = Movie
@@ -81,6 +92,15 @@ class HallSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
 
+def validate_base_price(value):
+    """Валидация цены (положительная, не более 100000)"""
+    if value <= 0:
+        raise serializers.ValidationError("Цена должна быть положительной.")
+    if value > 100000:
+        raise serializers.ValidationError("Цена не может превышать 100 000 рублей.")
+    return value
+
+
 class ScreeningSerializer(serializers.ModelSerializer):
     movie_title = serializers.CharField(source='movie.title', read_only=True)
     hall_name = serializers.CharField(source='hall.name', read_only=True)
@@ -91,12 +111,7 @@ class ScreeningSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
     def validate_base_price(self, value):
-        """Валидация цены (положительная, не более 100000)"""
-        if value <= 0:
-            raise serializers.ValidationError("Цена должна быть положительной.")
-        if value > 100000:
-            raise serializers.ValidationError("Цена не может превышать 100 000 рублей.")
-        return value
+        return validate_base_price(value)
 
     def validate(self, data):
         """Комплексная валидация"""
@@ -109,6 +124,48 @@ class ScreeningSerializer(serializers.ModelSerializer):
                     'end_time': 'Время окончания сеанса должно быть позже времени начала.'
                 })
 
+        # Пересечение с другими сеансами зала с учетом уборки
+        instance = self.instance
+        candidate = Screening(
+            pk=instance.pk if instance else None,
+            hall=data.get('hall', instance.hall if instance else None),
+            start_time=start_time or (instance.start_time if instance else None),
+            end_time=end_time or (instance.end_time if instance else None),
+        )
+        is_active = data.get('is_active', instance.is_active if instance else True)
+        if is_active:
+            conflicts = find_hall_conflicts([candidate], exclude_ids=[candidate.pk])
+            if conflicts:
+                raise serializers.ValidationError({'start_time': [conflict_message(conflicts[0])]})
+
+        return data
+
+
+class ScheduleRowSerializer(serializers.Serializer):
+    """
+    Строка импорта расписания. Фильм и зал - id без запроса на строку: их
+    существование и занятость залов проверяются для всего файла сразу
+    (cinema/schedule_import.py). Без end_time сеанс длится столько, сколько фильм.
+    """
+    movie = serializers.IntegerField(min_value=1)
+    hall = serializers.IntegerField(min_value=1)
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField(required=False, allow_null=True)
+    base_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    format = serializers.CharField(max_length=10, default='2D')
+    language = serializers.CharField(max_length=50, default='RU')
+    has_subtitles = serializers.BooleanField(default=False)
+    is_active = serializers.BooleanField(default=True)
+
+    def validate_base_price(self, value):
+        return validate_base_price(value)
+
+    def validate(self, data):
+        end_time = data.get('end_time')
+        if end_time and end_time <= data['start_time']:
+            raise serializers.ValidationError({
+                'end_time': 'Время окончания сеанса должно быть позже времени начала.'
+            })
         return data
 
 
@@ -147,15 +204,10 @@ class TicketSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ticket
         fields = '__all__'
-        read_only_fields = ['created_at', 'updated_at', 'purchased_at']
-
-    def validate_final_price(self, value):
-        """Валидация цены билета"""
-        if value <= 0:
-            raise serializers.ValidationError("Цена билета должна быть положительной.")
-        if value > 100000:
-            raise serializers.ValidationError("Цена билета не может превышать 100 000 рублей.")
-        return value
+        # Цену считает сервер по таблице цен сеанса (cinema/pricing.py)
+        read_only_fields = ['created_at', 'updated_at', 'purchased_at', 'final_price']
+        # Занятость места проверяет ограничение unique_active_ticket_seat при вставке
+        validators = []
 
     def validate(self, data):
         """Комплексная валидация билета"""
@@ -172,20 +224,96 @@ class TicketSerializer(serializers.ModelSerializer):
                     'seat_number': f'Место {seat_number} не существует в зале {hall.name}. Максимум мест в ряду: {hall.total_seats_per_row}'
                 })
 
-            # Проверка, что место не занято (кроме текущего билета при обновлении)
-            existing_ticket = Ticket.objects.filter(
+            # Проверка, что место не удерживается другим пользователем.
+            # Занятость проверяет уникальное ограничение при вставке
+            request = self.context.get('request')
+            holds = SeatHold.objects.filter(
                 screening=screening,
                 seat_row=seat_row,
-                seat_number=seat_number
+                seat_number=seat_number,
+                expires_at__gt=timezone.now()
             )
-            if self.instance:
-                existing_ticket = existing_ticket.exclude(pk=self.instance.pk)
+            if request and request.user.is_authenticated:
+                holds = holds.exclude(user=request.user)
 
-            if existing_ticket.exists():
+            if holds.exists():
                 raise serializers.ValidationError({
-                    'seat_row': f'Место ряд {seat_row}, место {seat_number} уже занято на этот сеанс.'
+                    'seat_row': f'Место ряд {seat_row}, место {seat_number} временно удерживается другим покупателем.'
                 })
 
+        # Цена пересчитывается при смене сеанса, ряда или типа билета, но не статуса
+        priced = {
+            field: data.get(field, getattr(self.instance, field, None))
+            for field in ('screening', 'seat_row', 'ticket_type')
+        }
+        if self.instance is None or any(getattr(self.instance, field) != value for field, value in priced.items()):
+            data['final_price'] = seat_price(
+                priced['screening'], priced['seat_row'], priced['ticket_type'] or 'adult'
+            )
+
+        return data
+
+    def _seat_taken_error(self, validated_data):
+        seat_row = validated_data.get('seat_row', getattr(self.instance, 'seat_row', None))
+        seat_number = validated_data.get('seat_number', getattr(self.instance, 'seat_number', None))
+        return serializers.ValidationError({
+            'seat_row': [f'Место ряд {seat_row}, место {seat_number} уже занято на этот сеанс.']
+        })
+
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise self._seat_taken_error(validated_data)
+
+    def update(self, instance, validated_data):
+        try:
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+        except IntegrityError:
+            raise self._seat_taken_error(validated_data)
+
+
+class SeatSerializer(serializers.Serializer):
+    seat_row = serializers.IntegerField(min_value=1)
+    seat_number = serializers.IntegerField(min_value=1)
+
+
+def validate_hall_seats(value, hall):
+    """Места должны существовать в зале и не повторяться. Возвращает [(ряд, место), ...]"""
+    seats = [(seat['seat_row'], seat['seat_number']) for seat in value]
+    if len(set(seats)) != len(seats):
+        raise serializers.ValidationError("Места в запросе повторяются.")
+    for row, number in seats:
+        if row > hall.total_rows or number > hall.total_seats_per_row:
+            raise serializers.ValidationError(
+                f'Место ряд {row}, место {number} не существует в зале {hall.name}.'
+            )
+    return seats
+
+
+class SeatSelectionSerializer(serializers.Serializer):
+    """Набор мест на сеанс (для удержания и подтверждения)"""
+    seats = SeatSerializer(many=True, required=False)
+    ticket_type = serializers.ChoiceField(choices=Ticket.TICKET_TYPES, default='adult')
+
+    def validate_seats(self, value):
+        return validate_hall_seats(value, self.context['screening'].hall)
+
+
+class BulkPurchaseSerializer(serializers.Serializer):
+    """Покупка нескольких мест на один сеанс одним запросом"""
+    screening = serializers.PrimaryKeyRelatedField(
+        queryset=Screening.objects.filter(is_active=True).select_related('hall')
+    )
+    seats = SeatSerializer(many=True, allow_empty=False, max_length=50)
+    ticket_type = serializers.ChoiceField(choices=Ticket.TICKET_TYPES, default='adult')
+    # Как и в purchase_seats: без статуса покупка оплачена, 'booked' - бронь без оплаты
+    status = serializers.ChoiceField(choices=['booked', 'paid'], default='paid')
+
+    def validate(self, data):
+        data['seats'] = validate_hall_seats(data['seats'], data['screening'].hall)
         return data
 
 
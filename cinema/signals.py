@@ -0,0 +1,243 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.utils import timezone
+from django.dispatch import receiver
+
+from .afisha import day_bounds, mark_changed, schedule_keys
+from .caching import bump_model_version
+from .models import (
+    Cinema, DailySchedule, Genre, Hall, Movie, MovieGenre, MoviePerson, MovieStats, Person,
+    Review, Screening, SeatMap, Ticket, UserFavorite
+)
+from .search import index_movie, unindex_movie
+from .seatmap import (
+    ACTIVE_TICKET_STATUSES, SeatBitmap, apply_seat_changes, rebuild_seatmap, resize_hall_seatmaps
+)
+from .stats import refresh_movie_stats
+from .suggest import index as suggest_index
+
+
+def _occupied_seat(screening_id, seat_row, seat_number, status):
+    """Место, которое занимает билет, или None для отмененного билета"""
+    if status in ACTIVE_TICKET_STATUSES:
+        return screening_id, seat_row, seat_number
+    return None
+
+
+# ============ КАРТА МЕСТ ============
+
+@receiver(post_save, sender=Screening)
+def create_screening_seatmap(sender, instance, created, raw=False, **kwargs):
+    """Пустая карта мест создается вместе с сеансом и пересобирается при смене зала"""
+    if raw:
+        return
+    hall = instance.hall
+    if not created:
+        resized = SeatMap.objects.filter(screening=instance).exclude(
+            total_rows=hall.total_rows,
+            total_seats_per_row=hall.total_seats_per_row
+        )
+        if resized.exists():
+            rebuild_seatmap(instance)
+    else:
+        SeatMap.objects.get_or_create(
+            screening=instance,
+            defaults={
+                'total_rows': hall.total_rows,
+                'total_seats_per_row': hall.total_seats_per_row,
+                'occupancy': bytes(SeatBitmap(hall.total_rows, hall.total_seats_per_row).data),
+            }
+        )
+
+
+@receiver(post_save, sender=Hall)
+def resize_seatmaps(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        resize_hall_seatmaps(instance)
+
+
+@receiver(pre_save, sender=Ticket)
+def remember_ticket_seat(sender, instance, raw=False, **kwargs):
+    """Запоминаем прежнее место билета, чтобы освободить его при изменении"""
+    instance._previous_seat = None
+    if instance.pk and not raw:
+        previous = Ticket.objects.filter(pk=instance.pk).values_list(
+            'screening_id', 'seat_row', 'seat_number', 'status'
+        ).first()
+        if previous:
+            instance._previous_seat = _occupied_seat(*previous)
+
+
+@receiver(post_save, sender=Ticket)
+def update_seatmap_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_seat', None)
+    current = _occupied_seat(instance.screening_id, instance.seat_row, instance.seat_number, instance.status)
+    if previous == current:
+        return
+
+    changes = []
+    if previous:
+        changes.append((*previous, False))
+    if current:
+        changes.append((*current, True))
+    apply_seat_changes(changes)
+
+
+@receiver(post_delete, sender=Ticket)
+def update_seatmap_on_delete(sender, instance, **kwargs):
+    seat = _occupied_seat(instance.screening_id, instance.seat_row, instance.seat_number, instance.status)
+    if seat:
+        apply_seat_changes([(*seat, False)])
+
+
+# ============ СТАТИСТИКА ФИЛЬМОВ ============
+
+@receiver(post_save, sender=Movie)
+def create_movie_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        MovieStats.objects.get_or_create(movie=instance)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def update_review_stats(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_movie_stats(instance.movie_id, 'reviews')
+
+
+@receiver(post_save, sender=UserFavorite)
+@receiver(post_delete, sender=UserFavorite)
+def update_favorite_stats(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_movie_stats(instance.movie_id, 'favorites')
+
+
+@receiver(post_save, sender=Screening)
+@receiver(post_delete, sender=Screening)
+def update_screening_stats(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_movie_stats(instance.movie_id, 'screenings')
+
+
+# ============ ПОЛНОТЕКСТОВЫЙ ПОИСК ============
+
+@receiver(post_save, sender=Movie)
+def update_movie_search_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_movie(instance)
+
+
+@receiver(post_delete, sender=Movie)
+def delete_movie_search_index(sender, instance, **kwargs):
+    unindex_movie(instance.pk)
+
+
+# ============ ПОДСКАЗКИ ПОИСКА ============
+
+# Индекс в памяти правится после коммита: откат не должен оставлять подсказок
+
+@receiver(post_save, sender=Movie)
+def update_movie_suggestions(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: suggest_index.update_movie(instance))
+
+
+@receiver(post_delete, sender=Movie)
+def delete_movie_suggestions(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: suggest_index.remove('movie', pk))
+
+
+@receiver(post_save, sender=Person)
+def update_person_suggestions(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: suggest_index.update_person(instance))
+
+
+@receiver(post_delete, sender=Person)
+def delete_person_suggestions(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: suggest_index.remove('person', pk))
+
+
+# ============ ВЕРСИИ КЭША ОТВЕТОВ ============
+
+# Модели, по версиям которых строятся кэш ответов и ETag/Last-Modified
+VERSIONED_MODELS = [Movie, MovieGenre, MoviePerson, Genre, Person, Cinema, Hall, Screening, Ticket, Review]
+
+
+def bump_cache_version(sender, raw=False, **kwargs):
+    if not raw:
+        bump_model_version(sender)
+
+
+def bump_cache_version_m2m(sender, action, **kwargs):
+    # movie.genres.add() и подобные не вызывают post_save промежуточной модели
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_model_version(sender)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_cache_version, sender=model, dispatch_uid=f'cache_version_save_{model.__name__}')
+    post_delete.connect(bump_cache_version, sender=model, dispatch_uid=f'cache_version_delete_{model.__name__}')
+
+for through in (MovieGenre, MoviePerson):
+    m2m_changed.connect(bump_cache_version_m2m, sender=through, dispatch_uid=f'cache_version_m2m_{through.__name__}')
+
+
+# ============ АФИША ============
+
+def _upcoming_screenings(**filters):
+    start, _ = day_bounds(timezone.localdate())
+    return Screening.objects.filter(start_time__gte=start, **filters)
+
+
+@receiver(pre_save, sender=Screening)
+def remember_screening_schedule(sender, instance, raw=False, **kwargs):
+    # Сеанс могли перенести на другой день или в другой зал: старую афишу тоже нужно обновить
+    instance._previous_schedule_keys = set()
+    if instance.pk and not raw:
+        instance._previous_schedule_keys = schedule_keys(Screening.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Screening)
+def update_screening_schedule(sender, instance, raw=False, **kwargs):
+    if not raw:
+        keys = getattr(instance, '_previous_schedule_keys', set())
+        mark_changed(keys | schedule_keys(Screening.objects.filter(pk=instance.pk)))
+
+
+@receiver(pre_delete, sender=Screening)
+def delete_screening_schedule(sender, instance, **kwargs):
+    mark_changed(schedule_keys(Screening.objects.filter(pk=instance.pk)))
+
+
+@receiver(post_save, sender=Movie)
+def update_movie_schedule(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        mark_changed(schedule_keys(_upcoming_screenings(movie=instance)))
+
+
+@receiver(pre_save, sender=Cinema)
+def remember_cinema_city(sender, instance, raw=False, **kwargs):
+    instance._previous_city = None
+    if instance.pk and not raw:
+        instance._previous_city = Cinema.objects.filter(pk=instance.pk).values_list('city', flat=True).first()
+
+
+@receiver(post_save, sender=Cinema)
+def update_cinema_schedule(sender, instance, created, raw=False, **kwargs):
+    # Название, адрес, активность или город кинотеатра: афиши города с сегодняшнего дня
+    if not created and not raw:
+        cities = {instance.city, getattr(instance, '_previous_city', None)} - {None}
+        DailySchedule.objects.filter(city__in=cities, date__gte=timezone.localdate()).update(
+            changed_at=timezone.now()
+        )
+
+
+@receiver(post_save, sender=Hall)
+def update_hall_schedule(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        mark_changed(schedule_keys(_upcoming_screenings(hall=instance)))
@@ -0,0 +1,141 @@
+import math
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Min
+from django.utils import timezone
+
+from .caching import bump_model_version
+from .models import Movie, MovieStats, Review, Screening, UserFavorite
+
+# Время (unix) самого раннего next_start_time: до него статистика сеансов не устаревает
+STALE_KEY = 'cinema:stats:expires'
+STALE_CHECK_TIMEOUT = 60
+
+STATS_FIELDS = ['avg_rating', 'reviews_count', 'favorites_count', 'min_price', 'max_price', 'next_start_time']
+
+
+def review_stats(movies=None):
+    """Средняя оценка и число одобренных рецензий по фильмам: {movie_id: {...}}"""
+    reviews = Review.objects.filter(is_approved=True)
+    if movies is not None:
+        reviews = reviews.filter(movie_id__in=movies)
+    rows = reviews.values('movie_id').annotate(avg_rating=Avg('rating'), reviews_count=Count('id'))
+    return {
+        row['movie_id']: {
+            'avg_rating': round(row['avg_rating'], 2),
+            'reviews_count': row['reviews_count'],
+        }
+        for row in rows
+    }
+
+
+def favorite_stats(movies=None):
+    favorites = UserFavorite.objects.all()
+    if movies is not None:
+        favorites = favorites.filter(movie_id__in=movies)
+    rows = favorites.values('movie_id').annotate(favorites_count=Count('id'))
+    return {row['movie_id']: {'favorites_count': row['favorites_count']} for row in rows}
+
+
+def screening_stats(movies=None):
+    """Цены и ближайшее время по предстоящим активным сеансам"""
+    screenings = Screening.objects.filter(is_active=True, start_time__gte=timezone.now())
+    if movies is not None:
+        screenings = screenings.filter(movie_id__in=movies)
+    rows = screenings.values('movie_id').annotate(
+        min_price=Min('base_price'),
+        max_price=Max('base_price'),
+        next_start_time=Min('start_time')
+    )
+    return {
+        row['movie_id']: {
+            'min_price': row['min_price'],
+            'max_price': row['max_price'],
+            'next_start_time': row['next_start_time'],
+        }
+        for row in rows
+    }
+
+
+EMPTY_STATS = {
+    'reviews': {'avg_rating': None, 'reviews_count': 0},
+    'favorites': {'favorites_count': 0},
+    'screenings': {'min_price': None, 'max_price': None, 'next_start_time': None},
+}
+
+SOURCES = {
+    'reviews': review_stats,
+    'favorites': favorite_stats,
+    'screenings': screening_stats,
+}
+
+
+def refresh_movie_stats(movie_id, *parts):
+    """
+    Пересчитать части статистики одного фильма ('reviews', 'favorites', 'screenings').
+    Агрегат считается только по строкам этого фильма (индекс по movie_id).
+    Строка статистики создается вместе с фильмом, здесь она только обновляется.
+    """
+    values = {}
+    for part in parts or SOURCES:
+        values.update(SOURCES[part]([movie_id]).get(movie_id, EMPTY_STATS[part]))
+    MovieStats.objects.filter(movie_id=movie_id).update(updated_at=timezone.now(), **values)
+    # Обновление через update() не вызывает сигналов, версию кэша меняем явно
+    bump_model_version(MovieStats)
+    if 'screenings' in (parts or SOURCES):
+        cache.delete(STALE_KEY)
+
+
+def refresh_stale_stats(batch_size=500):
+    """
+    Цены и ближайший сеанс в статистике верны, пока ближайший сеанс не начался,
+    а сигналы сеансов при этом не срабатывают. Перед чтением каталога статистика
+    фильмов, чей next_start_time уже прошел, пересчитывается одним агрегирующим
+    запросом. Самый ранний next_start_time хранится в кэше: до него проверка
+    не делает запросов. Возвращает число пересчитанных фильмов.
+    """
+    now = timezone.now()
+    expires = cache.get(STALE_KEY)
+    if expires is not None and now.timestamp() < expires:
+        return 0
+
+    stale = list(MovieStats.objects.filter(next_start_time__lt=now).values_list('movie_id', flat=True))
+    if stale:
+        collected = screening_stats(stale)
+        MovieStats.objects.bulk_update(
+            [
+                MovieStats(movie_id=movie_id, updated_at=now, **collected.get(movie_id, EMPTY_STATS['screenings']))
+                for movie_id in stale
+            ],
+            ['min_price', 'max_price', 'next_start_time', 'updated_at'],
+            batch_size=batch_size
+        )
+        bump_model_version(MovieStats)
+
+    earliest = MovieStats.objects.aggregate(earliest=Min('next_start_time'))['earliest']
+    # Ограниченный срок: новый сеанс из другого процесса мог сдвинуть самый ранний старт
+    cache.set(STALE_KEY, earliest.timestamp() if earliest else math.inf, STALE_CHECK_TIMEOUT)
+    return len(stale)
+
+
+def rebuild_movie_stats(batch_size=1000):
+    """Полностью пересобрать таблицу статистики: по одному агрегирующему запросу на источник"""
+    collected = {part: source() for part, source in SOURCES.items()}
+    stats = []
+    for movie_id in Movie.objects.values_list('pk', flat=True).iterator():
+        values = {}
+        for part in SOURCES:
+            values.update(collected[part].get(movie_id, EMPTY_STATS[part]))
+        stats.append(MovieStats(movie_id=movie_id, updated_at=timezone.now(), **values))
+
+    MovieStats.objects.bulk_create(
+        stats,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['movie'],
+        update_fields=STATS_FIELDS + ['updated_at']
+    )
+    MovieStats.objects.exclude(movie_id__in=Movie.objects.values('pk')).delete()
+    bump_model_version(MovieStats)
+    cache.delete(STALE_KEY)
+    return len(stats)
@@ -0,0 +1,209 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+
+from .models import Movie, MoviePerson, MovieStats, Person
+
+
+def normalize(text):
+    """Ключ поиска: без регистра, Ё = Е, одиночные пробелы"""
+    return ' '.join((text or '').casefold().replace('ё', 'е').split())
+
+
+def word_keys(text):
+    """Ключи для префиксного поиска с начала каждого слова: 'темный рыцарь' -> ['темный рыцарь', 'рыцарь']"""
+    words = normalize(text).split(' ')
+    return {' '.join(words[index:]) for index in range(len(words)) if words[index]}
+
+
+# Длина префикса корзины: у каждого префикса до этой длины свой список, отсортированный по популярности
+PREFIX_LENGTH = 3
+
+
+def key_prefixes(keys):
+    """Префиксы ключей длиной 1..PREFIX_LENGTH - корзины, в которые попадает подсказка"""
+    return {key[:length] for key in keys for length in range(1, min(len(key), PREFIX_LENGTH) + 1)}
+
+
+def movie_weight(stats):
+    """Популярность фильма по статистике: рецензии, избранное и ближайшие сеансы"""
+    if stats is None:
+        return 1
+    return 1 + stats.reviews_count + 2 * stats.favorites_count + (5 if stats.next_start_time else 0)
+
+
+class SuggestIndex:
+    """
+    Префиксный индекс подсказок в памяти процесса: для каждого префикса ключей
+    длиной до PREFIX_LENGTH - список подсказок от самой популярной. Короткий
+    запрос берет первые limit записей корзины, длинный идет по корзине своих
+    первых букв в том же порядке и останавливается на limit совпадениях.
+    Строится при первом запросе процесса, сигналы сохранения фильмов и персон
+    правят его точечно после коммита. Другие процессы узнают об изменениях при
+    плановой пересборке (CINEMA_SUGGEST_REBUILD_SECONDS): она идет в фоновом
+    потоке, запросы тем временем отвечают по прежнему индексу.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._items = {}
+        self._built_at = None
+        # Правки, пришедшие во время пересборки: None - пересборки нет
+        self._pending = None
+        self._rebuilding = False
+
+    def _max_age(self):
+        return getattr(settings, 'CINEMA_SUGGEST_REBUILD_SECONDS', 600)
+
+    def _ensure_built(self):
+        if self._built_at is None:
+            self.rebuild()
+        elif time.monotonic() - self._built_at > self._max_age():
+            with self._lock:
+                if self._rebuilding:
+                    return
+                self._rebuilding = True
+            threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        finally:
+            self._rebuilding = False
+            # У потока свое соединение с базой
+            connection.close()
+
+    def rebuild(self):
+        with self._lock:
+            self._pending = []
+        items = {}
+        stats = {row.movie_id: row for row in MovieStats.objects.all()}
+        for movie in Movie.objects.filter(is_active=True).only('id', 'title', 'original_title'):
+            items[('movie', movie.pk)] = self._movie_item(movie, stats.get(movie.pk))
+
+        movies_count = dict(
+            MoviePerson.objects.values('person_id').annotate(count=Count('movie_id', distinct=True))
+            .values_list('person_id', 'count')
+        )
+        for person in Person.objects.only('id', 'full_name'):
+            items[('person', person.pk)] = self._person_item(person, movies_count.get(person.pk, 0))
+
+        buckets = {}
+        for (kind, pk), item in items.items():
+            for prefix in key_prefixes(item['keys']):
+                buckets.setdefault(prefix, []).append(self._entry(kind, pk, item))
+        for bucket in buckets.values():
+            bucket.sort()
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._items = items
+            self._buckets = buckets
+            self._built_at = time.monotonic()
+            # Правки, закоммиченные после чтения базы, иначе потерялись бы до следующей пересборки
+            for kind, pk, item in pending:
+                self._remove(kind, pk)
+                if item is not None:
+                    self._add(kind, pk, item)
+
+    @staticmethod
+    def _movie_item(movie, stats):
+        return {
+            'data': {
+                'type': 'movie',
+                'id': movie.pk,
+                'text': movie.title,
+                'original_title': movie.original_title,
+            },
+            'weight': movie_weight(stats),
+            'keys': word_keys(movie.title) | word_keys(movie.original_title),
+        }
+
+    @staticmethod
+    def _person_item(person, movies_count):
+        return {
+            'data': {'type': 'person', 'id': person.pk, 'text': person.full_name},
+            'weight': 1 + movies_count,
+            'keys': word_keys(person.full_name),
+        }
+
+    @staticmethod
+    def _entry(kind, pk, item):
+        """Запись корзины: сортировка по убыванию веса, затем короткие названия раньше"""
+        return (-item['weight'], len(item['data']['text']), kind, pk)
+
+    def _remove(self, kind, pk):
+        item = self._items.pop((kind, pk), None)
+        if item:
+            entry = self._entry(kind, pk, item)
+            for prefix in key_prefixes(item['keys']):
+                bucket = self._buckets.get(prefix, [])
+                position = bisect_left(bucket, entry)
+                if position < len(bucket) and bucket[position] == entry:
+                    del bucket[position]
+                if not bucket:
+                    self._buckets.pop(prefix, None)
+        return item
+
+    def _add(self, kind, pk, item):
+        self._items[(kind, pk)] = item
+        entry = self._entry(kind, pk, item)
+        for prefix in key_prefixes(item['keys']):
+            insort(self._buckets.setdefault(prefix, []), entry)
+
+    def _replace(self, kind, pk, item):
+        """Заменить подсказку (item=None - удалить) и запомнить правку для идущей пересборки"""
+        self._remove(kind, pk)
+        if item is not None:
+            self._add(kind, pk, item)
+        if self._pending is not None:
+            self._pending.append((kind, pk, item))
+
+    def update_movie(self, movie):
+        if self._built_at is None:
+            return
+        stats = MovieStats.objects.filter(movie_id=movie.pk).first()
+        with self._lock:
+            self._replace('movie', movie.pk, self._movie_item(movie, stats) if movie.is_active else None)
+
+    def update_person(self, person):
+        if self._built_at is None:
+            return
+        with self._lock:
+            old = self._items.get(('person', person.pk))
+            item = self._person_item(person, 0)
+            item['weight'] = old['weight'] if old else 1
+            self._replace('person', person.pk, item)
+
+    def remove(self, kind, pk):
+        if self._built_at is None:
+            return
+        with self._lock:
+            self._replace(kind, pk, None)
+
+    def suggest(self, query, limit=10):
+        """Топ-limit подсказок, чьи слова начинаются с query, по убыванию популярности"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        self._ensure_built()
+        with self._lock:
+            bucket = self._buckets.get(prefix[:PREFIX_LENGTH], [])
+            if len(prefix) <= PREFIX_LENGTH:
+                best = [self._items[(kind, pk)] for _, _, kind, pk in bucket[:limit]]
+            else:
+                best = []
+                for _, _, kind, pk in bucket:
+                    item = self._items[(kind, pk)]
+                    if any(key.startswith(prefix) for key in item['keys']):
+                        best.append(item)
+                        if len(best) == limit:
+                            break
+        return [item['data'] for item in best]
+
+
+index = SuggestIndex()
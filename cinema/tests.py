@@ -1,3 +1,1183 @@
-from django.test import TestCase
+import asyncio
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from .models import (
+    Cinema, DailySchedule, Hall, HallHeatmap, Genre, Person, Movie, MovieGenre, MoviePerson, MovieStats,
+    Screening, ScreeningForecast, SeatHold, SeatMap, Ticket, Review, UserFavorite
+)
+from .afisha import REBUILD_LOCK, get_schedule, mark_changed, rebuild_schedule
+from .boxoffice import refresh_box_office
+from .events import hub, seat_state_events
+from .forecast import refresh_forecasts
+from .heatmaps import heatmap_payload, refresh_heatmaps
+from .planner import plan_week, save_plan
+from .pricing import price_table, seat_price
+from .scheduling import find_hall_conflicts
+from .search import FullTextSearchFilter
+from .seatmap import apply_seat_changes, load_bitmap
+from .stats import refresh_stale_stats
+from .suggest import index as suggest_index
+from .urls import router
+
+# Бюджет SQL-запросов на GET-эндпоинт роутера (имя маршрута -> максимум запросов).
+# Число запросов не должно зависеть от количества строк в базе.
+QUERY_BUDGETS = {
+    'movie-list': 4,
+    'movie-detail': 3,
+    'movie-screenings': 4,
+    'movie-reviews': 4,
+    'movie-top-rated': 3,
+    'movie-recent': 3,
+    'cinema-list': 2,
+    'cinema-detail': 1,
+    'cinema-halls': 2,
+    'screening-list': 2,
+    'screening-detail': 2,
+    'screening-tickets': 2,
+    'screening-seatmap': 3,
+    'screening-best-seats': 3,
+    'screening-upcoming': 1,
+    'screening-by-movie': 1,
+    'ticket-list': 2,
+    'ticket-detail': 2,
+    'ticket-my-tickets': 1,
+    'ticket-statistics': 1,
+    'review-list': 2,
+    'review-detail': 2,
+    'genre-list': 2,
+    'genre-detail': 1,
+    'person-list': 2,
+    'person-detail': 1,
+    'hall-list': 2,
+    'hall-detail': 1,
+    'hall-heatmap': 2,
+    'user-list': 2,
+    'user-detail': 1,
+    'user-profile': 1,
+}
+
+# Действия, изменяющие данные: их бюджеты проверяются отдельными тестами
+WRITE_ACTIONS = {
+    'screening-hold', 'screening-release', 'screening-confirm',
+    'ticket-bulk-purchase', 'screening-bulk-import', 'review-approve', 'review-like', 'user-register',
+}
+
+# Дополнительные GET-параметры для действий, которым они обязательны
+QUERY_PARAMS = {
+    'screening-by-movie': lambda test: {'movie_id': test.movie.pk},
+    'screening-best-seats': lambda test: {'count': 3},
+}
+
+
+def router_get_routes():
+    """Все GET-маршруты роутера: [(имя маршрута, basename, detail)]"""
+    routes = []
+    for prefix, viewset, basename in router.registry:
+        routes.append((f'{basename}-list', basename, False))
+        routes.append((f'{basename}-detail', basename, True))
+        for extra_action in viewset.get_extra_actions():
+            routes.append((f'{basename}-{extra_action.url_name}', basename, extra_action.detail))
+    return routes
+
+
+def create_movie(index=0):
+    return Movie.objects.create(
+        title=f'Фильм {index}',
+        duration_minutes=120,
+        release_date=timezone.now().date() - timedelta(days=index),
+        age_rating='12+',
+        poster_url='/posters/test.jpg',
+        imdb_rating=Decimal('8.0'),
+        kinopoisk_rating=Decimal('7.5'),
+    )
+
+
+def create_screening(movie, hall, start_time):
+    return Screening.objects.create(
+        movie=movie,
+        hall=hall,
+        start_time=start_time,
+        end_time=start_time + timedelta(minutes=movie.duration_minutes),
+        base_price=Decimal('400.00'),
+    )
+
+
+class CinemaTestCase(APITestCase):
+    """Кинотеатр с одним залом, фильм и его сеанс завтра"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('test_admin', 'admin@example.com', 'password')
+        cls.cinema = Cinema.objects.create(name='Тестовый', city='Москва', address='ул. Тестовая, д. 1')
+        cls.hall = Hall.objects.create(cinema=cls.cinema, name='Зал 1', total_rows=10, total_seats_per_row=20)
+        cls.movie = create_movie(0)
+        cls.screening = create_screening(cls.movie, cls.hall, timezone.now() + timedelta(days=1))
+
+    def setUp(self):
+        # Кэш ответов и версий моделей живет дольше транзакции теста
+        cache.clear()
+
+
+class QueryBudgetTests(CinemaTestCase):
+    """Количество SQL-запросов каждого эндпоинта не растет с числом строк и укладывается в бюджет"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.seeded = 0
+
+    def seed_screening(self, movie, index):
+        """Сеанс в основном зале через 3 * index часов после основного сеанса"""
+        return create_screening(movie, self.hall, self.screening.start_time + timedelta(hours=3 * index))
+
+    def seed(self, count):
+        """Добавить по count строк каждой сущности со связями"""
+        for index in range(self.seeded + 1, self.seeded + count + 1):
+            user = User.objects.create_user(f'budget_user_{index}', password='password')
+            genre = Genre.objects.create(name=f'Жанр {index}')
+            person = Person.objects.create(full_name=f'Персона {index}')
+            cinema = Cinema.objects.create(name=f'Кинотеатр {index}', city='Москва', address='ул. Тестовая, д. 2')
+            Hall.objects.create(cinema=self.cinema, name=f'Зал {index + 1}', total_rows=8, total_seats_per_row=12)
+            Hall.objects.create(cinema=cinema, name='Основной', total_rows=8, total_seats_per_row=12)
+
+            movie = create_movie(index)
+            MovieGenre.objects.create(movie=movie, genre=genre)
+            MovieGenre.objects.create(movie=self.movie, genre=genre)
+            MoviePerson.objects.create(movie=movie, person=person, role_in_movie='actor')
+            MoviePerson.objects.create(movie=self.movie, person=person, role_in_movie='director')
+
+            screening = self.seed_screening(movie, index)
+            self.seed_screening(self.movie, index + 100)
+
+            Ticket.objects.create(
+                screening=self.screening, user=self.admin,
+                seat_row=index % 10 + 1, seat_number=index // 10 + 1,
+                final_price=Decimal('400.00'), status='paid'
+            )
+            Ticket.objects.create(
+                screening=screening, user=user, seat_row=1, seat_number=1,
+                final_price=Decimal('400.00')
+            )
+            Review.objects.create(
+                movie=self.movie, user=user, rating=8,
+                title='Отзыв', text='Текст отзыва достаточной длины', is_approved=True
+            )
+            Review.objects.create(
+                movie=movie, user=self.admin, rating=7,
+                title='Отзыв', text='Текст отзыва достаточной длины', is_approved=True
+            )
+            UserFavorite.objects.create(user=self.admin, movie=movie)
+        self.seeded += count
+
+    def detail_pk(self, basename):
+        objects = {
+            'movie': self.movie,
+            'cinema': self.cinema,
+            'screening': self.screening,
+            'ticket': Ticket.objects.filter(user=self.admin).first(),
+            'review': Review.objects.filter(movie=self.movie).first(),
+            'genre': Genre.objects.first(),
+            'person': Person.objects.first(),
+            'hall': self.hall,
+            'user': self.admin,
+        }
+        return objects[basename].pk
+
+    def count_queries(self):
+        """Число запросов по каждому GET-маршруту роутера"""
+        # Проверка устаревшей статистики фильмов кэшируется до ближайшего сеанса (MovieStatsTests)
+        refresh_stale_stats()
+        counts = {}
+        for name, basename, detail in router_get_routes():
+            if name in WRITE_ACTIONS:
+                continue
+            url = reverse(name, kwargs={'pk': self.detail_pk(basename)} if detail else None)
+            params = QUERY_PARAMS.get(name, lambda test: {})(self)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, f'{name}: {response.status_code}')
+            counts[name] = len(queries.captured_queries)
+        return counts
+
+    def test_every_route_has_budget(self):
+        routes = {name for name, _, _ in router_get_routes()}
+        missing = routes - set(QUERY_BUDGETS) - WRITE_ACTIONS
+        self.assertFalse(missing, f'Нет бюджета запросов для маршрутов: {sorted(missing)}')
+        stale = set(QUERY_BUDGETS) - routes
+        self.assertFalse(stale, f'Бюджеты для несуществующих маршрутов: {sorted(stale)}')
+
+    def test_query_budgets(self):
+        self.client.force_authenticate(self.admin)
+
+        self.seed(3)
+        small = self.count_queries()
+        # Больше строк, чем помещается на страницу
+        self.seed(25)
+        large = self.count_queries()
+
+        for name, budget in QUERY_BUDGETS.items():
+            with self.subTest(route=name):
+                self.assertEqual(
+                    small[name], large[name],
+                    f'{name}: число запросов растет с количеством строк ({small[name]} -> {large[name]})'
+                )
+                self.assertLessEqual(large[name], budget, f'{name}: превышен бюджет запросов')
+
+    def test_bulk_purchase_queries_do_not_grow_with_seats(self):
+        self.client.force_authenticate(self.admin)
+        counts = []
+        for row, seats in ((5, 2), (6, 8)):
+            payload = {
+                'screening': self.screening.pk,
+                'seats': [{'seat_row': row, 'seat_number': number} for number in range(1, seats + 1)],
+            }
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(reverse('ticket-bulk-purchase'), payload, format='json')
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class ExplainEndpointsTests(CinemaTestCase):
+    """Команда explain_endpoints"""
+
+    def test_every_case_is_explained(self):
+        out = StringIO()
+        # 'а' не совпадает ни с одним фильмом, 'фильм' - с каждым
+        for search in ('а', 'фильм'):
+            with mock.patch.dict(
+                'cinema.management.commands.explain_endpoints.EXTRA_PARAMS',
+                {'movies': [{'search': search}], 'screenings': [{'search': search}]}
+            ):
+                call_command('explain_endpoints', stdout=out)
+        output = out.getvalue()
+        self.assertNotIn('ошибка построения запроса', output)
+        self.assertIn('/api/reviews/', output)
+
+
+class SeatHoldTests(CinemaTestCase):
+    """Удержание мест с TTL и оформление удержанных мест"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user('seat_hold_other', password='password')
+
+    def hold(self, user, *seats):
+        self.client.force_authenticate(user)
+        return self.client.post(
+            reverse('screening-hold', kwargs={'pk': self.screening.pk}),
+            {'seats': [{'seat_row': row, 'seat_number': seat} for row, seat in seats]},
+            format='json'
+        )
+
+    def confirm(self, user, *seats):
+        self.client.force_authenticate(user)
+        return self.client.post(
+            reverse('screening-confirm', kwargs={'pk': self.screening.pk}),
+            {'seats': [{'seat_row': row, 'seat_number': seat} for row, seat in seats]},
+            format='json'
+        )
+
+    def test_held_seat_conflicts_for_other_user(self):
+        self.assertEqual(self.hold(self.admin, (1, 1), (1, 2)).status_code, 201)
+        response = self.hold(self.other, (1, 2), (1, 3))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['seats'], [{'seat_row': 1, 'seat_number': 2}])
+        self.assertFalse(SeatHold.objects.filter(user=self.other).exists())
+
+    @override_settings(CINEMA_SEAT_HOLD_TTL=0)
+    def test_expired_hold_does_not_block(self):
+        self.assertEqual(self.hold(self.admin, (2, 1)).status_code, 201)
+        self.assertEqual(self.hold(self.other, (2, 1)).status_code, 201)
+        self.assertEqual(list(SeatHold.objects.values_list('user', flat=True)), [self.other.pk])
+
+    def test_rehold_extends_own_hold(self):
+        self.assertEqual(self.hold(self.admin, (3, 1)).status_code, 201)
+        SeatHold.objects.update(expires_at=timezone.now() + timedelta(seconds=5))
+        response = self.hold(self.admin, (3, 1))
+        self.assertEqual(response.status_code, 201)
+        hold = SeatHold.objects.get()
+        self.assertEqual(hold.expires_at, response.data['expires_at'])
+        self.assertGreater(hold.expires_at, timezone.now() + timedelta(seconds=60))
+
+    def test_confirm_turns_holds_into_paid_tickets(self):
+        self.assertEqual(self.hold(self.admin, (4, 1), (4, 2)).status_code, 201)
+        response = self.confirm(self.admin, (4, 1), (4, 2))
+        self.assertEqual(response.status_code, 201, response.data)
+        tickets = Ticket.objects.filter(screening=self.screening, user=self.admin)
+        self.assertEqual(sorted(tickets.values_list('seat_row', 'seat_number', 'status')), [
+            (4, 1, 'paid'), (4, 2, 'paid'),
+        ])
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertEqual(Screening.objects.get(pk=self.screening.pk).seats_sold, 2)
+
+    def test_confirm_without_hold_creates_nothing(self):
+        self.assertEqual(self.hold(self.admin, (5, 1)).status_code, 201)
+        response = self.confirm(self.admin, (5, 1), (5, 2))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['seats'], [{'seat_row': 5, 'seat_number': 2}])
+        self.assertFalse(Ticket.objects.filter(screening=self.screening).exists())
+        self.assertEqual(SeatHold.objects.count(), 1)
+
+    def test_purchase_respects_holds_and_clears_own(self):
+        self.assertEqual(self.hold(self.other, (6, 1)).status_code, 201)
+        self.assertEqual(self.hold(self.admin, (6, 2)).status_code, 201)
+        url = reverse('ticket-bulk-purchase')
+        seats = [{'seat_row': 6, 'seat_number': number} for number in (1, 2)]
+        response = self.client.post(url, {'screening': self.screening.pk, 'seats': seats}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+        response = self.client.post(url, {'screening': self.screening.pk, 'seats': seats[1:]}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        # Купленное место больше не числится удержанным
+        self.assertEqual(list(SeatHold.objects.values_list('seat_number', flat=True)), [1])
+
+
+class BulkPurchaseTests(CinemaTestCase):
+    """Покупка нескольких мест одним запросом"""
+
+    def purchase(self, *seats, **extra):
+        return self.client.post(reverse('ticket-bulk-purchase'), {
+            'screening': self.screening.pk,
+            'seats': [{'seat_row': row, 'seat_number': seat} for row, seat in seats],
+            **extra,
+        }, format='json')
+
+    def test_default_status_is_paid(self):
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.purchase((1, 1)).status_code, 201)
+        self.assertEqual(self.purchase((1, 2), status='booked').status_code, 201)
+        tickets = Ticket.objects.filter(screening=self.screening).order_by('seat_number')
+        self.assertEqual([ticket.status for ticket in tickets], ['paid', 'booked'])
+        self.assertIsNotNone(tickets[0].purchased_at)
+        self.assertIsNone(tickets[1].purchased_at)
+
+    def test_conflicting_seat_creates_nothing(self):
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.purchase((7, 5)).status_code, 201)
+        seatmap = SeatMap.objects.get(screening=self.screening)
+        before = (bytes(seatmap.occupancy), Screening.objects.get(pk=self.screening.pk).seats_free)
+
+        response = self.purchase((7, 3), (7, 4), (7, 5), (7, 6))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['seats'], [{'seat_row': 7, 'seat_number': 5}])
+        self.assertEqual(Ticket.objects.filter(screening=self.screening).count(), 1)
+        seatmap.refresh_from_db()
+        after = (bytes(seatmap.occupancy), Screening.objects.get(pk=self.screening.pk).seats_free)
+        self.assertEqual(after, before)
+
+
+class BestSeatsTests(CinemaTestCase):
+    """Подбор лучшего блока мест для группы"""
+
+    def best_seats(self, count):
+        return self.client.get(reverse('screening-best-seats', kwargs={'pk': self.screening.pk}), {'count': count})
+
+    def sell(self, row, seat):
+        Ticket.objects.create(
+            screening=self.screening, user=self.admin, seat_row=row, seat_number=seat,
+            final_price=Decimal('400.00'), status='paid'
+        )
+
+    def seats(self, count):
+        response = self.best_seats(count)
+        self.assertEqual(response.status_code, 200)
+        return [(seat['seat_row'], seat['seat_number']) for seat in response.data['seats']]
+
+    def test_prefers_centre(self):
+        # Зал 10 × 20: центр между рядами 5 и 6 и местами 10 и 11
+        self.assertEqual(self.seats(2), [(5, 10), (5, 11)])
+        self.assertEqual(self.seats(3), [(5, 9), (5, 10), (5, 11)])
+
+    def test_sold_and_held_seats_split_blocks(self):
+        self.sell(5, 11)
+        other = User.objects.create_user('best_seats_other', password='password')
+        self.client.force_authenticate(other)
+        response = self.client.post(
+            reverse('screening-hold', kwargs={'pk': self.screening.pk}),
+            {'seats': [{'seat_row': 6, 'seat_number': 10}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+
+        # Центральные блоки рядов 5 и 6 разбиты проданным и удержанным местами
+        self.assertEqual(self.seats(4), [(5, 7), (5, 8), (5, 9), (5, 10)])
+        self.assertEqual(self.seats(10), [(4, seat) for seat in range(6, 16)])
+
+    def test_count_larger_than_any_block_returns_no_seats(self):
+        # Билет в середине каждого ряда: самый длинный свободный блок - 12 мест
+        for row in range(1, self.hall.total_rows + 1):
+            self.sell(row, 8)
+        self.assertEqual(len(self.seats(12)), 12)
+        self.assertEqual(self.seats(13), [])
+        self.assertEqual(self.seats(self.hall.total_seats_per_row + 1), [])
+
+    def test_invalid_count_is_rejected(self):
+        for count in (0, -2, 'два'):
+            with self.subTest(count=count):
+                self.assertEqual(self.best_seats(count).status_code, 400)
+
+
+class SeatCounterTests(CinemaTestCase):
+    """Счетчики мест сеанса в фильтрах списка"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        small = Hall.objects.create(cinema=cls.cinema, name='Малый зал', total_rows=1, total_seats_per_row=2)
+        cls.small = create_screening(cls.movie, small, cls.screening.start_time)
+
+    def listed(self, **params):
+        response = self.client.get(reverse('screening-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return self.small.pk in {item['id'] for item in response.data['results']}
+
+    def buy(self, seat, status):
+        response = self.client.post(reverse('ticket-bulk-purchase'), {
+            'screening': self.small.pk, 'seats': [{'seat_row': 1, 'seat_number': seat}], 'status': status,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Ticket.objects.get(screening=self.small, seat_number=seat, status=status)
+
+    def test_counters_follow_purchase_cancellation_and_expiry(self):
+        self.client.force_authenticate(self.admin)
+        self.assertTrue(self.listed(available='true'))
+        self.assertTrue(self.listed(min_seats_free=2))
+        # Удержание места не трогает счетчики, поэтому его истечение их не меняет
+        response = self.client.post(
+            reverse('screening-hold', kwargs={'pk': self.small.pk}),
+            {'seats': [{'seat_row': 1, 'seat_number': 1}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(self.listed(min_seats_free=2))
+
+        paid = self.buy(1, 'paid')
+        self.assertFalse(self.listed(min_seats_free=2))
+        self.assertTrue(self.listed(available='true'))
+        booked = self.buy(2, 'booked')
+        self.assertFalse(self.listed(available='true'))
+        self.assertTrue(self.listed(max_seats_free=0))
+
+        paid.status = 'cancelled'
+        paid.save()
+        self.assertTrue(self.listed(available='true'))
+        self.assertFalse(self.listed(min_seats_free=2))
+
+        # Неоплаченная бронь снимается по истечении срока
+        Ticket.objects.filter(pk=booked.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        call_command('release_expired_bookings', pause=0, stdout=StringIO())
+        self.assertTrue(self.listed(min_seats_free=2))
+        self.assertEqual(Screening.objects.get(pk=self.small.pk).seats_free, 2)
+
+
+class SeatEventTests(CinemaTestCase):
+    """Поток изменений карты мест"""
+
+    def test_events_refused_under_wsgi(self):
+        # Тестовый клиент - WSGI: асинхронный поток был бы буферизован целиком
+        url = reverse('screening-events', kwargs={'pk': self.screening.pk})
+        self.assertEqual(self.client.get(url).status_code, 501)
+
+    def test_state_diff(self):
+        now = timezone.now()
+        later = now + timedelta(minutes=5)
+        previous = ({(1, 1)}, {(2, 1): now, (2, 2): now, (3, 1): now})
+        current = ({(1, 1), (2, 1)}, {(2, 2): later, (3, 2): now})
+        self.assertEqual(seat_state_events(previous, current), [
+            {'type': 'purchase', 'seats': [(2, 1)]},
+            {'type': 'hold', 'seats': [(3, 2)], 'expires_at': now.isoformat()},
+            {'type': 'hold', 'seats': [(2, 2)], 'expires_at': later.isoformat()},
+            {'type': 'release', 'seats': [(3, 1)]},
+        ])
+        self.assertEqual(seat_state_events(current, current), [])
+
+    @override_settings(CINEMA_SEAT_EVENTS_POLL=0.05)
+    async def test_hub_polls_changes_of_other_processes(self):
+        subscriber = hub.subscribe(self.screening.pk)
+        _, queue = subscriber
+
+        async def next_event():
+            return await asyncio.wait_for(queue.get(), timeout=5)
+
+        try:
+            # Опрос успевает прочитать исходное состояние
+            await asyncio.sleep(0.2)
+            # В тесте транзакция не коммитится, поэтому on_commit не будит опрос -
+            # как изменение из другого процесса, оно находится опросом базы
+            ticket = await sync_to_async(Ticket.objects.create)(
+                screening=self.screening, user=self.admin, seat_row=1, seat_number=1,
+                final_price=Decimal('400.00'), status='paid'
+            )
+            self.assertEqual(await next_event(), {'type': 'purchase', 'seats': [(1, 1)]})
+
+            hold = await SeatHold.objects.acreate(
+                screening=self.screening, user=self.admin, seat_row=2, seat_number=1,
+                expires_at=timezone.now() + timedelta(seconds=0.3)
+            )
+            self.assertEqual(await next_event(), {
+                'type': 'hold', 'seats': [(2, 1)], 'expires_at': hold.expires_at.isoformat(),
+            })
+            # Удержание истекло само, без запросов пользователя
+            self.assertEqual(await next_event(), {'type': 'release', 'seats': [(2, 1)]})
+
+            await sync_to_async(apply_seat_changes)([(self.screening.pk, ticket.seat_row, ticket.seat_number, False)])
+            self.assertEqual(await next_event(), {'type': 'release', 'seats': [(1, 1)]})
+        finally:
+            hub.unsubscribe(self.screening.pk, subscriber)
+            await asyncio.sleep(0)
+
+
+class ReleaseExpiredBookingsTests(CinemaTestCase):
+    """Команда release_expired_bookings"""
+
+    def book(self, row, seat, status='booked', minutes_ago=60):
+        ticket = Ticket.objects.create(
+            screening=self.screening, user=self.admin, seat_row=row, seat_number=seat,
+            final_price=Decimal('400.00'), status=status
+        )
+        Ticket.objects.filter(pk=ticket.pk).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return ticket
+
+    def release(self, **options):
+        out = StringIO()
+        call_command('release_expired_bookings', pause=0, stdout=out, **options)
+        return out.getvalue()
+
+    def taken_seats(self):
+        return sorted(load_bitmap(SeatMap.objects.get(screening=self.screening)).taken_seats())
+
+    def test_expired_booking_is_released(self):
+        expired = self.book(1, 1)
+        fresh = self.book(1, 2, minutes_ago=5)
+        paid = self.book(1, 3, status='paid')
+        self.assertEqual(Screening.objects.get(pk=self.screening.pk).seats_sold, 3)
+
+        self.assertIn('Освобождено 1 мест', self.release())
+        statuses = dict(Ticket.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            (statuses[expired.pk], statuses[fresh.pk], statuses[paid.pk]), ('cancelled', 'booked', 'paid')
+        )
+        latest = expired.history.first()
+        self.assertEqual((latest.status, latest.history_change_reason), ('cancelled', 'Бронь не оплачена вовремя'))
+        self.assertEqual(self.taken_seats(), [(1, 2), (1, 3)])
+        screening = Screening.objects.get(pk=self.screening.pk)
+        self.assertEqual((screening.seats_sold, screening.seats_free), (2, 198))
+
+    def test_batches_share_created_at(self):
+        # Пачки по два билета, у всех одно время создания: ключ продолжения - (created_at, id)
+        for seat in range(1, 6):
+            self.book(2, seat)
+        Ticket.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertIn('Освобождено 5 мест по броням старше 30 минут (3 пачек)', self.release(batch_size=2))
+        self.assertFalse(Ticket.objects.filter(status='booked').exists())
+        self.assertEqual(self.taken_seats(), [])
+
+
+class SearchTests(CinemaTestCase):
+    """Полнотекстовый поиск фильмов и сеансов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.knight = create_movie(1)
+        cls.knight.title = 'ТЁМНЫЙ РЫЦАРЬ'
+        cls.knight.save()
+        cls.city = create_movie(2)
+        cls.city.title = 'Город'
+        cls.city.description = 'Темный рыцарь охраняет город'
+        cls.city.save()
+
+    def search(self, name, query):
+        response = self.client.get(reverse(name), {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_movie_search_folds_case_and_ranks_title_first(self):
+        self.assertEqual(self.search('movie-list', 'темн рыц'), [self.knight.pk, self.city.pk])
+        self.assertEqual(self.search('movie-list', 'Рыцарь'), [self.knight.pk, self.city.pk])
+        self.assertEqual(self.search('movie-list', 'город'), [self.city.pk])
+        self.assertEqual(self.search('movie-list', 'призрак'), [])
+
+    def test_screening_search_matches_movie_hall_and_cinema(self):
+        knight_screening = create_screening(self.knight, self.hall, self.screening.start_time + timedelta(hours=3))
+        self.assertEqual(self.search('screening-list', 'тёмный'), [knight_screening.pk])
+        self.assertEqual(self.search('screening-list', 'Тестовый'), [self.screening.pk, knight_screening.pk])
+        self.assertEqual(self.search('screening-list', 'Зал 1'), [self.screening.pk, knight_screening.pk])
+        self.assertEqual(self.search('screening-list', 'Тестовый рыцарь'), [knight_screening.pk])
+        self.assertEqual(self.search('screening-list', 'Бюджетный'), [])
+
+    def test_screening_search_filters_once(self):
+        search = mock.patch.object(
+            FullTextSearchFilter, 'filter_queryset', autospec=True, side_effect=FullTextSearchFilter.filter_queryset
+        )
+        with search as filter_queryset:
+            self.assertEqual(self.search('screening-list', 'фильм'), [self.screening.pk])
+        # ETag и страница строятся по одному отфильтрованному queryset
+        self.assertEqual(filter_queryset.call_count, 1)
+
+
+class MovieStatsTests(CinemaTestCase):
+    """Статистика фильмов, обновляемая сигналами"""
+
+    def stats(self):
+        return MovieStats.objects.get(movie=self.movie)
+
+    def test_signals_refresh_stats(self):
+        start = self.screening.start_time
+        self.assertEqual((self.stats().min_price, self.stats().next_start_time), (Decimal('400.00'), start))
+
+        cheaper = create_screening(self.movie, self.hall, start + timedelta(hours=3))
+        cheaper.base_price = Decimal('250.00')
+        cheaper.save()
+        self.assertEqual((self.stats().min_price, self.stats().max_price), (Decimal('250.00'), Decimal('400.00')))
+        cheaper.delete()
+        self.assertEqual(self.stats().min_price, Decimal('400.00'))
+
+        review = Review.objects.create(
+            movie=self.movie, user=self.admin, rating=6, title='Отзыв', text='Текст отзыва достаточной длины'
+        )
+        self.assertEqual(self.stats().reviews_count, 0)
+        review.is_approved = True
+        review.save()
+        self.assertEqual((self.stats().reviews_count, self.stats().avg_rating), (1, Decimal('6.00')))
+
+        UserFavorite.objects.create(user=self.admin, movie=self.movie)
+        self.assertEqual(self.stats().favorites_count, 1)
+        UserFavorite.objects.filter(user=self.admin).delete()
+        self.assertEqual(self.stats().favorites_count, 0)
+
+    def test_started_screening_is_dropped_before_reading(self):
+        url = reverse('movie-list')
+        self.assertEqual(self.client.get(url, {'has_screenings': 'true'}).data['count'], 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(refresh_stale_stats(), 0)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+        # Сеанс начался: сигналов нет, статистика пересчитывается при следующем чтении каталога
+        later = self.screening.start_time + timedelta(minutes=1)
+        with mock.patch('cinema.stats.timezone.now', return_value=later):
+            self.assertEqual(self.client.get(url, {'has_screenings': 'true'}).data['count'], 0)
+        self.assertEqual((self.stats().min_price, self.stats().next_start_time), (None, None))
+
+
+class SuggestTests(CinemaTestCase):
+    """Подсказки при наборе"""
+
+    def test_suggest_makes_no_queries(self):
+        for index in range(1, 4):
+            create_movie(index)
+        Person.objects.create(full_name='Персона 1')
+        # Индекс общий для процесса: пересобираем его по данным этого теста
+        suggest_index.rebuild()
+        url = reverse('suggest')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'q': 'фильм 1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries.captured_queries), 0)
+        self.assertEqual(response.data[0]['text'], 'Фильм 1')
+
+    def test_suggest_orders_by_popularity(self):
+        favorites = {'Тень': 0, 'Тёмная вода': 3, 'Темный рыцарь': 1, 'Город теней': 0}
+        for index, (title, count) in enumerate(favorites.items(), start=1):
+            movie = create_movie(index)
+            movie.title = title
+            movie.save()
+            MovieStats.objects.filter(movie=movie).update(favorites_count=count)
+        suggest_index.rebuild()
+
+        def titles(query, limit=10):
+            return [item['text'] for item in suggest_index.suggest(query, limit)]
+
+        self.assertEqual(titles('т', 2), ['Тёмная вода', 'Темный рыцарь'])
+        self.assertEqual(titles('тем'), ['Тёмная вода', 'Темный рыцарь'])
+        # Равный вес: короткое название раньше
+        self.assertEqual(titles('тен'), ['Тень', 'Город теней'])
+        self.assertEqual(titles('тень'), ['Тень'])
+        self.assertEqual(titles('темный р'), ['Темный рыцарь'])
+
+    def test_index_changes_after_commit_only(self):
+        suggest_index.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Person.objects.create(full_name='Призрачный Актер')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(suggest_index.suggest('призр'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            person = Person.objects.create(full_name='Призрачный Актер')
+        self.assertEqual(suggest_index.suggest('призр'), [{'type': 'person', 'id': person.pk, 'text': person.full_name}])
+
+    @override_settings(CINEMA_SUGGEST_REBUILD_SECONDS=0)
+    def test_stale_index_rebuilds_in_background(self):
+        suggest_index.rebuild()
+        with mock.patch('cinema.suggest.threading.Thread') as thread:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(suggest_index.suggest('фильм 0')[0]['id'], self.movie.pk)
+        self.assertEqual(len(queries.captured_queries), 0)
+        thread.assert_called_once_with(target=suggest_index._rebuild_in_background, daemon=True)
+        suggest_index._rebuilding = False
+
+
+class CursorPaginationTests(CinemaTestCase):
+    """Курсорная пагинация списков"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Больше строк, чем помещается на страницу
+        for index in range(1, 26):
+            start_time = cls.screening.start_time + timedelta(hours=3 * index)
+            create_screening(cls.movie, cls.hall, start_time)
+            Ticket.objects.create(
+                screening=cls.screening, user=cls.admin, seat_row=index % 10 + 1, seat_number=index // 10 + 1,
+                final_price=Decimal('400.00'), status='paid'
+            )
+            Review.objects.create(
+                movie=create_movie(index), user=cls.admin, rating=7,
+                title='Отзыв', text='Текст отзыва достаточной длины', is_approved=True
+            )
+
+    def test_cursor_pages_cost_the_same(self):
+        self.client.force_authenticate(self.admin)
+        for name in ('ticket-list', 'review-list', 'screening-list'):
+            with self.subTest(route=name):
+                url = f'{reverse(name)}?page_size=5&count=false'
+                counts = []
+                seen = set()
+                while url:
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.get(url)
+                    self.assertNotIn('count', response.data)
+                    counts.append(len(queries.captured_queries))
+                    seen.update(item['id'] for item in response.data['results'])
+                    url = response.data['next']
+                self.assertGreater(len(counts), 2)
+                self.assertEqual(len(set(counts)), 1, f'{name}: {counts}')
+                self.assertEqual(len(seen), self.client.get(reverse(name)).data['count'])
+
+
+class ResponseCacheTests(CinemaTestCase):
+    """Кэш ответов каталога и условные GET"""
+
+    def test_catalogue_cache_is_invalidated_on_change(self):
+        url = reverse('genre-list')
+        movie_url = reverse('movie-detail', kwargs={'pk': self.movie.pk})
+        genre = Genre.objects.create(name='Драма')
+        self.client.get(url)
+        self.assertEqual(self.client.get(movie_url).data['genres'], [])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+        genre.name = 'Комедия'
+        genre.save()
+        self.movie.genres.add(genre)
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['name'], 'Комедия')
+        response = self.client.get(movie_url)
+        self.assertEqual([item['name'] for item in response.data['genres']], ['Комедия'])
+
+    def test_conditional_get_returns_not_modified(self):
+        self.client.force_authenticate(self.admin)
+        for name, budget in (('movie-list', 0), ('screening-list', 1)):
+            with self.subTest(route=name):
+                url = reverse(name)
+                response = self.client.get(url)
+                etag = response['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertLessEqual(len(queries.captured_queries), budget)
+
+        # Продажа места меняет счетчики сеанса, список сеансов должен отдаться заново
+        url = reverse('screening-list')
+        etag = self.client.get(url)['ETag']
+        response = self.client.post(reverse('ticket-bulk-purchase'), {
+            'screening': self.screening.pk,
+            'seats': [{'seat_row': 9, 'seat_number': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AfishaTests(CinemaTestCase):
+    """Готовые афиши городов"""
+
+    def test_afisha_is_read_in_two_queries_and_tracks_seats(self):
+        self.client.force_authenticate(self.admin)
+        url = reverse('afisha')
+        day = timezone.localdate(self.screening.start_time)
+        params = {'city': 'Москва', 'date': day.isoformat()}
+
+        def seats_free():
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            return {
+                screening['id']: screening['seats_free']
+                for movie in response.data['movies']
+                for cinema in movie['cinemas']
+                for hall in cinema['halls']
+                for screening in hall['screenings']
+            }[self.screening.pk]
+
+        before = seats_free()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, params)
+        self.assertEqual(len(queries.captured_queries), 2)
+
+        # Продажа не делает афишу устаревшей: места подставляются при чтении без пересборки
+        built_at = DailySchedule.objects.get(city='Москва', date=day).built_at
+        response = self.client.post(reverse('ticket-bulk-purchase'), {
+            'screening': self.screening.pk,
+            'seats': [{'seat_row': 9, 'seat_number': 1}, {'seat_row': 9, 'seat_number': 2}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(seats_free(), before - 2)
+        schedule = DailySchedule.objects.get(city='Москва', date=day)
+        self.assertEqual((schedule.built_at, schedule.is_stale), (built_at, False))
+
+    def test_invalid_date_is_rejected(self):
+        for date in ('2024-13-45', '2024-02-30', '24-1-1', 'завтра'):
+            with self.subTest(date=date):
+                response = self.client.get(reverse('afisha'), {'city': 'Москва', 'date': date})
+                self.assertEqual(response.status_code, 400)
+
+    def test_concurrent_rebuild_serves_previous_document(self):
+        day = timezone.localdate(self.screening.start_time)
+        schedule = rebuild_schedule('Москва', day)
+        Screening.objects.filter(pk=self.screening.pk).update(base_price=Decimal('999.00'))
+        mark_changed({('Москва', day)})
+
+        # Другой запрос уже пересобирает эту афишу
+        cache.add(REBUILD_LOCK.format('Москва', day.isoformat()), True)
+        self.assertEqual(get_schedule('Москва', day).built_at, schedule.built_at)
+        cache.clear()
+        prices = get_schedule('Москва', day).document['movies'][0]['cinemas'][0]['halls'][0]['screenings']
+        self.assertEqual(prices[0]['base_price'], '999.00')
+
+
+class ScheduleTests(CinemaTestCase):
+    """Пересечения сеансов и импорт расписания"""
+
+    def test_hall_conflicts_respect_cleaning_buffer(self):
+        self.client.force_authenticate(self.admin)
+        start = self.screening.end_time
+        for offset, expected in ((-30, 400), (10, 400), (15, 201)):
+            with self.subTest(offset=offset):
+                start_time = start + timedelta(minutes=offset)
+                response = self.client.post(reverse('screening-list'), {
+                    'movie': self.movie.pk,
+                    'hall': self.hall.pk,
+                    'start_time': start_time.isoformat(),
+                    'end_time': (start_time + timedelta(minutes=90)).isoformat(),
+                    'base_price': '350.00',
+                }, format='json')
+                self.assertEqual(response.status_code, expected, response.data)
+
+        # Неделя сеансов проверяется одним запросом, пересечения внутри пачки тоже находятся
+        first = timezone.now() + timedelta(days=30)
+        candidates = [
+            Screening(hall=self.hall, movie=self.movie, start_time=first + timedelta(hours=3 * index),
+                      end_time=first + timedelta(hours=3 * index, minutes=150))
+            for index in range(56)
+        ]
+        candidates.append(Screening(hall=self.hall, movie=self.movie, start_time=first + timedelta(hours=1),
+                                    end_time=first + timedelta(hours=2)))
+        with CaptureQueriesContext(connection) as queries:
+            conflicts = find_hall_conflicts(candidates)
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertEqual(set(conflicts), {56})
+
+    def test_bulk_schedule_import(self):
+        self.client.force_authenticate(self.admin)
+        url = reverse('screening-bulk-import')
+        first = timezone.now() + timedelta(days=40)
+
+        def rows(count, day=0):
+            return [
+                {
+                    'movie': self.movie.pk,
+                    'hall': self.hall.pk,
+                    'start_time': (first + timedelta(days=day, hours=3 * index)).isoformat(),
+                    'base_price': '350.00',
+                }
+                for index in range(count)
+            ]
+
+        # Ошибки по строкам, ничего не сохраняется
+        broken = rows(3)
+        broken[0]['base_price'] = '0'
+        broken[1]['hall'] = 999999
+        broken.append(dict(broken[2]))  # тот же зал и время
+        response = self.client.post(url, broken, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['row'] for error in response.data['errors']], [1, 2, 4])
+        self.assertIn('base_price', response.data['errors'][0]['errors'])
+        self.assertFalse(Screening.objects.filter(start_time__gte=first).exists())
+
+        # partial сохраняет корректные строки
+        response = self.client.post(f'{url}?partial=true', broken, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 1)
+
+        # Число запросов не зависит от числа строк; побочные эффекты сигналов выполнены
+        counts = []
+        for day, count in ((10, 5), (20, 50)):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(url, {'screenings': rows(count, day)}, format='json')
+            self.assertEqual(response.status_code, 201, response.data)
+            counts.append(len(queries.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+        created = Screening.objects.filter(pk__in=response.data['ids'])
+        capacity = self.hall.total_rows * self.hall.total_seats_per_row
+        self.assertEqual(created.filter(seats_free=capacity, end_time__isnull=False).count(), 50)
+        self.assertEqual(SeatMap.objects.filter(screening__in=created).count(), 50)
+        self.assertEqual(Screening.history.filter(id__in=response.data['ids']).count(), 50)
+
+        # CSV в теле запроса
+        header = 'movie,hall,start_time,base_price,format\n'
+        start = (first + timedelta(days=30)).isoformat()
+        response = self.client.post(
+            url, f'{header}{self.movie.pk},{self.hall.pk},{start},300,3D\n', content_type='text/csv'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Screening.objects.get(pk=response.data['ids'][0]).format, '3D')
+
+
+class PricingTests(CinemaTestCase):
+    """Цены билетов"""
+
+    def test_ticket_price_is_computed_by_server(self):
+        table = price_table(self.screening)
+        self.assertEqual(len(table['adult']), self.hall.total_rows)
+        self.assertLess(table['child'][5], table['adult'][5])
+        self.assertLess(table['adult'][0], table['adult'][5])
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.post(reverse('ticket-list'), {
+            'screening': self.screening.pk, 'user': self.admin.pk,
+            'seat_row': 6, 'seat_number': 1, 'ticket_type': 'student', 'final_price': '1.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Decimal(response.data['final_price']), seat_price(self.screening, 6, 'student'))
+
+        response = self.client.get(reverse('screening-seatmap', kwargs={'pk': self.screening.pk}))
+        self.assertEqual(response.data['prices']['adult'][5], str(table['adult'][5]))
+
+        # Высокая заполненность дает другую таблицу с наценкой
+        Screening.objects.filter(pk=self.screening.pk).update(seats_sold=190)
+        full = Screening.objects.select_related('hall').get(pk=self.screening.pk)
+        self.assertGreater(price_table(full)['adult'][5], table['adult'][5])
+
+    @override_settings(CINEMA_PRICING={'ticket_types': {'child': '0.50'}})
+    def test_partial_override_keeps_other_ticket_types(self):
+        table = price_table(self.screening)
+        self.assertEqual(set(table), {'adult', 'child', 'student'})
+        self.assertEqual(table['child'][5], (table['adult'][5] / 2).quantize(Decimal('1')))
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.post(reverse('ticket-list'), {
+            'screening': self.screening.pk, 'user': self.admin.pk,
+            'seat_row': 6, 'seat_number': 2, 'ticket_type': 'student',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+
+class BoxOfficeTests(CinemaTestCase):
+    """Сводка по кассе"""
+
+    def test_box_office_rollup_is_incremental(self):
+        self.client.force_authenticate(self.admin)
+        url = reverse('box-office')
+        for seat in range(1, 4):
+            Ticket.objects.create(
+                screening=self.screening, user=self.admin, seat_row=1, seat_number=seat,
+                final_price=Decimal('300.00'), status='paid'
+            )
+        self.assertIsNone(refresh_box_office())
+
+        day = timezone.localdate(self.screening.start_time)
+        params = {'date_from': day.isoformat(), 'date_to': day.isoformat(), 'group_by': 'movie,hall'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(len(queries.captured_queries), 1)
+        row = response.data['results'][0]
+        self.assertEqual((row['tickets_sold'], row['revenue'], row['average_price']), (3, '900.00', '300.00'))
+
+        # Следующий прогон пересчитывает только день показа отмененного билета
+        ticket = Ticket.objects.filter(screening=self.screening).first()
+        ticket.status = 'cancelled'
+        ticket.save()
+        self.assertEqual(refresh_box_office(), 1)
+        self.assertEqual(refresh_box_office(), 0)
+        response = self.client.get(url, params)
+        self.assertEqual(response.data['results'][0]['tickets_sold'], 2)
+
+        self.assertEqual(self.client.get(url, {'group_by': 'week'}).status_code, 400)
+        for params in ({'date_from': '2024-02-30'}, {'date_to': '2024-13-45'}, {'date_from': '01.02.2024'}):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(next(iter(params)), response.data['error'])
+        self.client.force_authenticate(User.objects.create_user('box_office_user', password='password'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class HeatmapTests(CinemaTestCase):
+    """Тепловые карты залов"""
+
+    def test_hall_heatmap_accumulates_incrementally(self):
+        self.client.force_authenticate(self.admin)
+        sold = [(1, 1, 'paid'), (1, 1, 'cancelled'), (3, 5, 'paid'), (3, 6, 'used'), (2, 2, 'booked')]
+        for row, seat, status in sold:
+            Ticket.objects.create(
+                screening=self.screening, user=self.admin, seat_row=row, seat_number=seat,
+                final_price=Decimal('250.50'), status=status
+            )
+        # Билеты учитываются, когда с начала сеанса прошел срок брони
+        start_time = timezone.now() - timedelta(minutes=10)
+        Screening.objects.filter(pk=self.screening.pk).update(start_time=start_time, end_time=start_time)
+        self.assertEqual(refresh_heatmaps([self.hall.pk]), {self.hall.pk: 0})
+        with mock.patch('cinema.heatmaps.timezone.now', return_value=timezone.now() + timedelta(hours=1)):
+            self.assertEqual(refresh_heatmaps([self.hall.pk]), {self.hall.pk: 3})
+            self.assertEqual(refresh_heatmaps([self.hall.pk]), {self.hall.pk: 0})
+
+        response = self.client.get(reverse('hall-heatmap', kwargs={'pk': self.hall.pk}))
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.assertEqual(data['tickets'], 3)
+        self.assertEqual((data['purchases'][0][0], data['purchases'][2][4], data['purchases'][1][1]), (1, 1, 0))
+        self.assertEqual(data['revenue'][2][5], 250.5)
+        self.assertIsNone(data['avg_hours_before_start'][1][1])
+        self.assertEqual(data['row_purchases'][:3], [1, 0, 2])
+
+    def test_late_paid_ticket_is_counted(self):
+        screening = create_screening(self.movie, self.hall, timezone.now() - timedelta(minutes=10))
+        booked, cancelled = [
+            Ticket.objects.create(
+                screening=screening, user=self.admin, seat_row=4, seat_number=seat,
+                final_price=Decimal('400.00'), status=status
+            )
+            for seat, status in ((1, 'booked'), (2, 'paid'))
+        ]
+        self.assertEqual(refresh_heatmaps([self.hall.pk]), {self.hall.pk: 0})
+
+        # Бронь с меньшим id оплачена, а билет с большим отменен после прогона
+        booked.status = 'paid'
+        booked.save()
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        with mock.patch('cinema.heatmaps.timezone.now', return_value=timezone.now() + timedelta(hours=1)):
+            self.assertEqual(refresh_heatmaps([self.hall.pk]), {self.hall.pk: 1})
+        purchases = heatmap_payload(HallHeatmap.objects.get(hall=self.hall))['purchases']
+        self.assertEqual(purchases[3][:2], [1, 0])
+
+
+class ForecastTests(CinemaTestCase):
+    """Прогноз распродажи"""
+
+    def test_sellout_forecast_follows_similar_screenings(self):
+        now = timezone.now()
+        start = self.screening.start_time
+        capacity = self.hall.total_rows * self.hall.total_seats_per_row
+
+        def sell(screening, seats, hours_before):
+            ids = [
+                Ticket.objects.create(
+                    screening=screening, user=self.admin, seat_row=index // 20 + 1, seat_number=index % 20 + 1,
+                    final_price=Decimal('400.00'), status='paid'
+                ).pk
+                for index in seats
+            ]
+            Ticket.objects.filter(pk__in=ids).update(created_at=screening.start_time - timedelta(hours=hours_before))
+
+        # Прошлые сеансы того же фильма и времени: половина зала за двое суток, остальное за два часа
+        for weeks in range(1, 4):
+            past_start = start - timedelta(weeks=weeks)
+            past = Screening.objects.create(
+                movie=self.movie, hall=self.hall, start_time=past_start,
+                end_time=past_start + timedelta(minutes=120), base_price=Decimal('400.00'),
+            )
+            sell(past, range(capacity // 2), 48)
+            sell(past, range(capacity // 2, capacity), 2)
+
+        # Предстоящий сеанс продается в том же темпе
+        Ticket.objects.filter(screening=self.screening).delete()
+        sell(self.screening, range(capacity // 2), 23)
+        # Прогноз прошлого прогона для уже прошедшего сеанса
+        ScreeningForecast.objects.create(
+            screening=past, current_occupancy=1, forecast_occupancy=1, computed_at=now - timedelta(hours=1)
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(refresh_forecasts(), 1)
+        self.assertLessEqual(len(queries.captured_queries), 5)
+        self.assertEqual(list(ScreeningForecast.objects.values_list('screening_id', flat=True)), [self.screening.pk])
+        forecast = ScreeningForecast.objects.get(screening=self.screening)
+        self.assertAlmostEqual(forecast.current_occupancy, 0.5)
+        self.assertEqual(forecast.forecast_occupancy, 1.0)
+        self.assertEqual(forecast.samples, 3)
+        self.assertTrue(now < forecast.sell_out_at < start)
+
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse('admin:cinema_screeningforecast_changelist')).status_code, 200)
+
+
+class PlannerTests(CinemaTestCase):
+    """Автоматическое расписание недели"""
+
+    def test_week_plan_respects_hours_and_existing_screenings(self):
+        evening = Hall.objects.create(
+            cinema=self.cinema, name='Вечерний', total_rows=5, total_seats_per_row=10,
+            opens_at=time(17, 0), closes_at=time(1, 0)
+        )
+        short = create_movie(1)
+        today = timezone.localdate()
+        week_start = today + timedelta(days=7 * 8 - today.weekday())
+        # Уже запланированный сеанс недели занимает зал: план обходит его
+        busy = datetime.combine(week_start + timedelta(days=2), time(19, 0))
+        create_screening(self.movie, self.hall, timezone.make_aware(busy))
+
+        with CaptureQueriesContext(connection) as queries:
+            plan = plan_week({self.movie: 12, short: 30}, [self.hall, evening], week_start)
+        self.assertLessEqual(len(queries.captured_queries), 3)
+        self.assertEqual(sum(1 for item in plan if item['movie'] == self.movie), 12)
+        self.assertEqual(sum(1 for item in plan if item['movie'] == short), 30)
+
+        for item in plan:
+            start, end = timezone.localtime(item['start_time']), timezone.localtime(item['end_time'])
+            self.assertGreaterEqual(start.date(), week_start)
+            if item['hall'] == evening:
+                self.assertGreaterEqual(start.time(), time(17, 0))
+                self.assertLessEqual(end, timezone.make_aware(datetime.combine(start.date(), time(17))) + timedelta(hours=8))
+            else:
+                self.assertGreaterEqual(start.time(), time(10, 0))
+        candidates = [
+            Screening(hall=item['hall'], start_time=item['start_time'], end_time=item['end_time']) for item in plan
+        ]
+        self.assertEqual(find_hall_conflicts(candidates), {})
+
+        screenings, report = save_plan(plan, '350.00')
+        self.assertEqual(report, [])
+        self.assertEqual(len(screenings), 42)
+        self.assertEqual(SeatMap.objects.filter(screening__in=screenings).count(), 42)
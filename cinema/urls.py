@@ -16,6 +16,14 @@ router.register(r'user', views.UserViewSet)
 
 # URL паттерны
 urlpatterns = [
+    # Поток изменений карты мест (SSE, работает под ASGI)
+    path('screenings/<int:pk>/events/', views.screening_events, name='screening-events'),
+    # Подсказки поиска из индекса в памяти
+    path('suggest/', views.suggest, name='suggest'),
+    # Афиша города на день из материализованных документов
+    path('afisha/', views.afisha, name='afisha'),
+    # Отчет по кассе из дневной сводки (администратор)
+    path('reports/box-office/', views.box_office, name='box-office'),
     path('', include(router.urls)),
     # Дополнительные URL для аутентификации
     path('auth/', include('rest_framework.urls')),
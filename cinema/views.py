@@ -1,42 +1,72 @@
 from django.shortcuts import render
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.db.models import Q, Avg, Count, F, Sum
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import timedelta
 
 from rest_framework import viewsets, permissions, status, filters
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
 import django_filters
 
 from .models import (
-    Cinema, Hall, Genre, Person, Movie, Screening,
-    Ticket, Review, UserFavorite
+    Cinema, Hall, HallHeatmap, Genre, Person, Movie, MovieGenre, MoviePerson, MovieStats,
+    Screening, Ticket, Review, UserFavorite
 )
 from .permissions import IsAdminOrReadOnly, IsAdminUser
 from .serializers import (
     CinemaSerializer, HallSerializer, GenreSerializer,
     PersonSerializer, MovieSerializer, ScreeningSerializer,
     TicketSerializer, ReviewSerializer, UserFavoriteSerializer,
-    UserSerializer
+    UserSerializer, SeatSelectionSerializer, BulkPurchaseSerializer
 )
 from .filters import MovieFilter, ScreeningFilter, TicketFilter, ReviewFilter
+from .seatmap import get_seatmap, seatmap_payload, load_bitmap, held_bitmap, best_contiguous_block
+from .events import seat_event_stream
+from .heatmaps import empty_heatmap, heatmap_payload
+from .afisha import schedule_document
+from .boxoffice import GROUPS as BOX_OFFICE_GROUPS, box_office_report
+from .caching import CachedResponseMixin, ConditionalGetMixin
+from .pricing import prices_payload
+from .pagination import ReviewCursorPagination, ScreeningCursorPagination, TicketCursorPagination
+from .search import FullTextSearchFilter
+from .stats import refresh_stale_stats
+from .suggest import index as suggest_index
+from .schedule_import import CSVParser, create_screenings, max_rows, read_csv, validate_schedule
+from .booking import SeatUnavailable, place_holds, release_holds, confirm_holds, purchase_seats
 
 
 # ============ READ OPERATIONS (GET) ============
 
-class MovieViewSet(viewsets.ModelViewSet):
+class MovieViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     CRUD операции для фильмов
     """
     queryset = Movie.objects.filter(is_active=True).order_by('-release_date')
     serializer_class = MovieSerializer
+    # premium=true фильтрует по сеансам, поэтому версия сеансов тоже входит в ключ
+    cache_models = [Movie, MovieStats, MovieGenre, Genre, MoviePerson, Screening]
     permission_classes = [IsAdminOrReadOnly]
-    filter_backends = [django_filters.rest_framework.DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [django_filters.rest_framework.DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_class = MovieFilter
     search_fields = ['title', 'original_title', 'description', 'country']
-    ordering_fields = ['title', 'release_date', 'duration_minutes', 'imdb_rating', 'kinopoisk_rating']
+    search_movie_field = 'pk'
+    ordering_fields = [
+        'title', 'release_date', 'duration_minutes', 'imdb_rating', 'kinopoisk_rating',
+        'stats__avg_rating', 'stats__reviews_count', 'stats__favorites_count',
+        'stats__min_price', 'stats__next_start_time'
+    ]
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # До ключа кэша и фильтров: цены и ближайший сеанс не должны включать начавшиеся сеансы
+        refresh_stale_stats()
 
     def get_queryset(self):
         """
@@ -46,7 +76,7 @@ class MovieViewSet(viewsets.ModelViewSet):
         4. DjangoFilterBackend - через filterset_class
         5. SearchFilter - поиск по полям
         """
-        queryset = Movie.objects.filter(is_active=True)
+        queryset = Movie.objects.filter(is_active=True).select_related('stats').prefetch_related('genres', 'persons')
 
         # 1. Фильтр по текущему аутентифицированному пользователю (для избранных)
         if self.request.user.is_authenticated:
@@ -96,7 +126,7 @@ class MovieViewSet(viewsets.ModelViewSet):
     def screenings(self, request, pk=None):
         """Получить все сеансы для фильма"""
         movie = self.get_object()
-        screenings = Screening.objects.filter(movie=movie, is_active=True)
+        screenings = Screening.objects.filter(movie=movie, is_active=True).select_related('movie', 'hall')
         serializer = ScreeningSerializer(screenings, many=True)
         return Response(serializer.data)
 
@@ -104,7 +134,7 @@ class MovieViewSet(viewsets.ModelViewSet):
     def reviews(self, request, pk=None):
         """Получить все отзывы для фильма"""
         movie = self.get_object()
-        reviews = Review.objects.filter(movie=movie, is_approved=True)
+        reviews = Review.objects.filter(movie=movie, is_approved=True).select_related('user', 'movie')
         serializer = ReviewSerializer(reviews, many=True)
         return Response(serializer.data)
 
@@ -129,40 +159,45 @@ class MovieViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class CinemaViewSet(viewsets.ModelViewSet):
+class CinemaViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     CRUD операции для кинотеатров
     """
     queryset = Cinema.objects.filter(is_active=True)
     serializer_class = CinemaSerializer
+    cache_models = [Cinema]
     permission_classes = [IsAdminOrReadOnly]
 
     @action(detail=True, methods=['get'])
     def halls(self, request, pk=None):
         """Получить все залы кинотеатра"""
         cinema = self.get_object()
-        halls = Hall.objects.filter(cinema=cinema)
+        halls = Hall.objects.filter(cinema=cinema).select_related('cinema')
         serializer = HallSerializer(halls, many=True)
         return Response(serializer.data)
 
 
-class ScreeningViewSet(viewsets.ModelViewSet):
+class ScreeningViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     CRUD операции для сеансов
     """
     queryset = Screening.objects.filter(is_active=True).order_by('start_time')
     serializer_class = ScreeningSerializer
     permission_classes = [IsAdminOrReadOnly]
-    filter_backends = [django_filters.rest_framework.DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = ScreeningCursorPagination
+    conditional_models = [Movie, Hall]
+    filter_backends = [django_filters.rest_framework.DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_class = ScreeningFilter
     search_fields = ['movie__title', 'hall__name', 'hall__cinema__name']
-    ordering_fields = ['start_time', 'end_time', 'base_price', 'movie__title']
+    search_movie_field = 'movie'
+    search_like_fields = ['hall__name', 'hall__cinema__name']
+    ordering_fields = ['start_time', 'end_time', 'base_price', 'movie__title', 'seats_sold', 'seats_free']
 
     def get_queryset(self):
         """
         Реализация 5 видов фильтрации для сеансов
         """
-        queryset = Screening.objects.filter(is_active=True)
+        queryset = Screening.objects.filter(is_active=True).select_related('movie', 'hall')
 
         # 1. Фильтр по текущему аутентифицированному пользователю
         if self.request.user.is_authenticated:
@@ -201,8 +236,8 @@ class ScreeningViewSet(viewsets.ModelViewSet):
         if self.request.query_params.get('available') == 'true':
             queryset = queryset.filter(
                 Q(start_time__gte=timezone.now()) &
-                Q(ticket__isnull=True)  # Упрощенная проверка
-            ).distinct()
+                Q(seats_free__gt=0)
+            )
 
         # Вечерние сеансы (после 18:00)
         if self.request.query_params.get('evening') == 'true':
@@ -216,10 +251,128 @@ class ScreeningViewSet(viewsets.ModelViewSet):
     def tickets(self, request, pk=None):
         """Получить все билеты на сеанс"""
         screening = self.get_object()
-        tickets = Ticket.objects.filter(screening=screening)
+        tickets = Ticket.objects.filter(screening=screening).select_related('screening__movie', 'user')
         serializer = TicketSerializer(tickets, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def seatmap(self, request, pk=None):
+        """Компактная карта занятости мест (битовая маска в base64) и цены по рядам"""
+        screening = self.get_object()
+        return Response({**seatmap_payload(get_seatmap(screening)), 'prices': prices_payload(screening)})
+
+    @action(detail=True, methods=['get'])
+    def best_seats(self, request, pk=None):
+        """Подобрать лучший непрерывный блок свободных мест для группы (?count=N)"""
+        try:
+            count = int(request.query_params.get('count', 1))
+        except ValueError:
+            return Response({'error': 'count должен быть целым числом'}, status=400)
+        if count < 1:
+            return Response({'error': 'count должен быть положительным'}, status=400)
+
+        screening = self.get_object()
+        seatmap = get_seatmap(screening)
+        unavailable = load_bitmap(seatmap).union(held_bitmap(seatmap))
+        seats = best_contiguous_block(unavailable, count)
+        return Response(self._seats_response(seats, count=count))
+
+    def _seat_selection(self, request, screening):
+        serializer = SeatSelectionSerializer(
+            data=request.data,
+            context={'request': request, 'screening': screening}
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    @staticmethod
+    def _seats_response(seats, **extra):
+        return {
+            'seats': [{'seat_row': row, 'seat_number': seat} for row, seat in seats],
+            **extra
+        }
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def hold(self, request, pk=None):
+        """Временно удержать места за текущим пользователем"""
+        screening = self.get_object()
+        data = self._seat_selection(request, screening)
+        if not data.get('seats'):
+            return Response({'error': 'Не указаны места'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            expires_at = place_holds(screening, request.user, data['seats'])
+        except SeatUnavailable as exc:
+            return Response(
+                self._seats_response(exc.seats, error='Места уже заняты'),
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response(
+            self._seats_response(sorted(data['seats']), expires_at=expires_at),
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def release(self, request, pk=None):
+        """Снять удержание мест (без списка мест - всех мест пользователя)"""
+        screening = self.get_object()
+        data = self._seat_selection(request, screening)
+        released = release_holds(screening, request.user, data.get('seats'))
+        return Response({'released': released})
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def confirm(self, request, pk=None):
+        """Оформить удерживаемые места как оплаченные билеты"""
+        screening = self.get_object()
+        data = self._seat_selection(request, screening)
+
+        try:
+            tickets = confirm_holds(screening, request.user, data.get('seats'), data['ticket_type'])
+        except SeatUnavailable as exc:
+            return Response(
+                self._seats_response(exc.seats, error='Удержание мест истекло или места уже заняты'),
+                status=status.HTTP_409_CONFLICT
+            )
+
+        serializer = TicketSerializer(tickets, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(
+        detail=False, methods=['post'], permission_classes=[IsAdminUser],
+        parser_classes=[JSONParser, CSVParser, MultiPartParser]
+    )
+    def bulk_import(self, request):
+        """
+        Импорт расписания: JSON-список сеансов (или {"screenings": [...]}), CSV
+        в теле text/csv или файлом file. По умолчанию все или ничего:
+        ?partial=true сохраняет корректные строки, ?dry_run=true только проверяет.
+        """
+        rows = request.data
+        if 'file' in request.FILES:
+            rows = read_csv(request.FILES['file'].read())
+        elif isinstance(rows, dict):
+            rows = rows.get('screenings')
+        if not isinstance(rows, list) or not rows:
+            return Response({'error': 'Ожидается непустой список сеансов'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > max_rows():
+            return Response(
+                {'error': f'Не более {max_rows()} сеансов за один импорт'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        valid, errors = validate_schedule(rows)
+        if errors and request.query_params.get('partial') != 'true':
+            return Response({'created': 0, 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        if request.query_params.get('dry_run') == 'true':
+            return Response({'valid': len(valid), 'errors': errors})
+
+        screenings = create_screenings([screening for _, screening in valid], user=request.user)
+        return Response(
+            {'created': len(screenings), 'ids': [screening.pk for screening in screenings], 'errors': errors},
+            status=status.HTTP_201_CREATED
+        )
+
     @action(detail=False, methods=['get'])
     def upcoming(self, request):
         """Получить предстоящие сеансы"""
@@ -242,15 +395,112 @@ class ScreeningViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+async def screening_events(request, pk):
+    """
+    Поток изменений карты мест сеанса (Server-Sent Events).
+    Асинхронное представление: под ASGI соединение не занимает рабочий поток.
+    Под WSGI Django буферизует асинхронный поток целиком, события не дошли бы
+    до клиента, а рабочий процесс был бы занят, поэтому запрос отклоняется.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'Поток событий доступен только при запуске под ASGI (uvicorn config.asgi:application)'},
+            status=501
+        )
+    if not await Screening.objects.filter(pk=pk, is_active=True).aexists():
+        raise Http404
+
+    response = StreamingHttpResponse(seat_event_stream(pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def suggest(request):
+    """
+    Подсказки при наборе: фильмы (название и оригинальное название) и персоны.
+    Отвечает из индекса в памяти процесса, без запросов к базе.
+    """
+    try:
+        limit = min(int(request.query_params.get('limit', 10)), 50)
+    except ValueError:
+        return Response({'error': 'limit должен быть числом'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(suggest_index.suggest(request.query_params.get('q', ''), limit=max(limit, 1)))
+
+
+def query_date(request, param, default):
+    """Дата из параметра запроса в формате ГГГГ-ММ-ДД (без параметра - default), иначе 400"""
+    value = request.query_params.get(param)
+    if not value:
+        return default
+    try:
+        date = parse_date(value) if len(value) == 10 else None
+    except ValueError:
+        # Формат верный, но такого дня нет (2024-13-45, 2024-02-30)
+        date = None
+    if date is None:
+        raise ValidationError({'error': f'{param} должен быть в формате ГГГГ-ММ-ДД'})
+    return date
+
+
+@api_view(['GET'])
+def afisha(request):
+    """
+    Афиша города на день: фильмы -> кинотеатры -> залы -> сеансы с ценами и
+    свободными местами. Готовый документ читается из таблицы одним запросом,
+    счетчики мест - вторым.
+    """
+    city = request.query_params.get('city')
+    if not city:
+        return Response({'error': 'Не указан город (city)'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(schedule_document(city, query_date(request, 'date', timezone.localdate())))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def box_office(request):
+    """
+    Отчет по кассе из дневной сводки (команда rollup_box_office): выручка, билеты
+    и средняя цена за период date_from..date_to в разрезах group_by
+    (day, movie, cinema, hall через запятую).
+    """
+    today = timezone.localdate()
+    dates = {
+        'date_from': query_date(request, 'date_from', today - timedelta(days=29)),
+        'date_to': query_date(request, 'date_to', today),
+    }
+
+    group_by = [group for group in request.query_params.get('group_by', 'day').split(',') if group]
+    unknown = [group for group in group_by if group not in BOX_OFFICE_GROUPS]
+    if unknown or not group_by:
+        return Response(
+            {'error': f'group_by: допустимы {", ".join(BOX_OFFICE_GROUPS)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    return Response({
+        'date_from': dates['date_from'],
+        'date_to': dates['date_to'],
+        'group_by': group_by,
+        'results': box_office_report(dates['date_from'], dates['date_to'], group_by),
+    })
+
+
 # ============ CREATE/UPDATE/DELETE OPERATIONS ============
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     CRUD операции для отзывов
     """
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ReviewCursorPagination
+    conditional_models = [Movie]
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = ReviewFilter
     search_fields = ['title', 'text', 'movie__title', 'user__username']
@@ -260,7 +510,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
         """
         Реализация 5 видов фильтрации для отзывов
         """
-        queryset = Review.objects.all()
+        queryset = Review.objects.select_related('user', 'movie')
 
         # 1. Фильтр по текущему аутентифицированному пользователю
         if not self.request.user.is_staff:
@@ -354,13 +604,15 @@ class ReviewViewSet(viewsets.ModelViewSet):
         return Response({'message': 'Лайк добавлен', 'likes_count': review.likes_count})
 
 
-class TicketViewSet(viewsets.ModelViewSet):
+class TicketViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     CRUD операции для билетов
     """
     queryset = Ticket.objects.all()
     serializer_class = TicketSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TicketCursorPagination
+    conditional_models = [Screening, Movie]
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = TicketFilter
     search_fields = ['screening__movie__title', 'screening__hall__cinema__name', 'user__username']
@@ -371,7 +623,7 @@ class TicketViewSet(viewsets.ModelViewSet):
         Реализация 5 видов фильтрации для билетов
         """
         # 1. Фильтр по текущему аутентифицированному пользователю - автоматически
-        queryset = Ticket.objects.filter(user=self.request.user)
+        queryset = Ticket.objects.filter(user=self.request.user).select_related('screening__movie', 'user')
 
         # 2. Фильтр по именованным аргументам в URL
         screening_id = self.request.query_params.get('screening_id')
@@ -416,6 +668,27 @@ class TicketViewSet(viewsets.ModelViewSet):
         """Автоматически устанавливаем пользователя при покупке билета"""
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['post'])
+    def bulk_purchase(self, request):
+        """Купить несколько мест на сеанс одной транзакцией (все или ничего)"""
+        serializer = BulkPurchaseSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        try:
+            tickets = purchase_seats(
+                data['screening'], request.user, data['seats'],
+                ticket_type=data['ticket_type'], status=data['status']
+            )
+        except SeatUnavailable as exc:
+            return Response({
+                'error': 'Места уже заняты',
+                'seats': [{'seat_row': row, 'seat_number': seat} for row, seat in exc.seats]
+            }, status=status.HTTP_409_CONFLICT)
+
+        serializer = self.get_serializer(tickets, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(detail=False, methods=['get'])
     def my_tickets(self, request):
         """Получить все билеты текущего пользователя """
@@ -445,7 +718,7 @@ class UserFavoriteViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Пользователь видит только свои избранные"""
-        return UserFavorite.objects.filter(user=self.request.user)
+        return UserFavorite.objects.filter(user=self.request.user).select_related('movie', 'user')
 
     def perform_create(self, serializer):
         """Автоматически устанавливаем пользователя"""
@@ -454,22 +727,32 @@ class UserFavoriteViewSet(viewsets.ModelViewSet):
 
 # ============ SIMPLE READ-ONLY VIEWSETS ============
 
-class GenreViewSet(viewsets.ReadOnlyModelViewSet):
+class GenreViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     """Только чтение жанров"""
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
+    cache_models = [Genre]
 
 
-class PersonViewSet(viewsets.ReadOnlyModelViewSet):
+class PersonViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     """Только чтение персон"""
     queryset = Person.objects.all()
     serializer_class = PersonSerializer
+    cache_models = [Person]
 
 
-class HallViewSet(viewsets.ReadOnlyModelViewSet):
+class HallViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     """Только чтение залов"""
-    queryset = Hall.objects.all()
+    queryset = Hall.objects.select_related('cinema')
     serializer_class = HallSerializer
+    cache_models = [Hall, Cinema]
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    def heatmap(self, request, pk=None):
+        """Популярность мест зала по проданным билетам (обновляет команда refresh_heatmaps)"""
+        hall = self.get_object()
+        heatmap = HallHeatmap.objects.filter(hall=hall).first() or empty_heatmap(hall)
+        return Response(heatmap_payload(heatmap))
 
 
 # ============ USER MANAGEMENT ============
@@ -478,7 +761,7 @@ class UserViewSet(viewsets.ModelViewSet):
     """
     CRUD операции для пользователей (регистрация, профиль)
     """
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('profile')
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
 
@@ -70,8 +70,62 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Ожидание блокировки на запись вместо немедленной ошибки "database is locked"
+            'timeout': 20,
+        },
+    }
+}
+
+ASGI_APPLICATION = 'config.asgi.application'
+
+# Время удержания места при покупке (секунды)
+CINEMA_SEAT_HOLD_TTL = 600
+
+# Сколько минут неоплаченная бронь держит место (release_expired_bookings)
+CINEMA_BOOKING_HOLD_MINUTES = 30
+
+# Поток изменений карты мест: интервал пинга и время жизни соединения (секунды)
+CINEMA_SEAT_EVENTS_HEARTBEAT = 15
+CINEMA_SEAT_EVENTS_MAX_AGE = 300
+# Интервал опроса базы (секунды): изменения других процессов и истечение удержаний
+# доходят до клиентов не позже чем через это время, изменения своего процесса - сразу
+CINEMA_SEAT_EVENTS_POLL = 1
+
+# Кэш ответов справочных эндпоинтов (фильмы, кинотеатры, жанры, персоны, залы),
+# версии моделей, блокировки пересборки афиши. Кэш должен быть общим для сервера
+# и management-команд: версии, смененные командой в locmem другого процесса,
+# сервер бы не увидел. Файловый бэкенд общий в пределах одной машины,
+# для нескольких машин - django.core.cache.backends.redis.RedisCache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
+# Время жизни закэшированного ответа (секунды), 0 - кэш отключен
+CINEMA_RESPONSE_CACHE_TIMEOUT = 300
+
+# Перерыв на уборку между сеансами в одном зале (минуты)
+CINEMA_CLEANING_MINUTES = 15
+
+# Максимум фильмов в ранжированной выдаче полнотекстового поиска (?search= в списке фильмов)
+CINEMA_SEARCH_MAX_RESULTS = 200
+
+# Плановая пересборка индекса подсказок в каждом процессе (секунды, в фоновом потоке)
+CINEMA_SUGGEST_REBUILD_SECONDS = 600
+
+# Максимум сеансов в одном импорте расписания
+CINEMA_SCHEDULE_IMPORT_MAX_ROWS = 5000
+
+# Правила цен билетов: переопределяют ключи DEFAULT_RULES из cinema/pricing.py,
+# словари типов билетов и залов дополняют значения по умолчанию
+CINEMA_PRICING = {}
+
+# Прогноз распродажи: глубина истории (дни) и минимум похожих сеансов для кривой
+CINEMA_FORECAST_HISTORY_DAYS = 90
+CINEMA_FORECAST_MIN_SAMPLES = 3
 
 SECRET_KEY = 'django-insecure-change-this-secret-key-for-production'
 DEBUG = True
@@ -7,7 +7,7 @@ echo "Запуск Django сервера для онлайн-кинотеатр
 # Активация виртуального окружения
 source venv/Scripts/activate
 
-# Запуск сервера
-python manage.py runserver
+# Запуск сервера под ASGI (нужен для потока событий /events/)
+uvicorn config.asgi:application --reload --port 8000
 
 echo "Сервер запущен на http://127.0.0.1:8000/"